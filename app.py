@@ -1,74 +1,194 @@
+import base64
 import datetime
 import json
+import math
 import os
 import time
 import uuid
-from pathlib import Path
 import streamlit as st
-import pandasai.pandas as pd
-from PIL import Image
 # import boto3
-from filelock import FileLock
-from pandasai import SmartDataframe
-from pandasai.schemas.df_config import Config
-from pandasai.connectors import PandasConnector
-from utils.pdf_utils import create_k_report_pdf
 # from utils.aws_llm import get_aws_llm
 
-from utils.bamboo_llm import get_bamboo_llm
-from utils.match_descriptions_file import find_matching_description_file
+# seuls les modules légers sont importés ici : pandasai, pandas, pyarrow, openpyxl, duckdb et fpdf
+# le sont au premier chargement d'un dataset ou à la première question, la page d'accueil s'affiche sans eux
+from utils.dataset_registry import get_suggestions, list_datasources
+from utils.query_executor import get_query_executor
+from utils.report_queue import get_job, get_report_queue
+from utils.session_store import append_entry, get_session, iter_entries, list_interrupted_sessions, start_session
 
 
 # Fonction pour nettoyer le champ d'input
 def clear_input():
     st.session_state.input_text = ""
     st.session_state.output_text = ""
+    st.session_state.output_results = []
     st.session_state.show_new_question_button = False
     st.session_state.show_send_button = True
 
 
+# soumet la question (ou chaque ligne d'un lot de questions) au pool d'exécution
 def handle_query(sdf1, prompt1):
-    if prompt1:
-        with st.spinner(text='Waiting for llm answer !!'):
-            try:
-                response = sdf1.chat(prompt1)
-            except Exception as e:
-                st.error(f"Error when calling LLM : {e}")
-                response = "An Error occurred. Please retry"
-
-        if isinstance(response, str) and response.endswith(".png"):
-            default_chart_path = Path("exports/charts/temp_chart.png")
-            final_chart_rep = "./exports/png/"
-            if os.path.exists(default_chart_path):
-                unique_file_path = final_chart_rep + get_unique_filename()
-                default_chart_path.rename(Path(unique_file_path))
-                response = unique_file_path
-
-        st.session_state.output_text = str(response)
-        st.session_state.session_data.append({"question": prompt1, "answer": str(response)})
+    from utils.dataset_loader import job_agent
+    from utils.handle_query import answer_query
+    from utils.response_cache import get_context_key
+
+    questions = [line.strip() for line in prompt1.splitlines() if line.strip()]
+    if questions:
+        executor = get_query_executor(config)
+        context_key = get_context_key(config, st.session_state.dataset_key, st.session_state.description_file_name)
+        for question in questions:
+            # un agent par question : les questions d'un lot s'exécutent en parallèle sans partager leur état
+            job_id = executor.submit(st.session_state.session_id, question, answer_query, config, job_agent(sdf1),
+                                     question, context_key)
+            if job_id is None:
+                st.session_state.query_errors.append(f"Too many pending questions, not sent : {question}")
+                continue
+            st.session_state.pending_jobs.append(job_id)
         st.session_state.show_send_button = False
-        st.session_state.show_new_question_button = True
 
 
-# Generate a unique file name using a timestamp or UUID
-def get_unique_filename(prefix="chart", extension=".png"):
-    timestamp1 = time.strftime("%Y%m%d-%H%M%S")  # Timestamp for uniqueness
-    unique_id = uuid.uuid4().hex[:8]  # Short UUID for uniqueness
-    return f"{prefix}_{timestamp1}_{unique_id}{extension}"
+# question préparée par warm_up.py : affichée dans la saisie et envoyée, la réponse vient du cache
+def ask_suggestion(sdf1, question):
+    st.session_state.input_text = question
+    handle_query(sdf1, question)
+
+
+# questions préparées pour le dataset ouvert ; un espace de travail de plusieurs datasets n'en a pas
+def get_dataset_suggestions():
+    if st.session_state.workspace is not None:
+        if len(st.session_state.workspace) != 1:
+            return []
+        return get_suggestions(config, st.session_state.workspace[0]['dataset_key'])
+    return get_suggestions(config, st.session_state.dataset_key)
+
+
+def cancel_queries():
+    get_query_executor(config).cancel(st.session_state.session_id)
+
+
+# le script n'est plus bloqué par le LLM : ce fragment relève les réponses chaque seconde
+@st.fragment(run_every=1)
+def poll_queries():
+    executor = get_query_executor(config)
+    for job, status, result in executor.poll(st.session_state.session_id):
+        cache_hit = None
+        if status == "done":
+            response, cache_hit = result
+            if cache_hit:
+                st.session_state.cache_hits += 1
+            else:
+                st.session_state.cache_misses += 1
+        elif status == "cancelled":
+            response = "Query cancelled"
+        else:
+            st.session_state.cache_misses += 1
+            if status == "error":
+                st.session_state.query_errors.append(f"Error when calling LLM : {result}")
+            else:
+                st.session_state.query_errors.append(f"LLM timeout for : {job.prompt}")
+            response = "An Error occurred. Please retry"
+        seconds = (job.finished or time.time()) - job.submitted
+        st.session_state.job_results[job.job_id] = (job.prompt, response, seconds, cache_hit)
+
+    if executor.pending(st.session_state.session_id) > 0:
+        st.info(f"Waiting for llm answer !! ({executor.pending(st.session_state.session_id)} pending)")
+        st.button("Cancel", key="cancel", help="Cancel the pending queries", on_click=cancel_queries)
+        return
+
+    import pandas as pd
+    from utils.result_store import put_result
+
+    # toutes les réponses du lot sont arrivées : on les enregistre dans l'ordre de soumission
+    answers = []
+    st.session_state.output_results = []
+    for job_id in st.session_state.pending_jobs:
+        if job_id in st.session_state.job_results:
+            question, response, seconds, cache_hit = st.session_state.job_results.pop(job_id)
+            if isinstance(response, (pd.DataFrame, pd.Series)):
+                # réponse tabulaire : écrite une fois dans le magasin de résultats, seule sa référence est gardée
+                result = put_result(config, response)
+                if result is not None:
+                    response = result
+                    st.session_state.output_results.append((question, result))
+            entry = {"question": question, "answer": response}
+            # l'historique est écrit sur disque au fil de l'eau, rien n'est conservé en mémoire
+            append_entry(config, st.session_state.session_id, entry, seconds, cache_hit)
+            st.session_state.nb_entries += 1
+            answers.append((question, str(response)))
+    st.session_state.pending_jobs = []
+    if len(answers) == 1:
+        st.session_state.output_text = answers[0][1]
+    else:
+        st.session_state.output_text = "\n\n".join(f"{question}\n{response}" for question, response in answers)
+    st.session_state.show_new_question_button = True
+    st.rerun()
+
+
+# aperçu paginé d'une réponse tabulaire, relue page par page dans le magasin de résultats, et export csv
+def show_result(result, key):
+    from utils.result_store import export_result_csv, read_result_page
+
+    page_rows = config['result_page_rows']
+    nb_pages = max(math.ceil(result.stored_rows / page_rows), 1)
+    page = 1
+    if nb_pages > 1:
+        page = st.number_input(f"Page (1 - {nb_pages})", min_value=1, max_value=nb_pages, value=1, key=f"page_{key}")
+    table = read_result_page(config, result, page - 1, page_rows)
+    if table is None:
+        st.warning(f"{result} : no longer available")
+        return
+    st.dataframe(table, use_container_width=True)
+    st.caption(str(result))
+    csv_path = st.session_state.result_exports.get(result.result_id)
+    if csv_path is None or not os.path.exists(csv_path):
+        if st.button("Export CSV", key=f"csv_{key}"):
+            st.session_state.result_exports[result.result_id] = export_result_csv(
+                config, result, os.path.splitext(st.session_state.selected_dataset_name)[0])
+            st.rerun()
+    else:
+        with open(csv_path, 'rb') as f_csv:
+            st.download_button("Download CSV", data=f_csv, file_name=os.path.basename(csv_path), mime="text/csv",
+                               key=f"download_csv_{key}")
+
+
+# une session déjà archivée à l'identique renvoie le job existant
+def submit_report(session_id):
+    job_id = get_report_queue(config).submit(session_id)
+    if job_id not in st.session_state.report_jobs:
+        st.session_state.report_jobs.append(job_id)
+
+
+# jobs de rapport de la session ; les identifiants inconnus ou purgés de la file sont oubliés
+def get_report_jobs():
+    jobs = [job for job in (get_job(config, job_id) for job_id in st.session_state.report_jobs) if job is not None]
+    st.session_state.report_jobs = [job['job_id'] for job in jobs]
+    return jobs
+
+
+# avancement des rapports pdf en cours ; la page est réaffichée quand ils sont tous terminés
+@st.fragment(run_every=1)
+def poll_reports():
+    jobs = get_report_jobs()
+    running = [job for job in jobs if job['status'] in ("queued", "running")]
+    if not running:
+        st.rerun()
+    for job in running:
+        progress = job['done'] / job['total'] if job['total'] else 0.0
+        st.progress(progress, text=f"PDF report {job['status']} : {job['done']}/{job['total']} answers")
 
 
 # Configuration de la page
 st.set_page_config(page_title="SNTP Capitalisation", page_icon="\U0001F4B0", layout="centered")
 
-# Initialiser session_state pour session_data et les indicateurs de questions ajoutées
+# Initialiser session_state pour l'historique et les indicateurs de questions ajoutées
 if 'study_date' not in st.session_state:
     st.session_state.study_date = None
 
 if 'selected_dataset_name' not in st.session_state:
-    st.session_state.selected_dataset = None
+    st.session_state.selected_dataset_name = None
 
 if 'description_file_name' not in st.session_state:
-    st.session_state.selected_dataset = None
+    st.session_state.description_file_name = None
 
 if 'show_new_question_button' not in st.session_state:
     st.session_state.show_new_question_button = False
@@ -82,6 +202,14 @@ if 'input_text' not in st.session_state:
 if 'output_text' not in st.session_state:
     st.session_state.output_text = ""
 
+# réponses tabulaires de la dernière question : références au magasin de résultats
+if 'output_results' not in st.session_state:
+    st.session_state.output_results = []
+
+# exports csv déjà écrits : {result_id: chemin}
+if 'result_exports' not in st.session_state:
+    st.session_state.result_exports = {}
+
 if 'sdf' not in st.session_state:
     st.session_state.sdf = None
 
@@ -94,15 +222,62 @@ if 'nb_c' not in st.session_state:
 if 'column_names' not in st.session_state:
     st.session_state.column_names = None
 
-if 'session_data' not in st.session_state:
-    st.session_state.session_data = []
+if 'data_sample' not in st.session_state:
+    st.session_state.data_sample = None
+
+if 'nb_entries' not in st.session_state:
+    st.session_state.nb_entries = 0
+
+if 'dataset_key' not in st.session_state:
+    st.session_state.dataset_key = None
+
+if 'upload_key' not in st.session_state:
+    st.session_state.upload_key = (None, None)
+
+if 'cache_hits' not in st.session_state:
+    st.session_state.cache_hits = 0
+
+if 'cache_misses' not in st.session_state:
+    st.session_state.cache_misses = 0
+
+if 'session_id' not in st.session_state:
+    # l'identifiant est conservé dans l'URL : un rechargement de la page reprend la session
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
+
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = []
+
+if 'job_results' not in st.session_state:
+    st.session_state.job_results = {}
+
+if 'query_errors' not in st.session_state:
+    st.session_state.query_errors = []
+
+if 'mem_before' not in st.session_state:
+    st.session_state.mem_before = None
+
+if 'mem_after' not in st.session_state:
+    st.session_state.mem_after = None
+
+if 'workspace' not in st.session_state:
+    st.session_state.workspace = None
+
+if 'previous_sessions' not in st.session_state:
+    st.session_state.previous_sessions = []
+
+if 'report_jobs' not in st.session_state:
+    st.session_state.report_jobs = []
 
 
 # read configuration
 @st.cache_resource
 def read_conf():
     with open('general_config.json', 'r') as f_conf:
-        return json.load(f_conf)
+        conf = json.load(f_conf)
+    # serve.py lance les réplicas en mode multi sans modifier le fichier de configuration
+    conf['serving_mode'] = os.environ.get("APP_SERVING_MODE", conf['serving_mode'])
+    return conf
 
 
 @st.cache_resource
@@ -111,20 +286,25 @@ def get_css_style():
         return f_css.read()
 
 
+# logo inséré en HTML : st.image chargerait PIL à chaque affichage
 @st.cache_resource
 def get_logo():
-    logo = Image.open("assets/logo/sntpk-ia-logo.jpeg")
-    return logo
+    with open("assets/logo/sntpk-ia-logo.jpeg", "rb") as f_logo:
+        return base64.b64encode(f_logo.read()).decode("ascii")
+
+
+# backend (bamboo / bedrock) et secours choisis dans general_config.json ; la passerelle est créée
+# au premier chargement d'un dataset, les clients bamboo / bedrock au premier appel du LLM
+def get_llm():
+    from utils.llm_gateway import get_llm_gateway
+
+    return get_llm_gateway(config)
 
 
 config = read_conf()
-# llm = get_aws_llm(config)
-llm = get_bamboo_llm()
-if llm is None:
-    st.warning("No AWS LLM detected")
 
 st.markdown(f"<style>{get_css_style()}</style>", unsafe_allow_html=True)
-st.image(get_logo(), width=100, caption=None)
+st.markdown(f'<img src="data:image/jpeg;base64,{get_logo()}" width="100">', unsafe_allow_html=True)
 st.markdown("""
     <div class="title">
         Usage Report <br>Streamlit for PandasAI <br> on AWS Bedrock Claude 3.0 <br>  or Bamboo_LLM
@@ -134,84 +314,279 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
+# espace de travail (plusieurs datasources, ou fichier téléversé en mode SQL) ouvert dans la session
+def open_session_workspace(dataset_paths, dataset_name, new_session=False):
+    from utils.workspace import open_workspace
+
+    agent, datasets, workspace_key = open_workspace(config, get_llm(), dataset_paths)
+    st.session_state.sdf = agent
+    st.session_state.workspace = datasets
+    st.session_state.dataset_key = workspace_key
+    st.session_state.description_file_name = datasets[0]['desc_file'] if len(datasets) == 1 else None
+    st.session_state.selected_dataset_name = dataset_name
+    if new_session:
+        nb_ln = sum(d['rows'] for d in datasets)
+        if len(datasets) == 1:
+            col_list = datasets[0]['columns']
+        else:
+            col_list = [f"{d['name']}:{column}" for d in datasets for column in d['columns']]
+        start_session(config, st.session_state.session_id, dataset_name, workspace_key, nb_ln, len(col_list), col_list,
+                      sources=dataset_paths)
+        st.session_state.nb_entries = 0
+
+
+# dimensions, colonnes et échantillon du dataset chargé : calculés une fois, pas à chaque réaffichage
+def store_dataset_info(data, dataset_key):
+    from utils.dataset_sample import frame_batches, get_sample
+
+    st.session_state.nb_ln, st.session_state.nb_c = data.shape
+    st.session_state.column_names = [str(column) for column in data.columns]
+    st.session_state.data_sample = get_sample(config, dataset_key, lambda: frame_batches(data, config['sample_batch_rows']))
+
+
+# empreinte du contenu du fichier téléversé, calculée une fois par fichier et non à chaque réexécution du script
+def get_upload_key(uploaded_file):
+    from utils.dataset_cache import get_dataset_key
+
+    file_id, key = st.session_state.upload_key
+    if file_id != uploaded_file.file_id:
+        key = get_dataset_key(uploaded_file.getvalue())
+        st.session_state.upload_key = (uploaded_file.file_id, key)
+    return key
+
+
+# liste des feuilles d'un classeur, lue une fois par empreinte de contenu ; seule l'empreinte est hachée
+# par streamlit (paramètre préfixé par _)
+@st.cache_data(max_entries=32)
+def get_workbook_sheets(workbook_key, _uploaded_file):
+    from utils.excel_ingestion import list_sheets
+
+    return list_sheets(_uploaded_file.getvalue(), _uploaded_file.name)
+
+
+# feuilles à charger d'un classeur Excel : (feuilles, prêt) ; None pour la première feuille seule
+def select_sheets(uploaded_file, workbook_key):
+    sheets = get_workbook_sheets(workbook_key, uploaded_file)
+    if len(sheets) == 1:
+        return None, True
+    labels = {sheet['name']: f"{sheet['name']} ({sheet['rows']} rows)" if sheet['rows'] else sheet['name'] for sheet in sheets}
+    selected = st.multiselect("Sheets to load", list(labels), default=[sheets[0]['name']], format_func=labels.get)
+    if not st.button("Load sheets", disabled=not selected):
+        return None, False
+    return (None if selected == [sheets[0]['name']] else selected), True
+
+
+# reprise d'une session enregistrée : le dataset est rouvert, l'historique reste sur disque
+def resume_session(session):
+    from utils.dataset_cache import load_cached_dataset
+    from utils.dataset_loader import build_smart_dataframe
+    from utils.ingestion import get_memory_usage
+    from utils.workspace import get_shared_frames, session_view
+
+    if session['sources']:
+        if not all(os.path.exists(path) for path in session['sources']):
+            return False
+        open_session_workspace(session['sources'], session['dataset'])
+    else:
+        # fichier téléversé : relu dans le cache des datasets s'il n'a pas été évincé
+        data = load_cached_dataset(config, session['dataset_key'])
+        if data is None:
+            return False
+        # référence forte au frame partagé : il reste chargé (et compté) tant que la session l'utilise
+        st.session_state.shared_frame = get_shared_frames(config).get(session['dataset_key'], lambda: data)
+        data = session_view(st.session_state.shared_frame)
+        st.session_state.mem_after = get_memory_usage(data)
+        st.session_state.dataset_key = session['dataset_key']
+        st.session_state.data = data
+        st.session_state.selected_dataset_name = session['dataset']
+        sdf, st.session_state.description_file_name = build_smart_dataframe(config, get_llm(), data, session['dataset'], session['dataset_key'])
+        st.session_state.sdf = sdf
+        store_dataset_info(data, session['dataset_key'])
+    st.session_state.nb_entries = session['entries']
+    st.session_state.study_date = datetime.datetime.fromtimestamp(session['started']).strftime("%m-%d-%Y  %H:%M:%S")
+    return True
+
+
+# après un rechargement de la page ou un redémarrage du serveur, la session de l'URL est reprise
+if st.session_state.sdf is None and 'resume_checked' not in st.session_state:
+    st.session_state.resume_checked = True
+    stored_session = get_session(config, st.session_state.session_id)
+    if stored_session is not None and not resume_session(stored_session):
+        # dataset plus disponible : nouvelle session, la précédente reste archivable
+        st.warning(f"The dataset of the previous session ({stored_session['dataset']}) is no longer available")
+        st.session_state.previous_sessions = [stored_session]
+        st.session_state.session_id = uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
+
 # on charge le dataset
 if st.session_state.sdf is None:
     st.session_state.study_date = timestamp = datetime.datetime.now().strftime("%m-%d-%Y  %H:%M:%S")
     uploaded_file = st.file_uploader("Choose a file (CSV, XLS, XLSX)", type=["csv", "xls", "xlsx"])
 
+    # sessions interrompues (arrêt du serveur, onglet fermé) dont le rapport peut être récupéré
+    interrupted = {session['session_id']: session for session in
+                   st.session_state.previous_sessions + list_interrupted_sessions(config, st.session_state.session_id)}
+    for session in interrupted.values():
+        if st.button(f"Archive interrupted session on {session['dataset']} ({session['entries']} answers)", key=session['session_id']):
+            submit_report(session['session_id'])
+            st.session_state.previous_sessions = []
+
+    # classeur Excel de plusieurs feuilles : les feuilles sont choisies avant le chargement (pas en mode SQL)
+    sheets, sheets_ready, workbook_key = None, True, None
     if uploaded_file is not None:
+        # le cache est indexé sur le contenu : un même fichier rechargé n'est plus re-parsé
+        workbook_key = get_upload_key(uploaded_file)
+    if uploaded_file is not None and config['query_backend'] == "pandas" and uploaded_file.name.lower().endswith((".xls", ".xlsx")):
+        sheets, sheets_ready = select_sheets(uploaded_file, workbook_key)
+
+    if uploaded_file is not None and sheets_ready:
+        from utils.dataset_loader import build_smart_dataframe, load_dataset
+        from utils.excel_ingestion import get_sheets_key
+        from utils.ingestion import get_memory_usage
+        from utils.sql_backend import save_upload
+        from utils.workspace import get_shared_frames, session_view
+
         st.session_state.selected_dataset_name = uploaded_file.name
-        data = None
-        if uploaded_file.name.split('.')[-1] == 'csv':
-            data = pd.read_csv(uploaded_file)
-        elif uploaded_file.name.split('.')[-1] == 'xlsx':
-            data = pd.read_excel(uploaded_file)
-        elif uploaded_file.name.split('.')[-1] == 'xls':
-            data = pd.read_excel(uploaded_file)
-        else:
+        dataset_key = get_sheets_key(workbook_key, sheets)
+        mem_info = {}
+
+        def load_uploaded_file():
+            # lecture par blocs avec typage compact, dans la limite du budget mémoire
+            data, mem_info['before'], mem_info['after'] = load_dataset(config, uploaded_file, uploaded_file.name, dataset_key, sheets, workbook_key)
+            return data
+
+        if config['query_backend'] == "duckdb":
+            # mode SQL : le fichier est importé dans la base DuckDB, le dataset n'est pas chargé en pandas
+            upload_path = save_upload(config, uploaded_file, dataset_key)
+            open_session_workspace([upload_path], uploaded_file.name, new_session=True)
+            st.rerun()
+
+        try:
+            # un dataset déjà ouvert par une autre session n'est pas rechargé : ses données sont partagées ;
+            # la session garde une référence forte au frame partagé, pas seulement à sa vue
+            st.session_state.shared_frame = get_shared_frames(config).get(dataset_key, load_uploaded_file)
+            data = session_view(st.session_state.shared_frame)
+        except ValueError:
             st.error("Unsupported file type")
+            st.stop()
+        st.session_state.mem_before = mem_info.get('before')
+        st.session_state.mem_after = mem_info.get('after', get_memory_usage(data))
 
+        st.session_state.dataset_key = dataset_key
         st.session_state.data = data
 
-        sdf_cfg = Config(
-            llm=llm,
-            model=config['aws_model'],
-            max_tokens=config['llm_max_tokens'],
-            temperature=config['llm_temperature'],
-            save_charts_path=config['chart_export_path']
-        )
-        if sdf_cfg is None:
-            st.warning("No AWS LLM detected")
-
-        # recherche du fichier de description
         uploaded_file_basename = os.path.basename(uploaded_file.name)
-        desc_file = find_matching_description_file("./datasources", uploaded_file_basename)
-        if desc_file:
-            st.session_state.description_file_name = desc_file
-            with open(desc_file, 'r') as f:
-                field_descriptors = json.load(f)
-
-            connector = PandasConnector(
-                config={"original_df": data},
-                field_descriptions=field_descriptors
-            )
-            sdf = SmartDataframe(connector, config=sdf_cfg)
-        else:
-            sdf = SmartDataframe(data, config=sdf_cfg)
-
+        sdf, st.session_state.description_file_name = build_smart_dataframe(config, get_llm(), data, uploaded_file_basename, dataset_key)
         st.session_state.sdf = sdf
+        store_dataset_info(data, dataset_key)
+        start_session(config, st.session_state.session_id, uploaded_file_basename, dataset_key, st.session_state.nb_ln,
+                      st.session_state.nb_c, st.session_state.column_names)
+        st.session_state.nb_entries = 0
+
+    # espace de travail : plusieurs datasets interrogés ensemble, chargés seulement quand une requête les utilise
+    elif uploaded_file is None and (datasource_names := list_datasources()):
+        with st.expander("Or open a workspace over several datasources"):
+            workspace_names = st.multiselect("Datasets", datasource_names)
+            if st.button("Open workspace", disabled=not workspace_names):
+                open_session_workspace([os.path.join("./datasources", name) for name in workspace_names],
+                                       f"workspace_{len(workspace_names)}_datasets", new_session=True)
+                st.rerun()
 
 # affichage des infos sur le datasae
-if 'sdf' in st.session_state and st.session_state.sdf is not None:
-    nb_ln, nb_c = st.session_state.data.shape
-    col_list = list(st.session_state.data.columns)
+if st.session_state.sdf is not None and st.session_state.workspace is not None:
+    from utils.workspace import get_shared_frames
+
+    shared_stats = get_shared_frames(config).stats()
+    if config['query_backend'] == "duckdb":
+        from utils.sql_backend import get_store_path
+
+        store_path = get_store_path(config)
+        store_info = f"SQL store : {store_path} ({os.path.getsize(store_path) / 1024 ** 2:.1f} MB)"
+    else:
+        store_info = f"{shared_stats['frames']} ({shared_stats['bytes'] / 1024 ** 2:.1f} MB, all sessions)"
+    st.markdown(f"""<hr />
+    <div class="analysis">
+    Analysis for workspace : {st.session_state.selected_dataset_name}  on {st.session_state.study_date}
+    </div>
+    <hr />
+    <h5>Shared datasets in memory :  </h5>{store_info}
+    <hr />
+    """, unsafe_allow_html=True)
+    st.dataframe([{"dataset": d['name'], "lines": d['rows'], "columns": len(d['columns']),
+                   "loaded": d['connector'].loaded, "description file": d['desc_file']}
+                  for d in st.session_state.workspace], hide_index=True, use_container_width=True)
+    # échantillons représentatifs (strates, valeurs extrêmes, lignes aléatoires), sans charger les datasets
+    with st.expander("Data preview (representative samples)"):
+        for d in st.session_state.workspace:
+            if d['sample'] is not None:
+                st.caption(d['name'])
+                st.dataframe(d['sample'], hide_index=True, use_container_width=True)
+
+if st.session_state.sdf is not None and st.session_state.workspace is None:
+    mem_info = f"{st.session_state.mem_after / 1024 ** 2:.1f} MB"
+    if st.session_state.mem_before is not None:
+        mem_info = f"{st.session_state.mem_before / 1024 ** 2:.1f} MB before, {mem_info} after type optimization"
     st.markdown(f"""<hr />
     <div class="analysis">
     Analysis for dataset : {st.session_state.selected_dataset_name}  on {st.session_state.study_date}
     </div>
     <br />   
-    <h5>Dataset Shape :  </h5>lines : {nb_ln}, columns : {nb_c}
+    <h5>Dataset Shape :  </h5>lines : {st.session_state.nb_ln}, columns : {st.session_state.nb_c}
     <hr />
-    <h5>Field names :  </h5>:  {col_list}
+    <h5>Memory footprint :  </h5>{mem_info}
+    <hr />
+    <h5>Field names :  </h5>:  {st.session_state.column_names}
     <hr />
     """, unsafe_allow_html=True)
+    if st.session_state.data_sample is not None:
+        with st.expander("Data preview (representative sample)"):
+            st.dataframe(st.session_state.data_sample, hide_index=True, use_container_width=True)
 
     if st.session_state.description_file_name is not None:
         st.markdown(f"<h5>Fields Description file was found at : </h5> {st.session_state.description_file_name} <hr />",
                     unsafe_allow_html=True)
+
+# saisie des questions, pour un dataset comme pour un espace de travail
+if st.session_state.sdf is not None:
+    st.markdown(f"<h5>Response cache : </h5> hits : {st.session_state.cache_hits}, misses : {st.session_state.cache_misses} <hr />",
+                unsafe_allow_html=True)
+    # dernières réponses de la session, relues sur disque
+    if st.session_state.nb_entries and not st.session_state.pending_jobs:
+        from utils.result_store import StoredResult
+
+        with st.expander(f"Session history ({st.session_state.nb_entries} answers)"):
+            first_entry = max(st.session_state.nb_entries - config['session_history_rows'], 0)
+            for entry in iter_entries(config, st.session_state.session_id, start=first_entry):
+                st.markdown(f"**{entry['question']}**")
+                if entry['chart_path'] is not None and os.path.exists(entry['chart_path']):
+                    st.image(entry['chart_path'], width=300)
+                elif isinstance(entry['answer'], StoredResult):
+                    show_result(entry['answer'], f"history_{entry['seq']}")
+                else:
+                    st.text(entry['answer'])
         # Saisie du prompt
     st.markdown("""
                <h4 style='text-align: left; color: #4F9493;'>
                <br>Now for this dataset, Enter your question in natural language  :<br> 
                </h4>
            """, unsafe_allow_html=True)
-    st.text_area("Enter your prompt here and send it", value=st.session_state.input_text, key="input_text")
+    st.text_area("Enter your prompt here and send it (one question per line to send a batch)", value=st.session_state.input_text, key="input_text")
     # Utilisation de st.empty() pour créer un espace réservé pour la réponse
     response_placeholder = st.empty()
 
-    if st.session_state and not st.session_state.show_send_button:
+    for error in st.session_state.query_errors:
+        st.error(error)
+    st.session_state.query_errors = []
+
+    if st.session_state.pending_jobs:
+        poll_queries()
+    elif st.session_state and not st.session_state.show_send_button:
         answer = st.session_state.output_text
         response_placeholder.text_area("Response : ", value=str(answer) if answer is not None else "", key="output_text", disabled=True)
+        for position, (question, result) in enumerate(st.session_state.output_results):
+            if len(st.session_state.output_results) > 1:
+                st.markdown(f"**{question}**")
+            show_result(result, f"output_{position}")
 
     # affichage des boutons das une ligne
     col1, col2 = st.columns([2, 1])
@@ -227,15 +602,28 @@ if 'sdf' in st.session_state and st.session_state.sdf is not None:
         if st.session_state.show_new_question_button:
             st.button("New query", key="new_query", help="Last query and answer will be registrate. Ask an other question", use_container_width=True, on_click=clear_input)
 
+    # questions courantes déjà répondues hors ligne : un clic pour les poser
+    suggestions = get_dataset_suggestions() if st.session_state.show_send_button else []
+    if suggestions:
+        st.markdown("<h5>Suggested questions : </h5>", unsafe_allow_html=True)
+        for position, question in enumerate(suggestions):
+            st.button(question, key=f"suggestion_{position}", on_click=ask_suggestion,
+                      args=(st.session_state.sdf, question))
+
     # Bouton Archiver pour générer un PDF
     if st.button("Stop & Archive", key="archive", help="save to PDF", use_container_width=True, kwargs={"kind": "primary"}):
-        # debug
-        with open('debug.txt', 'a') as f:
-            for item in st.session_state.session_data:
-                f.write(f'\n{item}')
-
-        csv_name = os.path.basename(st.session_state.selected_dataset_name)
-        pdf_path = create_k_report_pdf(config, csv_name, st.session_state.session_data, st.session_state.data)
-
-        st.success(f"PDF généré avec succès : {pdf_path}")
-        st.write(f"[Télécharger le PDF]({pdf_path})")
+        # le rapport est construit en arrière-plan, en relisant l'historique de la session sur disque
+        submit_report(st.session_state.session_id)
+
+# rapports pdf demandés dans cette session : avancement, puis lien de téléchargement
+report_jobs = get_report_jobs()
+if any(job['status'] in ("queued", "running") for job in report_jobs):
+    poll_reports()
+for job in report_jobs:
+    if job['status'] == "done":
+        st.success(f"PDF généré avec succès : {job['pdf_path']}")
+        with open(job['pdf_path'], 'rb') as f_pdf:
+            st.download_button("Télécharger le PDF", data=f_pdf.read(), file_name=os.path.basename(job['pdf_path']),
+                               mime="application/pdf", key=f"download_{job['job_id']}")
+    elif job['status'] == "error":
+        st.error(f"PDF generation failed : {job['error']}")
@@ -0,0 +1,165 @@
+"""
+Exécution sans interface d'un jeu de questions sur un ou plusieurs datasets
+
+Usage:
+python batch_report.py --datasets titanic.csv penguins.csv --questions questions.yaml --workers 4
+
+Le fichier de questions (YAML ou JSON) contient soit une liste de questions posées à tous
+les datasets, soit un dictionnaire {nom du dataset: [questions]}.
+Produit un rapport PDF par dataset et un fichier JSONL des réponses et des durées.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import yaml
+
+from utils.dataset_cache import get_file_dataset_key
+from utils.dataset_loader import build_smart_dataframe, load_dataset
+from utils.handle_query import answer_query
+from utils.llm_gateway import LLMGateway
+from utils.pdf_utils import create_k_report_pdf
+from utils.response_cache import get_context_key
+
+# état propre à chaque processus du pool
+_worker = {}
+
+
+# passerelle propre au processus : backend demandé, puis le secours configuré
+def get_llm(cfg, llm_name):
+    fallback = cfg['llm_fallback'] if llm_name not in ("stub", cfg['llm_fallback']) else None
+    return LLMGateway(cfg, [llm_name] + ([fallback] if fallback else []))
+
+
+# limite de débit partagée entre les processus : un appel au LLM toutes les `interval` secondes
+class RateLimitedChat:
+    def __init__(self, sdf, lock, next_slot, interval):
+        self.sdf = sdf
+        self.lock = lock
+        self.next_slot = next_slot
+        self.interval = interval
+
+    def chat(self, prompt):
+        with self.lock:
+            now = time.time()
+            wait = max(self.next_slot.value - now, 0)
+            self.next_slot.value = max(self.next_slot.value, now) + self.interval
+        time.sleep(wait)
+        return self.sdf.chat(prompt)
+
+    # contexte, code exécuté, étapes du pipeline : ceux du SmartDataframe (cache de plans, métriques)
+    def __getattr__(self, name):
+        return getattr(self.sdf, name)
+
+
+def _init_worker(cfg, llm_name, lock, next_slot, interval):
+    _worker.update(cfg=cfg, llm=get_llm(cfg, llm_name), lock=lock, next_slot=next_slot, interval=interval, sdfs={})
+
+
+# le SmartDataframe d'un dataset est construit une seule fois par processus
+def _get_smart_dataframe(dataset_path):
+    if dataset_path not in _worker['sdfs']:
+        cfg = _worker['cfg']
+        dataset_key = get_file_dataset_key(dataset_path)
+        data, _, _ = load_dataset(cfg, dataset_path, dataset_path, dataset_key)
+        sdf, desc_file = build_smart_dataframe(cfg, _worker['llm'], data, dataset_path, dataset_key,
+                                                enable_cache=False)
+        context_key = get_context_key(cfg, dataset_key, desc_file)
+        chat = RateLimitedChat(sdf, _worker['lock'], _worker['next_slot'], _worker['interval'])
+        _worker['sdfs'][dataset_path] = (chat, context_key)
+    return _worker['sdfs'][dataset_path]
+
+
+def run_question(dataset_path, question):
+    start = time.time()
+    record = {"dataset": os.path.basename(dataset_path), "question": question}
+    try:
+        chat, context_key = _get_smart_dataframe(dataset_path)
+        response, cache_hit = answer_query(_worker['cfg'], chat, question, context_key)
+        record.update(answer=response, cache_hit=cache_hit, error=None)
+    except Exception as e:
+        record.update(answer="An Error occurred. Please retry", cache_hit=False, error=str(e))
+    record["seconds"] = round(time.time() - start, 3)
+    return record
+
+
+def read_questions(questions_file, dataset_names):
+    with open(questions_file, 'r', encoding='utf-8') as f:
+        if questions_file.endswith(('.yaml', '.yml')):
+            questions = yaml.safe_load(f)
+        else:
+            questions = json.load(f)
+    if isinstance(questions, list):
+        return {name: questions for name in dataset_names}
+    return {name: questions.get(name, []) for name in dataset_names}
+
+
+def _to_jsonl_answer(answer):
+    if isinstance(answer, pd.DataFrame):
+        return json.loads(answer.to_json(orient="records", date_format="iso"))
+    if isinstance(answer, (str, int, float, bool)) or answer is None:
+        return answer
+    return str(answer)
+
+
+def run_batch(cfg, dataset_names, questions_file, workers, rate_per_minute, llm_name, output_dir):
+    questions = read_questions(questions_file, dataset_names)
+    lock = multiprocessing.Lock()
+    next_slot = multiprocessing.Value('d', 0.0)
+    interval = 60 / rate_per_minute if rate_per_minute else 0
+
+    results = {name: {} for name in dataset_names}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cfg, llm_name, lock, next_slot, interval)) as pool:
+        futures = {}
+        for name in dataset_names:
+            for index, question in enumerate(questions[name]):
+                future = pool.submit(run_question, os.path.join("./datasources", name), question)
+                futures[future] = (name, index)
+        for future in as_completed(futures):
+            name, index = futures[future]
+            results[name][index] = future.result()
+            print(f"[{name}] {results[name][index]['question']} ({results[name][index]['seconds']} s)")
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    timestamp = datetime.datetime.now().strftime("%m-%d-%Y_%H-%M-%S")
+    jsonl_path = os.path.join(output_dir, f"batch-{timestamp}.jsonl")
+    pdf_paths = []
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for name in dataset_names:
+            records = [results[name][index] for index in sorted(results[name])]
+            for record in records:
+                f.write(json.dumps(dict(record, answer=_to_jsonl_answer(record['answer'])), ensure_ascii=False) + "\n")
+            if records:
+                data, _, _ = load_dataset(cfg, os.path.join("./datasources", name), name,
+                                          get_file_dataset_key(os.path.join("./datasources", name)))
+                q_a = [{"question": r['question'],
+                        "answer": r['answer'] if isinstance(r['answer'], pd.DataFrame) else str(r['answer'])}
+                       for r in records]
+                pdf_paths.append(create_k_report_pdf(cfg, name, q_a, data))
+    return jsonl_path, pdf_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a question set against datasets without the Streamlit UI")
+    parser.add_argument("--datasets", nargs="+", required=True, help="dataset file names in ./datasources")
+    parser.add_argument("--questions", required=True, help="YAML or JSON questions file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--rate", type=float, default=0, help="max LLM calls per minute, all workers (0 = unlimited)")
+    parser.add_argument("--llm", choices=["bamboo", "bedrock", "stub"], default="bamboo")
+    parser.add_argument("--output", default="./exports/batch", help="directory of the JSONL results")
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+
+    answers_path, reports = run_batch(config, args.datasets, args.questions, args.workers, args.rate, args.llm, args.output)
+    print(f"Answers : {answers_path}")
+    for report in reports:
+        print(f"Report : {report}")
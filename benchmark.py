@@ -0,0 +1,240 @@
+"""
+Benchmark des chemins de chargement, de requête et de rapport, sur des datasets synthétiques
+et avec un LLM local déterministe (aucun appel réseau)
+
+Usage:
+python benchmark.py --rows 10000 100000 1000000 --formats csv xlsx --output ./exports/bench/results.json
+python benchmark.py --rows 10000 --compare ./exports/bench/baseline.json --tolerance 0.25
+
+Les fichiers générés sont conservés dans ./exports/bench/data et réutilisés d'un lancement à l'autre.
+Avec --compare, le code de sortie vaut 1 si une étape est plus lente que la référence au-delà de la tolérance.
+"""
+import argparse
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.chart_artifacts import collect_chart
+from utils.dataset_cache import get_file_dataset_key
+from utils.dataset_loader import build_smart_dataframe, load_dataset
+from utils.pdf_utils import create_k_report_pdf
+from utils.stub_llm import StubLLM
+
+BENCH_DIR = "./exports/bench"
+# caches, magasins et exports du benchmark
+WORK_DIR = os.path.join(BENCH_DIR, "work")
+# limite de lignes d'une feuille Excel (en-tête compris)
+XLSX_MAX_ROWS = 1048575
+CATEGORIES = ["north", "south", "east", "west", "center", "overseas"]
+QUESTIONS = {
+    "chat_number": "What is the total amount?",
+    "chat_group": "Group amount and quantity by category",
+    "chat_table": "Show the table of the first rows",
+    "chat_plot": "Plot the amount by category",
+}
+
+
+def generate_dataframe(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "category": rng.choice(CATEGORIES, rows),
+        "amount": rng.gamma(2.0, 150.0, rows).round(2),
+        "quantity": rng.integers(1, 100, rows),
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+        "flag": rng.random(rows) < 0.3,
+        "label": np.char.add("item-", rng.integers(0, 50000, rows).astype(str)),
+    })
+
+
+# fichier synthétique généré une seule fois par (format, nombre de lignes)
+def get_dataset_file(rows, file_format):
+    data_dir = os.path.join(BENCH_DIR, "data")
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    path = os.path.join(data_dir, f"synthetic_{rows}.{file_format}")
+    if not os.path.exists(path):
+        df = generate_dataframe(rows)
+        tmp_path = f"{path}.tmp.{file_format}"
+        if file_format == "csv":
+            df.to_csv(tmp_path, index=False)
+        else:
+            df.to_excel(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return path
+
+
+# vidé avant chaque mesure "cold"
+def reset_work_dir():
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    os.makedirs(WORK_DIR, exist_ok=True)
+
+
+# configuration isolée : aucun chemin de l'application (caches, magasins, exports) n'est lu ni écrit
+def get_bench_config(cfg):
+    reset_work_dir()
+    return dict(
+        cfg,
+        serving_mode="single",
+        dataset_cache_path=os.path.join(WORK_DIR, "datasets"),
+        dataset_registry_path=os.path.join(WORK_DIR, "registry.db"),
+        response_cache_path=os.path.join(WORK_DIR, "responses"),
+        plan_cache_path=os.path.join(WORK_DIR, "plans.db"),
+        session_store_path=os.path.join(WORK_DIR, "sessions.db"),
+        result_store_path=os.path.join(WORK_DIR, "results"),
+        sql_store_path=os.path.join(WORK_DIR, "store.duckdb"),
+        shared_cache_path=os.path.join(WORK_DIR, "shared"),
+        chart_tmp_path=os.path.join(WORK_DIR, "charts"),
+        chart_export_path=os.path.join(WORK_DIR, "png"),
+        csv_export_path=os.path.join(WORK_DIR, "csv"),
+        pdf_export_path=os.path.join(WORK_DIR, "pdf"),
+        pdf_image_cache_path=os.path.join(WORK_DIR, "pdf_images"),
+        ingest_spill_path=os.path.join(WORK_DIR, "spill"),
+        metrics_path=os.path.join(WORK_DIR, "metrics.jsonl"),
+        metrics_prometheus_path=os.path.join(WORK_DIR, "pandasai_app.prom"),
+    )
+
+
+def measure(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def bench_dataset(cfg, dataset_file, repeat, report_entries):
+    results = {}
+    dataset_key = get_file_dataset_key(dataset_file)
+    file_name = os.path.basename(dataset_file)
+    profile_dir = os.path.join(WORK_DIR, "profiles")
+
+    def load_cold():
+        # ni copie Arrow, ni schéma de feuille Excel, ni entrée du registre d'une mesure précédente
+        reset_work_dir()
+        return load_dataset(cfg, dataset_file, file_name, dataset_key)[0]
+
+    results["ingest_cold"], data = measure(load_cold, repeat)
+    results["ingest_cached"], data = measure(lambda: load_dataset(cfg, dataset_file, file_name, dataset_key)[0], repeat)
+
+    def setup():
+        os.makedirs(profile_dir, exist_ok=True)
+        for profile_file in os.listdir(profile_dir):
+            if profile_file.endswith("_profile.json"):
+                os.remove(os.path.join(profile_dir, profile_file))
+        return build_smart_dataframe(cfg, StubLLM(), data, file_name, dataset_key, rep=profile_dir,
+                                     enable_cache=False)[0]
+
+    results["smart_dataframe_setup"], sdf = measure(setup, repeat)
+
+    # durée de chat() avec un LLM instantané : surcoût de pandasai (prompt, nettoyage, exécution du code)
+    answers = {}
+    for stage, question in QUESTIONS.items():
+        results[stage], answers[stage] = measure(lambda: sdf.chat(question), repeat)
+
+    def handle_chart():
+        chart_path = sdf.chat(QUESTIONS["chat_plot"])
+        start = time.perf_counter()
+        collect_chart(cfg, chart_path)
+        return time.perf_counter() - start
+
+    results["chart_collect"] = [handle_chart() for _ in range(repeat)]
+
+    # rapport : alternance de réponses texte, nombre, DataFrame volumineux et graphique
+    chart = collect_chart(cfg, sdf.chat(QUESTIONS["chat_plot"]))
+    kinds = [answers["chat_number"], "A short text answer " * 10, answers["chat_table"], answers["chat_group"], chart]
+    q_a = [{"question": f"Question {i}", "answer": kinds[i % len(kinds)]} for i in range(report_entries)]
+    results["report_pdf"], _ = measure(lambda: create_k_report_pdf(cfg, file_name, q_a, data), repeat)
+    return results
+
+
+def get_meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "pandasai": importlib.metadata.version("pandasai"),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+# étapes plus lentes que la référence (médianes) au-delà de la tolérance
+def compare_results(results, baseline, tolerance):
+    reference = {(r["dataset"], r["stage"]): r["median"] for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        before = reference.get((r["dataset"], r["stage"]))
+        if before and r["median"] > before * (1 + tolerance):
+            regressions.append({**r, "baseline_median": before, "ratio": round(r["median"] / before, 2)})
+    return regressions
+
+
+def run_benchmark(cfg, rows_list, formats, repeat, report_entries):
+    bench_cfg = get_bench_config(cfg)
+    results = []
+    for file_format in formats:
+        for rows in rows_list:
+            if file_format == "xlsx" and rows > XLSX_MAX_ROWS:
+                print(f"skip xlsx {rows} rows : above the Excel sheet limit ({XLSX_MAX_ROWS})")
+                continue
+            dataset_file = get_dataset_file(rows, file_format)
+            print(f"{os.path.basename(dataset_file)} ...")
+            for stage, timings in bench_dataset(bench_cfg, dataset_file, repeat, report_entries).items():
+                results.append({
+                    "dataset": os.path.basename(dataset_file),
+                    "rows": rows,
+                    "format": file_format,
+                    "stage": stage,
+                    "seconds": [round(t, 4) for t in timings],
+                    "median": round(statistics.median(timings), 4),
+                })
+                print(f"  {stage:<22} {results[-1]['median']:.4f} s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, query and report paths with a stub LLM")
+    parser.add_argument("--rows", nargs="+", type=int, default=[10000, 100000, 1000000])
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv"])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measure, the median is reported")
+    parser.add_argument("--report-entries", type=int, default=50, help="Q/A entries in the benchmarked report")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results.json"))
+    parser.add_argument("--compare", help="baseline results JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+
+    bench_results = run_benchmark(config, args.rows, args.formats, args.repeat, args.report_entries)
+    report = {"meta": get_meta(), "params": vars(args), "results": bench_results}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report["regressions"] = compare_results(bench_results, json.load(f), args.tolerance)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results : {args.output}")
+
+    if report.get("regressions"):
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['dataset']} {regression['stage']} : x{regression['ratio']}")
+        sys.exit(1)
@@ -1,17 +1,15 @@
 import os.path
 
-import pandas as pd
 import json
 
+from utils.ingestion import ingest_file
+
 
 # Charger le fichier CSV ou Excel
 def load_file(_file_path):
-    if _file_path.endswith('.csv'):
-        df1 = pd.read_csv(_file_path)
-    elif _file_path.endswith(('.xls', '.xlsx')):
-        df1 = pd.read_excel(_file_path)
-    else:
-        raise ValueError("Le fichier doit être au format CSV ou Excel (xls, xlsx).")
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+    df1, _, _ = ingest_file(_file_path, _file_path, config)
     return df1
 
 
@@ -0,0 +1,55 @@
+import json
+import time
+
+import pandas as pd
+import streamlit as st
+
+from utils.metrics import read_metrics, summarize
+
+WINDOWS = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "All": None}
+
+
+@st.cache_resource
+def read_conf():
+    with open('general_config.json', 'r') as f_conf:
+        return json.load(f_conf)
+
+
+@st.cache_resource
+def get_css_style():
+    with open("assets/styles/style.css", "r") as f_css:
+        return f_css.read()
+
+
+config = read_conf()
+st.markdown(f"<style>{get_css_style()}</style>", unsafe_allow_html=True)
+st.title("Metrics")
+
+window = st.selectbox("Period", list(WINDOWS), index=1)
+since = time.time() - WINDOWS[window] if WINDOWS[window] else None
+metrics = read_metrics(config, since)
+
+if metrics.empty:
+    st.info("No metrics recorded for this period.")
+    st.stop()
+
+queries = metrics[metrics["stage"] == "query"]
+hits = int(queries["cache_hit"].fillna(False).astype(bool).sum()) if "cache_hit" in queries else 0
+col1, col2, col3 = st.columns(3)
+col1.metric("Queries", len(queries))
+col2.metric("Cache hit ratio", f"{hits / len(queries):.0%}" if len(queries) else "-")
+if "prompt_tokens" in metrics:
+    col3.metric("Tokens (estimated)",
+                int(metrics["prompt_tokens"].fillna(0).sum() + metrics["completion_tokens"].fillna(0).sum()))
+
+st.subheader("Duration per stage (s)")
+st.dataframe(summarize(metrics), hide_index=True, use_container_width=True)
+
+st.subheader("Duration over time (s)")
+stage = st.selectbox("Stage", sorted(metrics["stage"].unique()))
+stage_metrics = metrics[metrics["stage"] == stage].copy()
+stage_metrics["time"] = pd.to_datetime(stage_metrics["ts"], unit="s")
+st.line_chart(stage_metrics, x="time", y="seconds")
+
+st.caption(f"Prometheus text export (all metrics, updated every {config['metrics_prometheus_interval_s']} s) : "
+           f"{config['metrics_prometheus_path']}")
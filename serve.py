@@ -0,0 +1,83 @@
+"""
+Lancement de plusieurs réplicas de app.py derrière un répartiteur de charge (serving_mode "multi")
+
+Usage:
+python serve.py --replicas 3 --base-port 8501
+
+Chaque réplica est un processus streamlit sur son propre port (8501, 8502, ...), lancé avec APP_SERVING_MODE=multi
+et APP_REPLICA_ID. Les réponses du LLM et les copies Arrow des datasets passent par le cache partagé
+(shared_cache_backend : "disk" dans shared_cache_path, ou "redis" à shared_cache_url). Une même question posée
+sur deux réplicas n'appelle le LLM qu'une fois, et les écritures dans exports/ sont atomiques. Chaque réplica a
+sa propre base DuckDB.
+Le répartiteur doit garder une session sur le même réplica (websocket streamlit), par exemple avec nginx :
+upstream pandasai_app { ip_hash; server 127.0.0.1:8501; server 127.0.0.1:8502; server 127.0.0.1:8503; }
+Un réplica arrêté est relancé ; Ctrl+C arrête l'ensemble.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+# délai minimal entre deux relances d'un réplica qui s'arrête aussitôt
+RESTART_DELAY_S = 5
+
+
+# vérifie le cache partagé avant de lancer les réplicas : répertoire accessible en écriture, ou Redis joignable
+def check_shared_cache(cfg):
+    if cfg['shared_cache_backend'] == "redis":
+        import redis
+
+        redis.Redis.from_url(cfg['shared_cache_url']).ping()
+    else:
+        os.makedirs(cfg['shared_cache_path'], exist_ok=True)
+        if not os.access(cfg['shared_cache_path'], os.W_OK):
+            raise PermissionError(f"Shared cache not writable : {cfg['shared_cache_path']}")
+
+
+def start_replica(replica_id, port, address):
+    env = dict(os.environ, APP_SERVING_MODE="multi", APP_REPLICA_ID=str(replica_id))
+    return subprocess.Popen([sys.executable, "-m", "streamlit", "run", "app.py", "--server.port", str(port),
+                             "--server.address", address, "--server.headless", "true"], env=env)
+
+
+def serve(replicas, base_port, address):
+    processes = {replica_id: (start_replica(replica_id, base_port + replica_id, address), time.time())
+                 for replica_id in range(replicas)}
+    for replica_id in processes:
+        print(f"replica {replica_id} : http://{address}:{base_port + replica_id}")
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        while not stopping:
+            time.sleep(1)
+            for replica_id, (process, started) in processes.items():
+                if process.poll() is not None and time.time() - started >= RESTART_DELAY_S:
+                    print(f"replica {replica_id} exited ({process.returncode}), restarting")
+                    processes[replica_id] = (start_replica(replica_id, base_port + replica_id, address), time.time())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process, _ in processes.values():
+            process.terminate()
+        for process, _ in processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several app.py replicas sharing their caches")
+    parser.add_argument("--replicas", type=int, default=2, help="number of streamlit processes")
+    parser.add_argument("--base-port", type=int, default=8501, help="port of the first replica")
+    parser.add_argument("--address", default="127.0.0.1", help="listen address of the replicas")
+    args = parser.parse_args()
+
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+    check_shared_cache(config)
+    serve(args.replicas, args.base_port, args.address)
@@ -0,0 +1,101 @@
+"""
+Mesure du démarrage de l'application : import de streamlit, premier affichage de la page d'accueil de app.py
+et mémoire résidente, chaque mesure dans un processus neuf (démarrage à froid d'un réplica)
+
+Usage:
+python startup_benchmark.py --repeat 5 --budget 1.5 --max-rss-mb 400 --output ./exports/bench/startup.json
+
+Le code de sortie vaut 1 si le premier affichage dépasse --budget secondes, si la mémoire résidente dépasse
+--max-rss-mb, ou si la page d'accueil charge un module lourd (pandasai, fpdf, PIL, boto3, openpyxl, duckdb).
+Ce script n'importe lui-même que la bibliothèque standard, pour ne pas fausser les mesures.
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = "./exports/bench"
+# modules qui ne doivent être chargés qu'au premier dataset ou à la première question
+HEAVY_MODULES = ("pandasai", "fpdf", "PIL", "boto3", "openpyxl", "duckdb")
+
+
+# exécuté dans le processus fils : premier affichage de app.py sans dataset, tel qu'un utilisateur le voit
+def measure_startup():
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    import_seconds = time.perf_counter() - start
+    modules_before = set(sys.modules)
+    start = time.perf_counter()
+    at = AppTest.from_file("app.py", default_timeout=120).run()
+    render_seconds = time.perf_counter() - start
+    loaded = {name.split(".")[0] for name in set(sys.modules) - modules_before}
+    return {
+        "streamlit_import": import_seconds,
+        "first_render": render_seconds,
+        # pic de mémoire résidente du processus (ko sous Linux)
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "heavy_modules": sorted(loaded & set(HEAVY_MODULES)),
+        "exceptions": [e.value for e in at.exception],
+    }
+
+
+def run_startup_benchmark(repeat):
+    runs = []
+    for _ in range(repeat):
+        child = subprocess.run([sys.executable, __file__, "--child"], capture_output=True, text=True, check=True)
+        runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    return {
+        "streamlit_import": round(statistics.median(run["streamlit_import"] for run in runs), 4),
+        "first_render": round(statistics.median(run["first_render"] for run in runs), 4),
+        "first_render_runs": [round(run["first_render"], 4) for run in runs],
+        "rss_mb": round(statistics.median(run["rss_mb"] for run in runs), 1),
+        "heavy_modules": sorted({name for run in runs for name in run["heavy_modules"]}),
+        "exceptions": [e for run in runs for e in run["exceptions"]],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure app.py cold start: first render time and resident memory")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes, the median is reported")
+    parser.add_argument("--budget", type=float, help="max seconds for the first render")
+    parser.add_argument("--max-rss-mb", type=float, help="max resident memory after the first render")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "startup.json"))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_startup()))
+        sys.exit(0)
+
+    result = run_startup_benchmark(args.repeat)
+    print(f"streamlit import   {result['streamlit_import']:.3f} s")
+    print(f"first render       {result['first_render']:.3f} s")
+    print(f"resident memory    {result['rss_mb']:.1f} MB")
+    print(f"heavy modules      {', '.join(result['heavy_modules']) or '-'}")
+
+    failures = []
+    if args.budget is not None and result['first_render'] > args.budget:
+        failures.append(f"first render {result['first_render']:.3f} s above the {args.budget} s budget")
+    if args.max_rss_mb is not None and result['rss_mb'] > args.max_rss_mb:
+        failures.append(f"resident memory {result['rss_mb']:.1f} MB above {args.max_rss_mb} MB")
+    if result['heavy_modules']:
+        failures.append(f"heavy modules loaded at startup : {', '.join(result['heavy_modules'])}")
+    failures.extend(f"exception : {e}" for e in result['exceptions'])
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "params": vars(args),
+                   "startup": result, "failures": failures}, f, indent=4)
+    print(f"Results : {args.output}")
+
+    for failure in failures:
+        print(f"STARTUP {failure}")
+    if failures:
+        sys.exit(1)
@@ -1,10 +1,8 @@
 import streamlit
-from pandasai.llm import BambooLLM
-from api_keys import PANDASAI_API_KEY
 
+from utils.llm_gateway import create_bamboo_llm
 
-@streamlit.cache_resource
-def get_bamboo_llm():
-    _llm = BambooLLM(api_key=PANDASAI_API_KEY)
-    return _llm
 
+@streamlit.cache_resource
+def get_bamboo_llm(conf):
+    return create_bamboo_llm(conf)
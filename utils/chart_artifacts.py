@@ -0,0 +1,42 @@
+import hashlib
+import os
+import uuid
+
+
+# pandasai enregistre chaque graphique sous <chart_tmp_path>/<prompt_id>.png (save_charts=True) :
+# le nom est propre à la requête, aucun verrou global n'est nécessaire
+def get_chart_config(cfg):
+    return {
+        "save_charts": True,
+        "save_charts_path": cfg['chart_tmp_path'],
+        "open_charts": False
+    }
+
+
+def store_chart_bytes(cfg, content):
+    final_dir = cfg['chart_export_path']
+    if not os.path.exists(final_dir):
+        os.makedirs(final_dir, exist_ok=True)
+
+    # nom dérivé du contenu : deux graphiques identiques partagent le même fichier
+    chart_hash = hashlib.sha256(content).hexdigest()[:16]
+    final_path = os.path.join(final_dir, f"chart_{chart_hash}.png")
+    if not os.path.exists(final_path):
+        tmp_path = f"{final_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        # renommage atomique : une écriture concurrente du même graphique est sans effet
+        os.replace(tmp_path, final_path)
+    return final_path
+
+
+# déplace le graphique produit par une requête vers le stockage définitif dédupliqué
+def collect_chart(cfg, chart_path):
+    if os.path.dirname(os.path.abspath(chart_path)) != os.path.abspath(cfg['chart_tmp_path']):
+        # graphique qui n'a pas été produit par cette requête : on ne le déplace pas
+        return chart_path
+    with open(chart_path, 'rb') as f:
+        content = f.read()
+    final_path = store_chart_bytes(cfg, content)
+    os.remove(chart_path)
+    return final_path
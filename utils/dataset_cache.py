@@ -0,0 +1,107 @@
+import hashlib
+import os
+import uuid
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.shared_cache import fits_shared_cache, get_shared_cache
+
+CACHE_EXTENSION = ".arrow"
+# version du contenu des copies : les copies aux entiers int8/int16 ne sont plus relues (éviction LRU)
+CACHE_FORMAT = "v2"
+
+
+# empreinte du contenu d'un fichier chargé (indépendante de son nom)
+def get_dataset_key(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+# même empreinte, calculée par blocs pour un fichier sur disque
+def get_file_dataset_key(file_path):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_cache_file(cfg, key):
+    cache_dir = cfg['dataset_cache_path']
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f"{key}-{CACHE_FORMAT}{CACHE_EXTENSION}")
+
+
+# copie Arrow publiée par un autre réplica : recopiée dans le cache local, False si absente
+def _fetch_shared_dataset(cfg, key, cache_file):
+    shared = get_shared_cache(cfg)
+    content = shared.get(f"dataset:{CACHE_FORMAT}:{key}") if shared is not None else None
+    if content is None:
+        return False
+    tmp_file = f"{cache_file}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_file, cache_file)
+    evict_datasets(cfg)
+    return True
+
+
+# relit un dataset déjà converti en Arrow IPC, par memory-map : pas de re-parsing CSV/Excel
+# (en mode multi-réplicas, le cache partagé est consulté avant de relire le fichier source)
+def load_cached_dataset(cfg, key):
+    cache_file = get_cache_file(cfg, key)
+    if not os.path.exists(cache_file) and not _fetch_shared_dataset(cfg, key, cache_file):
+        return None
+    try:
+        table = feather.read_table(cache_file, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        # fichier tronqué ou corrompu : on le supprime, il sera reconstruit
+        os.remove(cache_file)
+        return None
+    # l'accès met à jour la date de modification, utilisée pour l'éviction LRU
+    os.utime(cache_file)
+    return table.to_pandas()
+
+
+# convertit une seule fois le DataFrame parsé au format colonne sur disque
+def store_dataset(cfg, key, df):
+    cache_file = get_cache_file(cfg, key)
+    tmp_file = f"{cache_file}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        # non compressé pour que la relecture puisse se faire par memory-map
+        feather.write_feather(df, tmp_file, compression="uncompressed")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # colonnes de types mixtes non convertibles : on ne met pas en cache
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return None
+    # renommage atomique : une autre session ne voit jamais un fichier partiel
+    os.replace(tmp_file, cache_file)
+    shared = get_shared_cache(cfg)
+    if shared is not None and fits_shared_cache(cfg, os.path.getsize(cache_file)):
+        with open(cache_file, 'rb') as f:
+            shared.set(f"dataset:{CACHE_FORMAT}:{key}", f.read(), ex=int(cfg['shared_cache_ttl_hours'] * 3600))
+    evict_datasets(cfg)
+    return cache_file
+
+
+# éviction LRU : supprime les plus anciens fichiers jusqu'à respecter la taille max
+def evict_datasets(cfg):
+    cache_dir = cfg['dataset_cache_path']
+    max_size = cfg['dataset_cache_max_mb'] * 1024 * 1024
+    entries = []
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(CACHE_EXTENSION):
+            stat = os.stat(os.path.join(cache_dir, file_name))
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, file_name in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, file_name))
+        except FileNotFoundError:
+            pass
+        total_size -= size
@@ -0,0 +1,104 @@
+import json
+import os
+
+from pandasai import Agent, SmartDataframe
+from pandasai.connectors import PandasConnector
+from pandasai.schemas.df_config import Config
+
+from utils.chart_artifacts import get_chart_config
+from utils.dataset_cache import get_cache_file, load_cached_dataset, store_dataset
+from utils.dataset_profile import (get_profile_file, load_or_compute_profile, load_profile, profile_to_prompt,
+                                   store_profile)
+from utils.dataset_registry import find_description_file, register_dataset
+from utils.dataset_sample import frame_batches, get_prompt_head, get_sample
+from utils.ingestion import get_memory_usage, ingest_file
+from utils.metrics import span
+from utils.shared_cache import single_flight
+
+
+# relit le dataset depuis le cache si son contenu est connu, sinon le lit par blocs et le met en cache
+# retourne (DataFrame, mémoire avant, mémoire après) ; ValueError si le format n'est pas supporté
+# sheets : feuilles Excel choisies, dataset_key est alors l'empreinte de la sélection (get_sheets_key)
+def load_dataset(cfg, source, file_name, dataset_key, sheets=None, workbook_key=None):
+    with span(cfg, "dataset_load", cache_hit=True) as fields:
+        data = load_cached_dataset(cfg, dataset_key)
+        if data is not None:
+            fields["rows"] = len(data)
+            return data, None, get_memory_usage(data)
+
+        # mode multi-réplicas : un seul réplica lit le fichier, les autres relisent sa copie Arrow
+        with single_flight(cfg, f"dataset:{dataset_key}", cfg['shared_lock_timeout_s']) as waited:
+            data = load_cached_dataset(cfg, dataset_key) if waited else None
+            if data is not None:
+                fields["rows"] = len(data)
+                return data, None, get_memory_usage(data)
+            fields["cache_hit"] = False
+            with span(cfg, "dataset_read", file_type=os.path.splitext(file_name)[1]):
+                data, mem_before, mem_after = ingest_file(source, file_name, cfg, sheets, workbook_key or dataset_key)
+            fields["rows"] = len(data)
+            store_dataset(cfg, dataset_key, data)
+            return data, mem_before, mem_after
+
+
+# SmartDataframe avec descriptions des champs (si un fichier existe) et profil du dataset
+# enable_cache=False : le cache duckdb de pandasai ne supporte pas plusieurs processus
+def build_smart_dataframe(cfg, llm, data, dataset_file_name, dataset_key, rep="./datasources", enable_cache=True):
+    with span(cfg, "smart_dataframe_build"):
+        return _build_smart_dataframe(cfg, llm, data, dataset_file_name, dataset_key, rep, enable_cache)
+
+
+# direct_sql=True : le code généré interroge les connecteurs SQL avec execute_sql_query
+def get_sdf_config(cfg, llm, enable_cache=True, direct_sql=False):
+    return Config(
+        llm=llm,
+        model=cfg['aws_model'],
+        max_tokens=cfg['llm_max_tokens'],
+        temperature=cfg['llm_temperature'],
+        # le cache duckdb de pandasai n'accepte qu'un processus : remplacé par le cache de réponses entre réplicas
+        enable_cache=enable_cache and cfg['serving_mode'] != "multi",
+        direct_sql=direct_sql,
+        **get_chart_config(cfg)
+    )
+
+
+# agent propre à un job du pool de requêtes : mêmes connecteurs (données partagées) et même configuration, mais
+# dernier code exécuté, identifiant de requête, mémoire et suivi du pipeline séparés (un Agent n'est pas thread-safe)
+def job_agent(sdf):
+    agent = getattr(sdf, "_agent", sdf)
+    return Agent(agent.context.dfs, config=agent.config, description=agent.agent_info)
+
+
+# fichier de description et profil d'un dataset ; get_data n'est appelé que si le profil doit être calculé,
+# get_profile remplace le calcul pandas (profil calculé par le moteur SQL)
+# retourne (profil, descriptions des champs, chemin du fichier de description)
+def describe_dataset(cfg, dataset_file_name, dataset_key, get_data, rep="./datasources", get_profile=None):
+    dataset_basename = os.path.basename(dataset_file_name)
+    desc_file = find_description_file(cfg, rep, dataset_basename, dataset_key)
+    field_descriptors = None
+    if desc_file:
+        with open(desc_file, 'r') as f:
+            field_descriptors = json.load(f)
+
+    # profil calculé une fois par empreinte de dataset et transmis au LLM comme description
+    profile = load_profile(rep, dataset_basename, dataset_key)
+    if profile is None and get_profile is not None:
+        profile = store_profile(rep, dataset_basename, get_profile())
+    elif profile is None:
+        profile = load_or_compute_profile(rep, dataset_basename, dataset_key, get_data(), cfg)
+    cache_file = get_cache_file(cfg, dataset_key)
+    register_dataset(cfg, dataset_basename, dataset_key, desc_file, get_profile_file(rep, dataset_basename),
+                     cache_file if os.path.exists(cache_file) else None)
+    return profile, field_descriptors, desc_file
+
+
+def _build_smart_dataframe(cfg, llm, data, dataset_file_name, dataset_key, rep, enable_cache):
+    profile, field_descriptors, desc_file = describe_dataset(cfg, dataset_file_name, dataset_key, lambda: data, rep)
+    # aperçu du prompt tiré de l'échantillon en cache ; le code généré s'exécute sur le DataFrame complet
+    sample = get_sample(cfg, dataset_key, lambda: frame_batches(data, cfg['sample_batch_rows']))
+    connector = PandasConnector(
+        config={"original_df": data},
+        custom_head=get_prompt_head(sample) if sample is not None else None,
+        description=profile_to_prompt(profile),
+        field_descriptions=field_descriptors
+    )
+    return SmartDataframe(connector, config=get_sdf_config(cfg, llm, enable_cache)), desc_file
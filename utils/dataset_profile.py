@@ -0,0 +1,138 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+# estimation HyperLogLog du nombre de valeurs distinctes, en une passe numpy sur les hash
+def hll_cardinality(series, precision):
+    hashes = pd.util.hash_pandas_object(series.dropna(), index=False).to_numpy(dtype=np.uint64)
+    m = 1 << precision
+    if len(hashes) == 0:
+        return 0
+    indexes = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    remaining = hashes & np.uint64((1 << (64 - precision)) - 1)
+    # rang = position du premier bit à 1 dans les (64 - precision) bits restants
+    with np.errstate(divide='ignore'):
+        bit_length = np.floor(np.log2(remaining.astype(np.float64))) + 1
+    ranks = np.where(remaining == 0, 64 - precision + 1, (64 - precision) - bit_length + 1).astype(np.uint8)
+    registers = np.zeros(m, dtype=np.uint8)
+    np.maximum.at(registers, indexes, ranks)
+
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # correction pour les petites cardinalités
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def _to_json_value(value):
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def profile_column(series, cfg):
+    nb_rows = len(series)
+    values = series.dropna()
+    col_profile = {
+        "dtype": str(series.dtype),
+        "nulls": int(nb_rows - len(values)),
+    }
+    if nb_rows > cfg['profile_hll_threshold']:
+        col_profile["distinct"] = hll_cardinality(values, cfg['profile_hll_precision'])
+        col_profile["distinct_estimated"] = True
+    else:
+        col_profile["distinct"] = int(values.nunique())
+
+    if len(values) == 0:
+        return col_profile
+
+    is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+    if is_numeric or pd.api.types.is_datetime64_any_dtype(series):
+        col_profile["min"] = _to_json_value(values.min())
+        col_profile["max"] = _to_json_value(values.max())
+    if is_numeric:
+        quantiles = np.quantile(values.to_numpy(dtype=np.float64), QUANTILES)
+        col_profile["quantiles"] = [round(float(q), 4) for q in quantiles]
+    else:
+        top = values.value_counts().head(cfg['profile_top_k'])
+        col_profile["top"] = [[str(value), int(count)] for value, count in top.items()]
+    return col_profile
+
+
+def compute_profile(df, fingerprint, cfg):
+    return {
+        "fingerprint": fingerprint,
+        "rows": int(len(df)),
+        "columns": {str(column): profile_column(df[column], cfg) for column in df.columns}
+    }
+
+
+def get_profile_file(rep, dataset_file_name):
+    base_name = os.path.splitext(os.path.basename(dataset_file_name))[0]
+    return os.path.join(rep, f"{base_name}_profile.json")
+
+
+# profil déjà calculé pour ce contenu (même empreinte), None sinon
+def load_profile(rep, dataset_file_name, fingerprint):
+    profile_file = get_profile_file(rep, dataset_file_name)
+    if os.path.exists(profile_file):
+        with open(profile_file, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        if profile.get("fingerprint") == fingerprint:
+            return profile
+    return None
+
+
+# le profil n'est recalculé que si le contenu du dataset (son empreinte) a changé
+def load_or_compute_profile(rep, dataset_file_name, fingerprint, df, cfg):
+    profile = load_profile(rep, dataset_file_name, fingerprint)
+    if profile is not None:
+        return profile
+
+    return store_profile(rep, dataset_file_name, compute_profile(df, fingerprint, cfg))
+
+
+def store_profile(rep, dataset_file_name, profile):
+    profile_file = get_profile_file(rep, dataset_file_name)
+    tmp_file = f"{profile_file}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=4, ensure_ascii=False)
+    # renommage atomique : un autre réplica ne lit jamais un profil à moitié écrit
+    os.replace(tmp_file, profile_file)
+    return profile
+
+
+def _short(value, max_length=30):
+    value = str(value).replace('"', "'")
+    return value if len(value) <= max_length else value[:max_length - 3] + "..."
+
+
+# résumé compact transmis au LLM comme description du dataframe
+def profile_to_prompt(profile, max_top=3):
+    parts = [f"{profile['rows']} rows."]
+    for column, col_profile in profile["columns"].items():
+        details = [col_profile["dtype"]]
+        if col_profile["nulls"]:
+            details.append(f"{col_profile['nulls']} nulls")
+        approx = "~" if col_profile.get("distinct_estimated") else ""
+        details.append(f"{approx}{col_profile['distinct']} distinct")
+        if "min" in col_profile:
+            details.append(f"range {_short(col_profile['min'])}..{_short(col_profile['max'])}")
+        if "quantiles" in col_profile:
+            details.append("q25/50/75 " + "/".join(f"{q:g}" for q in col_profile["quantiles"]))
+        # des valeurs uniques (noms, identifiants) n'apprennent rien au LLM
+        top = [value for value, count in col_profile.get("top", [])[:max_top] if count > 1]
+        if top:
+            details.append("top " + ", ".join(_short(value) for value in top))
+        parts.append(f"{_short(column)}: {'; '.join(details)}.")
+    return " ".join(parts)
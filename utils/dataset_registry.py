@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+# suffixes reconnus pour les fichiers de description, du plus spécifique au plus général
+DESCRIPTION_SUFFIXES = ("_field_descriptions.json", "_descriptions.json", "descriptions.json")
+DATASET_EXTENSIONS = (".csv", ".xls", ".xlsx")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    rep TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS description_files (
+    rep TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    PRIMARY KEY (rep, file_name)
+);
+CREATE INDEX IF NOT EXISTS description_files_stem ON description_files (rep, stem);
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_name TEXT NOT NULL,
+    dataset_key TEXT NOT NULL,
+    desc_file TEXT,
+    profile_file TEXT,
+    cache_file TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (dataset_name, dataset_key)
+);
+CREATE INDEX IF NOT EXISTS datasets_key ON datasets (dataset_key);
+CREATE TABLE IF NOT EXISTS file_keys (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    dataset_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sheet_schemas (
+    workbook_key TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    schema TEXT NOT NULL,
+    PRIMARY KEY (workbook_key, sheet)
+);
+CREATE TABLE IF NOT EXISTS suggestions (
+    dataset_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    status TEXT NOT NULL,
+    seconds REAL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (dataset_key, position)
+);
+"""
+
+
+def _connect(cfg):
+    registry_dir = os.path.dirname(cfg['dataset_registry_path'])
+    if registry_dir and not os.path.exists(registry_dir):
+        os.makedirs(registry_dir, exist_ok=True)
+    conn = sqlite3.connect(cfg['dataset_registry_path'], timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# nom du dataset décrit par un fichier de description, None si ce n'en est pas un
+def get_description_stem(file_name):
+    for suffix in DESCRIPTION_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return None
+
+
+# l'index d'un répertoire n'est reconstruit que si le répertoire a changé (ajout, suppression, renommage)
+def _refresh_directory(conn, rep):
+    mtime = os.stat(rep).st_mtime
+    row = conn.execute("SELECT mtime FROM directories WHERE rep = ?", (rep,)).fetchone()
+    if row is not None and row[0] == mtime:
+        return
+    with conn:
+        conn.execute("DELETE FROM description_files WHERE rep = ?", (rep,))
+        for file_name in os.listdir(rep):
+            stem = get_description_stem(file_name)
+            if stem is not None:
+                conn.execute("INSERT INTO description_files (rep, stem, file_name) VALUES (?, ?, ?)",
+                             (rep, stem, file_name))
+        conn.execute("INSERT OR REPLACE INTO directories (rep, mtime) VALUES (?, ?)", (rep, mtime))
+
+
+# fichier de description d'un dataset, dans l'ordre :
+# même nom exact, puis même contenu déjà enregistré sous un autre nom, puis nom commençant par le nom du dataset
+def find_description_file(cfg, rep, dataset_file_name, dataset_key=None):
+    rep = os.path.normpath(rep)
+    base_name = os.path.splitext(os.path.basename(dataset_file_name))[0]
+    with closing(_connect(cfg)) as conn:
+        _refresh_directory(conn, rep)
+        row = conn.execute("SELECT file_name FROM description_files WHERE rep = ? AND stem = ? ORDER BY file_name",
+                           (rep, base_name)).fetchone()
+        if row is not None:
+            return os.path.join(rep, row[0])
+
+        if dataset_key is not None:
+            rows = conn.execute("SELECT desc_file FROM datasets WHERE dataset_key = ? AND desc_file IS NOT NULL "
+                                "ORDER BY updated DESC", (dataset_key,)).fetchall()
+            for (desc_file,) in rows:
+                if os.path.exists(desc_file):
+                    return desc_file
+
+        # préfixe : le nom le plus court gagne, "titanic" préfère "titanic_..." à "titanic2_..."
+        row = conn.execute("SELECT file_name FROM description_files WHERE rep = ? AND stem >= ? AND stem < ? "
+                           "ORDER BY length(stem), file_name", (rep, base_name, base_name + "\U0010ffff")).fetchone()
+        return os.path.join(rep, row[0]) if row is not None else None
+
+
+# associe un dataset (nom et empreinte du contenu) à ses fichiers dérivés
+def register_dataset(cfg, dataset_file_name, dataset_key, desc_file=None, profile_file=None, cache_file=None):
+    with closing(_connect(cfg)) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO datasets "
+                     "(dataset_name, dataset_key, desc_file, profile_file, cache_file, updated) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     (os.path.basename(dataset_file_name), dataset_key, desc_file, profile_file, cache_file,
+                      time.time()))
+
+
+# empreinte d'un fichier sur disque, recalculée seulement si sa taille ou sa date de modification change
+def get_file_key(cfg, dataset_path):
+    # import à l'usage : la page d'accueil liste les sessions et les datasources sans charger pyarrow
+    from utils.dataset_cache import get_file_dataset_key
+
+    path = os.path.abspath(dataset_path)
+    stat = os.stat(path)
+    with closing(_connect(cfg)) as conn:
+        row = conn.execute("SELECT dataset_key FROM file_keys WHERE path = ? AND mtime = ? AND size = ?",
+                           (path, stat.st_mtime, stat.st_size)).fetchone()
+        if row is not None:
+            return row[0]
+        dataset_key = get_file_dataset_key(path)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO file_keys (path, mtime, size, dataset_key) VALUES (?, ?, ?, ?)",
+                         (path, stat.st_mtime, stat.st_size, dataset_key))
+    return dataset_key
+
+
+def list_datasources(rep="./datasources"):
+    return sorted(f for f in os.listdir(rep) if f.lower().endswith(DATASET_EXTENSIONS))
+
+
+# {desc_file, profile_file, cache_file} d'un dataset déjà enregistré, None sinon
+def get_dataset_entry(cfg, dataset_file_name, dataset_key):
+    with closing(_connect(cfg)) as conn:
+        row = conn.execute("SELECT desc_file, profile_file, cache_file FROM datasets "
+                           "WHERE dataset_name = ? AND dataset_key = ?",
+                           (os.path.basename(dataset_file_name), dataset_key)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(("desc_file", "profile_file", "cache_file"), row))
+
+
+# types des colonnes de feuilles Excel déjà lues : {feuille: {colonne: dtype}}
+def get_sheet_schemas(cfg, workbook_key, sheets):
+    with closing(_connect(cfg)) as conn:
+        rows = conn.execute(f"SELECT sheet, schema FROM sheet_schemas WHERE workbook_key = ? "
+                            f"AND sheet IN ({', '.join('?' * len(sheets))})", (workbook_key, *sheets)).fetchall()
+    return {sheet: json.loads(schema) for sheet, schema in rows}
+
+
+def store_sheet_schemas(cfg, workbook_key, schemas):
+    with closing(_connect(cfg)) as conn, conn:
+        conn.executemany("INSERT OR REPLACE INTO sheet_schemas (workbook_key, sheet, schema) VALUES (?, ?, ?)",
+                         [(workbook_key, sheet, json.dumps(schema)) for sheet, schema in schemas.items()])
+
+
+# questions préparées par warm_up.py dont la réponse est en cache, dans l'ordre de génération
+def get_suggestions(cfg, dataset_key):
+    with closing(_connect(cfg)) as conn:
+        rows = conn.execute("SELECT question FROM suggestions WHERE dataset_key = ? AND status = 'ready' "
+                            "ORDER BY position", (dataset_key,)).fetchall()
+    return [question for question, in rows]
+
+
+# remplace les questions préparées d'un dataset : [{question, status (ready, error), seconds}]
+def store_suggestions(cfg, dataset_key, suggestions):
+    now = time.time()
+    with closing(_connect(cfg)) as conn, conn:
+        conn.execute("DELETE FROM suggestions WHERE dataset_key = ?", (dataset_key,))
+        conn.executemany("INSERT INTO suggestions (dataset_key, position, question, status, seconds, updated) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         [(dataset_key, position, s['question'], s['status'], s['seconds'], now)
+                          for position, s in enumerate(suggestions)])
+
+
+# Exemple d'utilisation
+if __name__ == "__main__":
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+    for target_filename in ("titanic.csv", "penguins.csv", "pinguins.csv"):
+        matching_file = find_description_file(config, "./datasources", target_filename)
+        if matching_file:
+            print(f"{target_filename} : fichier correspondant trouvé : {matching_file}")
+        else:
+            print(f"{target_filename} : aucun fichier correspondant trouvé.")
@@ -0,0 +1,182 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from pandasai.helpers.anonymizer import Anonymizer
+
+from utils.dataset_cache import get_cache_file
+
+# graine fixe : le même dataset donne toujours le même échantillon, donc le même prompt
+SAMPLE_SEED = 42
+KEY_COLUMN = "__sample_key__"
+
+
+def get_sample_file(cfg, dataset_key):
+    return get_cache_file(cfg, f"{dataset_key}_sample")
+
+
+# DataFrame en mémoire découpé en blocs de lignes (vues, sans copie)
+def frame_batches(df, batch_rows):
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows]
+
+
+# copie Arrow du cache lue par memory-map, convertie en pandas bloc par bloc
+def arrow_batches(cache_file, batch_rows):
+    table = feather.read_table(cache_file, memory_map=True)
+    for batch in table.to_batches(max_chunksize=batch_rows):
+        yield batch.to_pandas()
+
+
+# échantillon représentatif construit en un seul passage sur des blocs de lignes :
+# stratifié (une colonne de faible cardinalité), lignes atypiques (min/max des colonnes numériques,
+# valeurs manquantes) et réservoir aléatoire ; seules les lignes candidates sont conservées entre deux blocs
+class SampleBuilder:
+    def __init__(self, sample_rows):
+        self.sample_rows = sample_rows
+        # au plus la moitié de l'échantillon pour les strates
+        self.strata_budget = max(sample_rows // 2, 1)
+        self._rng = np.random.default_rng(SAMPLE_SEED)
+        self._dtypes = None
+        self._candidates = None
+        self._counts = {}
+        self._offset = 0
+
+    def _numeric_columns(self, df):
+        return [column for column in df.columns
+                if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])]
+
+    # lignes qui peuvent encore entrer dans l'échantillon final ; appliqué au cumul candidats + bloc,
+    # le résultat est le même que sur toutes les lignes lues
+    def _candidate_rows(self, pool):
+        keys = pool[KEY_COLUMN]
+        ids = set(keys.nsmallest(self.sample_rows).index)
+        for column in self._numeric_columns(pool.drop(columns=KEY_COLUMN)):
+            values = pool[column]
+            if values.notna().any():
+                ids.update((values.idxmin(), values.idxmax()))
+        for column in pool.columns[pool.isna().any()]:
+            ids.add(pool.index[pool[column].isna()][0])
+        ordered = pool.sort_values(KEY_COLUMN, kind="stable")
+        for column in self._counts:
+            ids.update(ordered.groupby(column, observed=True, sort=False).head(self.strata_budget).index)
+        return pool.loc[sorted(ids)]
+
+    def add(self, batch):
+        if batch.empty:
+            return
+        if self._dtypes is None:
+            self._dtypes = batch.dtypes
+            # colonnes de stratification possibles : catégories, textes, booléens
+            self._counts = {column: pd.Series(dtype="int64") for column in batch.columns
+                            if batch[column].dtype.name in ("category", "object", "bool")}
+        batch = batch.set_axis(pd.RangeIndex(self._offset, self._offset + len(batch)))
+        batch = batch.assign(**{KEY_COLUMN: self._rng.random(len(batch))})
+        self._offset += len(batch)
+
+        for column in list(self._counts):
+            counts = batch[column].value_counts()
+            counts = self._counts[column].add(counts[counts > 0], fill_value=0)
+            if len(counts) > self.strata_budget:
+                # trop de valeurs distinctes pour une strate par valeur
+                del self._counts[column]
+            else:
+                self._counts[column] = counts
+
+        pool = batch if self._candidates is None else pd.concat([self._candidates, batch])
+        self._candidates = self._candidate_rows(pool)
+
+    # une ligne par strate de la colonne la plus détaillée, le reste du budget réparti proportionnellement
+    def _stratified(self, ordered):
+        columns = [column for column, counts in self._counts.items() if len(counts) > 1]
+        if not columns:
+            return []
+        column = max(columns, key=lambda c: len(self._counts[c]))
+        counts = self._counts[column].sort_values(ascending=False)
+        extra = self.strata_budget - len(counts)
+        ids = []
+        for value, count in counts.items():
+            allocated = 1 + int(extra * count / counts.sum())
+            ids.extend(ordered.index[ordered[column] == value][:allocated])
+        return ids
+
+    # extrêmes classés par écart à la médiane (en intervalles interquartiles, estimés sur le réservoir) :
+    # les vraies valeurs aberrantes passent avant les bornes d'un identifiant, puis les valeurs manquantes
+    def _anomalies(self, candidates, reservoir):
+        scored = []
+        for column in self._numeric_columns(candidates.drop(columns=KEY_COLUMN)):
+            values = candidates[column]
+            if values.notna().any():
+                q1, median, q3 = reservoir[column].astype("float64").quantile([0.25, 0.5, 0.75])
+                spread = (q3 - q1) or 1.0
+                for row_id in (values.idxmin(), values.idxmax()):
+                    score = abs(float(values[row_id]) - median) / spread
+                    scored.append((0.0 if np.isnan(score) else score, row_id))
+        ids = [row_id for _, row_id in sorted(scored, key=lambda item: item[0], reverse=True)]
+        for column in candidates.columns[candidates.isna().any()]:
+            ids.append(candidates.index[candidates[column].isna()][0])
+        return ids
+
+    # lignes des trois groupes prises à tour de rôle : les premières lignes (seules envoyées au LLM)
+    # contiennent déjà une strate, un extrême et une ligne aléatoire
+    def result(self):
+        if self._candidates is None:
+            return None
+        ordered = self._candidates.sort_values(KEY_COLUMN, kind="stable")
+        reservoir = ordered.head(self.sample_rows)
+        groups = [self._stratified(ordered), self._anomalies(self._candidates, reservoir), list(ordered.index)]
+        ids, seen = [], set()
+        while len(ids) < min(self.sample_rows, len(ordered)):
+            for group in groups:
+                while group and group[0] in seen:
+                    group.pop(0)
+                if group and len(ids) < self.sample_rows:
+                    seen.add(group[0])
+                    ids.append(group.pop(0))
+        sample = self._candidates.loc[ids].drop(columns=KEY_COLUMN).reset_index(drop=True)
+        # types d'origine : les blocs Arrow n'ont pas forcément les mêmes catégories
+        for column, dtype in self._dtypes.items():
+            if sample[column].dtype != dtype:
+                try:
+                    sample[column] = sample[column].astype("category" if dtype.name == "category" else dtype)
+                except (TypeError, ValueError):
+                    pass
+        return sample
+
+
+def _store_sample(sample_file, sample):
+    tmp_file = f"{sample_file}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        feather.write_feather(sample, tmp_file, compression="uncompressed")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return
+    os.replace(tmp_file, sample_file)
+
+
+# échantillon représentatif du dataset, calculé une fois par empreinte et conservé à côté du cache Arrow
+# get_batches() fournit les blocs de lignes (DataFrames) et n'est appelé que si l'échantillon est à calculer
+def get_sample(cfg, dataset_key, get_batches):
+    sample_file = get_sample_file(cfg, dataset_key)
+    if os.path.exists(sample_file):
+        try:
+            return feather.read_table(sample_file).to_pandas()
+        except (OSError, pa.ArrowInvalid):
+            os.remove(sample_file)
+    builder = SampleBuilder(cfg['sample_rows'])
+    for batch in get_batches():
+        builder.add(batch)
+    sample = builder.result()
+    if sample is not None:
+        _store_sample(sample_file, sample)
+    return sample
+
+
+# aperçu transmis au LLM : premières lignes de l'échantillon, données personnelles anonymisées
+# (comme l'échantillonnage par défaut de pandasai, qui relit tout le dataset à chaque prompt)
+def get_prompt_head(sample):
+    return Anonymizer.anonymize_dataframe_head(sample)
@@ -0,0 +1,274 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import openpyxl
+import pandas as pd
+import streamlit
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+from pandas.io.parsers import TextParser
+
+from utils.dataset_registry import get_sheet_schemas, store_sheet_schemas
+from utils.ingestion import downcast_numeric, find_categorical_columns, get_memory_usage
+
+# moteur Rust, bien plus rapide qu'openpyxl, utilisé s'il est installé (pip install python-calamine)
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# types de cellule lus directement ; les autres (dates ISO "d", formules texte "str", erreurs "e") passent par openpyxl
+XLSX_CELL_TYPES = {"n", "s", "b", "inlineStr"}
+
+
+# cellule que la lecture directe ne convertit pas comme openpyxl : la feuille est relue avec openpyxl
+class UnsupportedCellError(ValueError):
+    pass
+
+
+def _is_xls(file_name):
+    return file_name.lower().endswith(".xls")
+
+
+def _open_source(source):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+# feuilles du classeur avec leurs dimensions, lues dans les métadonnées sans parser les cellules
+# source : chemin ou contenu (bytes) du fichier
+def list_sheets(source, file_name):
+    if _is_xls(file_name):
+        return [{"name": name, "rows": None, "columns": None}
+                for name in pd.ExcelFile(_open_source(source)).sheet_names]
+    workbook = openpyxl.load_workbook(_open_source(source), read_only=True)
+    try:
+        return [{"name": sheet.title, "rows": sheet.max_row, "columns": sheet.max_column}
+                for sheet in workbook.worksheets]
+    finally:
+        workbook.close()
+
+
+# empreinte d'une sélection de feuilles ; sans sélection (première feuille), celle du classeur
+def get_sheets_key(workbook_key, sheets=None):
+    if not sheets:
+        return workbook_key
+    return hashlib.sha256(json.dumps([workbook_key, sheets]).encode("utf-8")).hexdigest()
+
+
+# chemin de chaque feuille dans l'archive xlsx et calendrier des dates (1900 ou 1904)
+def _sheet_paths(archive):
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    relations = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in relations.iter(f"{PACKAGE_REL_NS}Relationship")}
+    paths = {}
+    for sheet in workbook.iter(f"{NS}sheet"):
+        target = targets[sheet.get(f"{REL_NS}id")]
+        paths[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+    properties = workbook.find(f"{NS}workbookPr")
+    date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+    return paths, CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+
+def _shared_strings(archive):
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    for _, elem in ET.iterparse(archive.open("xl/sharedStrings.xml")):
+        if elem.tag == f"{NS}si":
+            strings.append("".join(text.text or "" for text in elem.iter(f"{NS}t")))
+            elem.clear()
+    return strings
+
+
+# index des styles de cellule dont le format numérique est une date, et de ceux qui sont une durée ([h]:mm...)
+def _number_styles(archive):
+    if "xl/styles.xml" not in archive.namelist():
+        return set(), set()
+    styles = ET.fromstring(archive.read("xl/styles.xml"))
+    formats = dict(BUILTIN_FORMATS)
+    for number_format in styles.iter(f"{NS}numFmt"):
+        formats[int(number_format.get("numFmtId"))] = number_format.get("formatCode")
+    cell_formats = styles.find(f"{NS}cellXfs")
+    if cell_formats is None:
+        return set(), set()
+    date_styles, duration_styles = set(), set()
+    for index, xf in enumerate(cell_formats.findall(f"{NS}xf")):
+        number_format = formats.get(int(xf.get("numFmtId", 0)), "General")
+        if is_timedelta_format(number_format):
+            duration_styles.add(index)
+        elif is_date_format(number_format):
+            date_styles.add(index)
+    return date_styles, duration_styles
+
+
+# lecture en flux du XML de la feuille, sans créer d'objet par cellule : nombres, textes, booléens et dates
+# au format numérique ; UnsupportedCellError pour tout autre type de cellule ou une durée
+def _read_xlsx_rows(source, sheet):
+    cell_tag, value_tag, row_tag = f"{NS}c", f"{NS}v", f"{NS}row"
+    with zipfile.ZipFile(_open_source(source)) as archive:
+        paths, epoch = _sheet_paths(archive)
+        shared = _shared_strings(archive)
+        date_styles, duration_styles = _number_styles(archive)
+        rows, column_indexes = [], {}
+        for _, elem in ET.iterparse(archive.open(paths[sheet])):
+            if elem.tag != row_tag:
+                continue
+            row = []
+            for cell in elem:
+                if cell.tag != cell_tag:
+                    continue
+                reference = cell.get("r")
+                if reference is not None:
+                    # cellules vides absentes du XML : la position vient de la référence (B12...)
+                    letters = reference.rstrip("0123456789")
+                    column = column_indexes.get(letters)
+                    if column is None:
+                        column = column_indexes[letters] = column_index_from_string(letters) - 1
+                    row.extend([None] * (column - len(row)))
+                kind = cell.get("t", "n")
+                if kind not in XLSX_CELL_TYPES:
+                    raise UnsupportedCellError(f"cell type {kind} in {reference}")
+                value = None
+                if kind == "inlineStr":
+                    value = "".join(text.text or "" for text in cell.iter(f"{NS}t"))
+                else:
+                    for child in cell:
+                        if child.tag == value_tag:
+                            value = child.text
+                            break
+                    if value is not None:
+                        if kind == "n":
+                            value = float(value) if ("." in value or "E" in value or "e" in value) else int(value)
+                            style = cell.get("s")
+                            if style is not None and int(style) in duration_styles:
+                                raise UnsupportedCellError(f"duration in {reference}")
+                            if style is not None and int(style) in date_styles:
+                                value = from_excel(value, epoch)
+                        elif kind == "s":
+                            value = shared[int(value)]
+                        elif kind == "b":
+                            value = value == "1"
+                row.append(value)
+            rows.append(row)
+            elem.clear()
+    width = max((len(row) for row in rows), default=0)
+    return [row + [None] * (width - len(row)) for row in rows]
+
+
+def _read_openpyxl_rows(source, sheet):
+    workbook = openpyxl.load_workbook(_open_source(source), read_only=True, data_only=True)
+    try:
+        return [list(row) for row in workbook[sheet].iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+# lignes de la feuille, avec le moteur le plus rapide disponible : calamine, sinon lecture directe du XML,
+# sinon openpyxl pour les classeurs à la structure ou aux cellules inattendues
+def _read_rows(source, sheet):
+    if CalamineWorkbook is not None:
+        if isinstance(source, bytes):
+            workbook = CalamineWorkbook.from_filelike(io.BytesIO(source))
+        else:
+            workbook = CalamineWorkbook.from_path(source)
+        rows = workbook.get_sheet_by_name(sheet).to_python(skip_empty_area=False)
+    else:
+        try:
+            rows = _read_xlsx_rows(source, sheet)
+        except (KeyError, ValueError, ET.ParseError, zipfile.BadZipFile):
+            rows = _read_openpyxl_rows(source, sheet)
+    # lignes vides ignorées, comme pd.read_excel
+    return [row for row in rows if any(value is not None and value != "" for value in row)]
+
+
+def _convert(values, dtype):
+    if dtype == "category":
+        return pd.Categorical(values)
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(pd.Series(values, dtype=object))
+    if dtype == "object":
+        return pd.Series(values, dtype=object)
+    if dtype in ("int8", "int16"):
+        # schéma enregistré avant le passage des entiers à int32 au minimum
+        dtype = "int32"
+    return pd.to_numeric(pd.Series(values, dtype=object)).astype(dtype)
+
+
+# colonnes construites directement au type connu : ni inférence, ni recherche des catégories, ni réduction
+def _build_frame(rows, schema):
+    if len(rows[0]) != len(schema):
+        raise ValueError("Sheet columns changed")
+    columns = list(zip(*rows[1:])) if len(rows) > 1 else [()] * len(schema)
+    return pd.DataFrame({name: _convert(values, dtype) for (name, dtype), values in zip(schema.items(), columns)})
+
+
+# exécuté dans un processus du pool : (DataFrame typé, mémoire avant optimisation, schéma)
+def _load_sheet(source, file_name, sheet, schema, categorical_ratio):
+    if _is_xls(file_name):
+        df = pd.read_excel(_open_source(source), sheet_name=sheet)
+    else:
+        rows = _read_rows(source, sheet)
+        if not rows:
+            return pd.DataFrame(), 0, {}
+        if schema is not None:
+            try:
+                df = _build_frame(rows, schema)
+                return df, None, schema
+            except (ValueError, TypeError):
+                # contenu incompatible avec le schéma en cache : inférence complète
+                pass
+        # même analyse des valeurs que pd.read_excel
+        df = TextParser(rows, header=0).read()
+    mem_before = get_memory_usage(df)
+    for column in find_categorical_columns(df, categorical_ratio):
+        df[column] = df[column].astype('category')
+    df = downcast_numeric(df)
+    return df, mem_before, {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+
+
+@streamlit.cache_resource
+def get_excel_pool(workers):
+    # spawn : pas de fork d'un serveur multi-thread
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# lit une ou plusieurs feuilles (par défaut la première) ; plusieurs feuilles sont parsées en parallèle
+# et empilées avec une colonne "sheet" ; le schéma de chaque feuille est mis en cache par classeur
+# retourne (DataFrame, mémoire avant optimisation)
+def read_excel_file(source, file_name, cfg, sheets=None, workbook_key=None):
+    if hasattr(source, 'getvalue'):
+        source = source.getvalue()
+    if not sheets:
+        sheets = [list_sheets(source, file_name)[0]['name']]
+    schemas = get_sheet_schemas(cfg, workbook_key, sheets) if workbook_key else {}
+    jobs = [(source, file_name, sheet, schemas.get(sheet), cfg['ingest_categorical_ratio']) for sheet in sheets]
+    if len(jobs) > 1 and cfg['excel_workers'] > 1:
+        results = list(get_excel_pool(cfg['excel_workers']).map(_load_sheet, *zip(*jobs)))
+    else:
+        results = [_load_sheet(*job) for job in jobs]
+
+    if workbook_key:
+        # schéma nouveau, ou inféré à nouveau parce que le schéma en cache ne convenait plus
+        store_sheet_schemas(cfg, workbook_key, {sheet: schema for sheet, (_, _, schema) in zip(sheets, results)
+                                                if schema and schema != schemas.get(sheet)})
+    mem_before = sum(get_memory_usage(df) if before is None else before for df, before, _ in results)
+    if len(results) == 1:
+        return results[0][0], mem_before
+
+    frames = [df.assign(sheet=sheet) for sheet, (df, _, _) in zip(sheets, results)]
+    df = pd.concat(frames, ignore_index=True)
+    # catégories différentes d'une feuille à l'autre : la concaténation repasse en objet
+    categorical_columns = {column for frame in frames for column in frame.select_dtypes(include='category').columns}
+    for column in categorical_columns | {"sheet"}:
+        df[column] = df[column].astype('category')
+    return df, mem_before
@@ -1,37 +1,64 @@
-import streamlit as st
 import os
-from pathlib import Path
-import time
-import uuid
-
-
-def handle_query(sdf1):
-    prompt1 = st.session_state.input_text.strip()
-    if prompt1:
-        with st.spinner(text='Waiting for llm answer !!'):
-            try:
-                response = sdf1.chat(prompt1)
-            except Exception as e:
-                st.error(f"Error when calling LLM : {e}")
-                response = "An Error occurred. Please retry"
-
-        st.session_state.output_text = response
-        if response.endswith(".png"):
-            default_chart_path = Path("exports/charts/temp_chart.png")
-            final_chart_rep = "./exports/png/"
-            if os.path.exists(default_chart_path):
-                unique_file_path = final_chart_rep + get_unique_filename()
-                default_chart_path.rename(Path(unique_file_path))
-                response = unique_file_path
-
-        st.session_state.session_data.append({"question": prompt1, "answer": response})
-        st.session_state.show_envoyer_button = False
-        st.session_state.show_new_question_button = True
-
-
-# Generate a unique file name using a timestamp or UUID
-def get_unique_filename(prefix="chart", extension=".png"):
-
-    timestamp1 = time.strftime("%Y%m%d-%H%M%S")  # Timestamp for uniqueness
-    unique_id = uuid.uuid4().hex[:8]  # Short UUID for uniqueness
-    return f"{prefix}_{timestamp1}_{unique_id}{extension}"
+
+from utils.chart_artifacts import collect_chart
+from utils.metrics import record_pipeline_steps, span
+from utils.plan_cache import execute_plan, get_agent_lock, get_executed_code, store_plan
+from utils.response_cache import ERROR_PREFIX, get_cached_response, normalize_prompt, put_cached_response
+from utils.shared_cache import single_flight
+
+
+class LLMAnswerError(Exception):
+    pass
+
+
+# graphique déplacé vers le stockage définitif, puis réponse mise en cache
+def _store_answer(cfg, context_key, prompt1, response):
+    if isinstance(response, str) and response.endswith(".png") and os.path.exists(response):
+        with span(cfg, "chart_collect"):
+            response = collect_chart(cfg, response)
+    put_cached_response(cfg, context_key, prompt1, response)
+    return response
+
+
+# interroge le cache, puis le cache de plans, puis le LLM ; exécutable dans un thread, sans état Streamlit
+# retourne (réponse, obtenue sans appel au LLM)
+def answer_query(cfg, sdf1, prompt1, context_key):
+    with span(cfg, "query") as fields:
+        fields["cache_hit"] = False
+        with span(cfg, "cache_lookup"):
+            response = get_cached_response(cfg, context_key, prompt1)
+        if response is not None:
+            fields["cache_hit"] = True
+            return response, True
+
+        # même question déjà résolue sur un dataset de même schéma : son code est réexécuté sans LLM
+        response = None
+        if cfg['plan_cache_enabled']:
+            with span(cfg, "plan_execute") as plan_fields:
+                response = execute_plan(cfg, sdf1, prompt1)
+                plan_fields["plan_hit"] = response is not None
+        fields["plan_hit"] = response is not None
+        if response is not None:
+            return _store_answer(cfg, context_key, prompt1, response), True
+
+        # mode multi-réplicas : la même question posée en même temps ailleurs n'appelle le LLM qu'une fois
+        with single_flight(cfg, f"query:{context_key}:{normalize_prompt(prompt1)}", cfg['query_timeout_s']) as waited:
+            if waited:
+                response = get_cached_response(cfg, context_key, prompt1)
+                if response is not None:
+                    fields["cache_hit"] = True
+                    return response, True
+            # état de l'agent relu avant qu'une autre question ne le remplace
+            with get_agent_lock(sdf1):
+                with span(cfg, "chat"):
+                    response = sdf1.chat(prompt1)
+                record_pipeline_steps(cfg, sdf1)
+                code = get_executed_code(sdf1)
+            if isinstance(response, str) and response.startswith(ERROR_PREFIX):
+                # pandasai renvoie ses erreurs sous forme de texte, après ses propres corrections : on les remonte
+                # en échec du job, sans mise en cache
+                raise LLMAnswerError(response)
+            if cfg['plan_cache_enabled']:
+                store_plan(cfg, sdf1, prompt1, code)
+            return _store_answer(cfg, context_key, prompt1, response), False
+
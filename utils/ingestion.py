@@ -0,0 +1,129 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+PROBE_ROWS = 1000
+
+
+def get_memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+# entiers 64 bits en int32 si les valeurs le permettent, flottants en float32 seulement si les valeurs sont inchangées
+def downcast_numeric(df):
+    int32 = np.iinfo(np.int32)
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            # pas d'int8/int16 : numpy déborde sans erreur sur les sommes et produits du code généré par le LLM ;
+            # pas de types non signés : il pourrait faire des soustractions
+            if (series.dtype.itemsize > 4 and series.notna().any()
+                    and int32.min <= series.min() <= series.max() <= int32.max):
+                df[column] = series.astype(np.int32 if isinstance(series.dtype, np.dtype) else "Int32")
+        elif pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+            as_float32 = series.astype(np.float32)
+            if ((as_float32.astype(series.dtype) == series) | series.isna()).all():
+                df[column] = as_float32
+    return df
+
+
+# colonnes texte de faible cardinalité, décidées sur le premier bloc pour rester cohérent
+def find_categorical_columns(df, max_ratio):
+    columns = []
+    for column in df.select_dtypes(include='object').columns:
+        values = df[column].dropna()
+        if len(values) and values.nunique() / len(values) <= max_ratio:
+            columns.append(column)
+    return columns
+
+
+def _to_arrow(chunk, categorical_columns):
+    for column in categorical_columns:
+        if column in chunk.columns:
+            chunk[column] = chunk[column].astype('category')
+    try:
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # types mélangés dans une colonne objet : on la convertit en texte
+        for column in chunk.select_dtypes(include='object').columns:
+            chunk[column] = chunk[column].where(chunk[column].isna(), chunk[column].astype(str))
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+def _spill(cfg, tables):
+    spill_dir = cfg['ingest_spill_path']
+    if not os.path.exists(spill_dir):
+        os.makedirs(spill_dir, exist_ok=True)
+    spill_file = os.path.join(spill_dir, f"{uuid.uuid4().hex}.arrow")
+    feather.write_feather(pa.concat_tables(tables, promote_options="permissive"), spill_file,
+                          compression="uncompressed")
+    return spill_file
+
+
+# le DataFrame final est entièrement en mémoire : le budget borne la lecture, pas le résultat ; les blocs déversés
+# sont relus par memory-map et self_destruct libère chaque colonne Arrow dès sa conversion, le pic reste
+# proche de la taille du DataFrame
+def _combine(tables):
+    try:
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas(split_blocks=True,
+                                                                                self_destruct=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # schémas incompatibles entre blocs (colonne vide puis texte...) : pandas sait les unifier
+        return pd.concat([table.to_pandas() for table in tables], ignore_index=True)
+
+
+# lecture d'un CSV par blocs : chaque bloc est compacté en Arrow, puis déversé sur disque
+# dès que le budget mémoire est dépassé ; retourne le DataFrame et l'empreinte naïve estimée
+def read_csv_chunked(source, cfg):
+    budget = cfg['ingest_memory_budget_mb'] * 1024 * 1024
+    probe = pd.read_csv(source, nrows=PROBE_ROWS)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    bytes_per_row = max(get_memory_usage(probe) / max(len(probe), 1), 1)
+    # un bloc brut ne doit pas occuper plus du quart du budget
+    chunk_rows = max(int(budget / 4 / bytes_per_row), PROBE_ROWS)
+    categorical_columns = find_categorical_columns(probe, cfg['ingest_categorical_ratio'])
+
+    tables, spill_files = [], []
+    in_memory, nb_rows = 0, 0
+    try:
+        for chunk in pd.read_csv(source, chunksize=chunk_rows):
+            nb_rows += len(chunk)
+            table = _to_arrow(chunk, categorical_columns)
+            tables.append(table)
+            in_memory += table.nbytes
+            if in_memory > budget / 2:
+                spill_files.append(_spill(cfg, tables))
+                tables, in_memory = [], 0
+
+        # relecture par memory-map des blocs déversés : pas de copie en mémoire anonyme
+        tables = [feather.read_table(f, memory_map=True) for f in spill_files] + tables
+        df = _combine(tables) if tables else probe.iloc[0:0]
+    finally:
+        for spill_file in spill_files:
+            os.remove(spill_file)
+
+    return downcast_numeric(df), int(bytes_per_row * nb_rows)
+
+
+# point d'entrée commun à l'application et aux scripts : (DataFrame, mémoire avant, mémoire après)
+# sheets : feuilles Excel à lire (la première par défaut), workbook_key : empreinte du classeur pour le cache
+# des schémas
+def ingest_file(source, file_name, cfg, sheets=None, workbook_key=None):
+    # import différé : excel_ingestion réutilise les fonctions de typage de ce module
+    from utils.excel_ingestion import read_excel_file
+
+    extension = file_name.split('.')[-1].lower()
+    if extension == 'csv':
+        df, mem_before = read_csv_chunked(source, cfg)
+    elif extension in ('xls', 'xlsx'):
+        df, mem_before = read_excel_file(source, file_name, cfg, sheets, workbook_key)
+    else:
+        raise ValueError("Le fichier doit être au format CSV ou Excel (xls, xlsx).")
+    return df, mem_before, get_memory_usage(df)
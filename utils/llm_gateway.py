@@ -0,0 +1,297 @@
+import json
+import logging
+import random
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+import streamlit
+from requests.adapters import HTTPAdapter
+from pandasai.exceptions import PandasAIApiCallError
+from pandasai.helpers.request import Session
+from pandasai.llm import BambooLLM, BedrockClaude
+from pandasai.llm.base import LLM
+
+from utils.metrics import estimate_tokens, record
+
+logger = logging.getLogger(__name__)
+
+# codes d'erreur Bedrock et statuts HTTP signalant une saturation du service
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException",
+                    "ModelNotReadyException"}
+THROTTLING_STATUS = {429, 502, 503, 504}
+# pause d'un secours dont le client n'a pas pu être créé : il n'est plus utilisé par ce processus
+DISABLED = float("inf")
+
+
+class LLMThrottledError(Exception):
+    pass
+
+
+# seau à jetons : `rate` appels par seconde en moyenne, par rafales de `capacity` au plus
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    # délai avant le prochain jeton disponible
+    def wait_time(self):
+        with self._lock:
+            self._refill()
+            return max(1 - self._tokens, 0) / self.rate
+
+    # saturation signalée par le service : le débit est divisé par deux
+    def slow_down(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.rate / 2, self.base_rate / 16)
+
+    # succès : le débit remonte progressivement vers sa valeur configurée
+    def speed_up(self):
+        with self._lock:
+            self._refill()
+            self.rate = min(self.rate + self.base_rate / 10, self.base_rate)
+
+
+# session pandasai réutilisant un pool de connexions HTTP keep-alive au lieu d'une connexion par appel
+class PooledSession(Session):
+    def __init__(self, endpoint_url=None, api_key=None, pool_size=10):
+        super().__init__(endpoint_url=endpoint_url, api_key=api_key)
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+    def make_request(self, method, path, headers=None, params=None, data=None, json=None, timeout=300):
+        url = urljoin(self._endpoint_url, self._version_path + path)
+        if headers is None:
+            headers = {"Authorization": f"Bearer {self._api_key}", "Content-Type": "application/json"}
+        try:
+            response = self._http.request(method, url, headers=headers, params=params, data=data, json=json,
+                                          timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            raise PandasAIApiCallError(f"Request failed: {e}") from e
+        if response.status_code in THROTTLING_STATUS:
+            raise LLMThrottledError(f"bamboo: HTTP {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            # corps d'erreur non JSON (page du proxy, texte brut)
+            raise PandasAIApiCallError(f"HTTP {response.status_code}: {response.text[:200]}")
+        if response.status_code not in [200, 201]:
+            raise PandasAIApiCallError(data.get("message", response.text))
+        return data
+
+
+def create_bamboo_llm(conf):
+    from api_keys import PANDASAI_API_KEY
+
+    llm = BambooLLM(endpoint_url=conf['bamboo_endpoint_url'], api_key=PANDASAI_API_KEY)
+    llm._session = PooledSession(conf['bamboo_endpoint_url'], PANDASAI_API_KEY, conf['llm_pool_size'])
+    return llm
+
+
+def create_bedrock_llm(conf):
+    import boto3
+    from botocore.config import Config as BotoConfig
+
+    session = boto3.Session(profile_name=conf['aws_user'])
+    # pool de connexions dimensionné pour les appels concurrents ; les reprises sont gérées par la passerelle
+    boto_config = BotoConfig(max_pool_connections=conf['llm_pool_size'], tcp_keepalive=True,
+                             retries={"mode": "standard", "max_attempts": 1})
+    bedrock_client = session.client('bedrock-runtime', region_name=conf['aws_region'],
+                                    endpoint_url=conf['bedrock_endpoint_url'], config=boto_config)
+    return BedrockClaude(
+        bedrock_runtime_client=bedrock_client,
+        model=conf['aws_model'],
+        max_tokens=conf['llm_max_tokens'],
+        temperature=conf['llm_temperature']
+    )
+
+
+def create_stub_llm(conf):
+    from utils.stub_llm import StubLLM
+
+    return StubLLM()
+
+
+BACKEND_FACTORIES = {"bamboo": create_bamboo_llm, "bedrock": create_bedrock_llm, "stub": create_stub_llm}
+
+
+def _is_throttling(error):
+    if isinstance(error, LLMThrottledError):
+        return True
+    # botocore : response est un dict ; requests : un objet Response, ou None
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_CODES
+
+
+class _Backend:
+    def __init__(self, name, conf):
+        self.name = name
+        self.conf = conf
+        self.bucket = TokenBucket(conf['llm_rate_per_minute'] / 60, conf['llm_burst'])
+        self.slots = threading.BoundedSemaphore(conf['llm_max_concurrency'])
+        self.blocked_until = 0
+        self._llm = None
+        self._lock = threading.Lock()
+
+    # le client n'est créé qu'au premier appel, un secours mal configuré ne bloque pas le backend principal
+    def get_llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = BACKEND_FACTORIES[self.name](self.conf)
+            return self._llm
+
+
+# LLM pandasai qui répartit les appels entre le backend configuré et son secours,
+# avec limitation de débit, concurrence bornée et reprises sur saturation
+class LLMGateway(LLM):
+    def __init__(self, conf, backends=None):
+        self._conf = conf
+        names = backends or [conf['llm_backend']] + ([conf['llm_fallback']] if conf['llm_fallback'] else [])
+        self._backends = [_Backend(name, conf) for name in names]
+        self.max_retries = conf['llm_max_retries']
+        self.retry_backoff = conf['llm_retry_backoff_s']
+        self.queue_timeout = conf['llm_queue_timeout_s']
+        self.last_backend = None
+
+    @property
+    def type(self) -> str:
+        return f"gateway-{self._backends[0].name}"
+
+    # premier backend disponible : pas en pause, une place libre et un jeton dans le seau ;
+    # si tous sont saturés, attend le prochain jeton jusqu'à queue_timeout
+    def _acquire_backend(self):
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            now = time.monotonic()
+            waits = []
+            for backend in self._backends:
+                if backend.blocked_until > now:
+                    waits.append(backend.blocked_until - now)
+                    continue
+                if not backend.slots.acquire(blocking=False):
+                    continue
+                if backend.bucket.try_acquire():
+                    return backend
+                backend.slots.release()
+                waits.append(backend.bucket.wait_time())
+            if now >= deadline:
+                return None
+            time.sleep(min(min(waits, default=0.05), 0.5, deadline - now))
+
+    def call(self, instruction, context=None) -> str:
+        last_error = None
+        attempt = 0
+        while attempt <= self.max_retries:
+            backend = self._acquire_backend()
+            if backend is None:
+                raise LLMThrottledError(f"all LLM backends saturated for {self.queue_timeout} s")
+            try:
+                llm = backend.get_llm()
+            except Exception as e:
+                backend.slots.release()
+                if backend is self._backends[0]:
+                    raise
+                # secours non configuré (identifiants, paquet absent) : écarté, on attend le backend principal
+                logger.warning("LLM fallback %s disabled: %s", backend.name, e)
+                backend.blocked_until = DISABLED
+                continue
+            start = time.perf_counter()
+            try:
+                response = llm.call(instruction, context)
+                record(self._conf, "llm_call", time.perf_counter() - start, backend=backend.name,
+                       prompt_tokens=estimate_tokens(instruction.to_string()),
+                       completion_tokens=estimate_tokens(response))
+                backend.bucket.speed_up()
+                self.last_prompt = getattr(llm, "last_prompt", None)
+                self.last_backend = backend.name
+                return response
+            except Exception as e:
+                # erreur sans autre backend utilisable : remontée telle quelle
+                if not _is_throttling(e) and all(other is backend or other.blocked_until == DISABLED
+                                                 for other in self._backends):
+                    raise
+                # saturation ou panne : pause du backend, l'appel suivant part sur un autre backend
+                logger.warning("LLM backend %s unavailable: %s", backend.name, e)
+                record(self._conf, "llm_call", time.perf_counter() - start, backend=backend.name, error=True)
+                backend.bucket.slow_down()
+                # attente exponentielle avec gigue, pour ne pas relancer toutes les sessions ensemble
+                backend.blocked_until = time.monotonic() + self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1)
+                last_error = e
+            finally:
+                backend.slots.release()
+            attempt += 1
+        raise LLMThrottledError(f"LLM call failed after {self.max_retries + 1} attempts: {last_error}")
+
+
+@streamlit.cache_resource
+def get_llm_gateway(conf):
+    return LLMGateway(conf)
+
+
+# Exemple d'utilisation : appels concurrents vers un serveur local simulant l'API Bamboo
+# (python -m utils.llm_gateway)
+if __name__ == "__main__":
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from pandasai.prompts.base import BasePrompt
+
+    class StubHandler(BaseHTTPRequestHandler):
+        calls = 0
+
+        def do_POST(self):
+            StubHandler.calls += 1
+            self.rfile.read(int(self.headers['Content-Length']))
+            # une requête sur quatre est refusée comme le ferait un service saturé
+            status = 429 if StubHandler.calls % 4 == 0 else 200
+            body = json.dumps({"data": "result = {'type': 'number', 'value': 1}", "message": "throttled"})
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    class StubPrompt(BasePrompt):
+        template = "stub"
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.setdefault("PANDASAI_API_KEY", "stub")
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+    config.update(bamboo_endpoint_url=f"http://127.0.0.1:{server.server_port}", llm_fallback=None,
+                  llm_rate_per_minute=1200, llm_retry_backoff_s=0.05)
+    gateway = LLMGateway(config)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda _: gateway.call(StubPrompt()), range(40)))
+    print(f"{len(results)} responses, {StubHandler.calls} requests in {time.time() - start:.2f} s")
+    server.shutdown()
@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+from utils.shared_cache import file_lock, hold_lock
+
+QUANTILES = [0.5, 0.95]
+# estimation du nombre de tokens quand le backend ne le renvoie pas
+CHARS_PER_TOKEN = 4
+# mesures les plus récentes retenues par étape pour les quantiles de l'export Prometheus
+PROMETHEUS_WINDOW = 10000
+TOKEN_FIELDS = (("prompt_tokens", "Estimated prompt tokens sent to the LLM."),
+                ("completion_tokens", "Estimated completion tokens returned by the LLM."))
+
+_lock = threading.Lock()
+# export Prometheus en attente dans ce processus, date du dernier export, verrou du réplica exportateur
+_prometheus = {"pending": False, "last": 0.0, "lock": None}
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def _rotate(cfg, metrics_path):
+    if os.path.getsize(metrics_path) > cfg['metrics_max_mb'] * 1024 * 1024:
+        # verrou entre processus : un seul réplica renomme le fichier, la taille est relue sous le verrou
+        with file_lock(metrics_path):
+            if os.path.exists(metrics_path) and os.path.getsize(metrics_path) > cfg['metrics_max_mb'] * 1024 * 1024:
+                # une seule génération d'historique est conservée
+                os.replace(metrics_path, f"{metrics_path}.1")
+
+
+# une mesure = une ligne JSON ; écriture en mode append, sûre entre threads et processus
+def record(cfg, stage, seconds, **fields):
+    metrics_path = cfg['metrics_path']
+    line = json.dumps({"ts": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 4), **fields},
+                      ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        metrics_dir = os.path.dirname(metrics_path)
+        if metrics_dir and not os.path.exists(metrics_dir):
+            os.makedirs(metrics_dir, exist_ok=True)
+        with open(metrics_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        _rotate(cfg, metrics_path)
+        _schedule_prometheus(cfg)
+
+
+# au plus un export toutes les metrics_prometheus_interval_s secondes, dans un thread : la mesure qui le
+# déclenche et celles qui suivent pendant l'attente y figurent ; appelé sous _lock
+def _schedule_prometheus(cfg):
+    if _prometheus["pending"]:
+        return
+    _prometheus["pending"] = True
+    delay = max(_prometheus["last"] + cfg['metrics_prometheus_interval_s'] - time.monotonic(), 0)
+    timer = threading.Timer(delay, _export_prometheus, args=(cfg,))
+    timer.daemon = True
+    timer.start()
+
+
+# seul le réplica qui détient le verrou de l'export écrit le fichier : les autres ne relisent pas les mesures
+def _export_prometheus(cfg):
+    with _lock:
+        _prometheus.update(pending=False, last=time.monotonic())
+    try:
+        if _prometheus["lock"] is None:
+            prometheus_dir = os.path.dirname(cfg['metrics_prometheus_path'])
+            if prometheus_dir and not os.path.exists(prometheus_dir):
+                os.makedirs(prometheus_dir, exist_ok=True)
+            _prometheus["lock"] = hold_lock(cfg['metrics_prometheus_path'])
+            if _prometheus["lock"] is None:
+                return
+        write_prometheus(cfg, _totals)
+    except OSError:
+        # export suivant à la prochaine mesure
+        pass
+
+
+# mesure la durée d'une étape ; le dictionnaire renvoyé permet d'ajouter des champs (cache_hit, tokens...)
+@contextmanager
+def span(cfg, stage, **fields):
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception:
+        fields["error"] = True
+        raise
+    finally:
+        record(cfg, stage, time.perf_counter() - start, **fields)
+
+
+# durées des étapes internes de pandasai (génération du prompt, du code, exécution...) de la dernière requête
+def record_pipeline_steps(cfg, sdf):
+    try:
+        # SmartDataframe (un dataset) ou Agent (espace de travail)
+        agent = getattr(sdf, "_agent", sdf)
+        steps = agent.pipeline.query_exec_tracker.get_summary()["steps"]
+    except (AttributeError, KeyError, RuntimeError):
+        return
+    for step in steps:
+        if "execution_time" in step:
+            record(cfg, f"pandasai.{step['type']}", step['execution_time'], success=step.get('success'))
+
+
+def read_metrics(cfg, since=None):
+    metrics_path = cfg['metrics_path']
+    rows = []
+    for path in (f"{metrics_path}.1", metrics_path):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # ligne en cours d'écriture par un autre processus
+                    continue
+    metrics = pd.DataFrame(rows, columns=sorted({key for row in rows for key in row} | {"ts", "stage", "seconds"}))
+    if since is not None:
+        metrics = metrics[metrics["ts"] >= since]
+    return metrics
+
+
+# nombre, p50, p95 et total par étape
+def summarize(metrics):
+    if metrics.empty:
+        return pd.DataFrame(columns=["stage", "count", "p50", "p95", "total"])
+    grouped = metrics.groupby("stage")["seconds"]
+    summary = grouped.quantile(QUANTILES).unstack()
+    summary.columns = [f"p{int(q * 100)}" for q in QUANTILES]
+    summary.insert(0, "count", grouped.count())
+    summary["total"] = grouped.sum()
+    return summary.round(4).reset_index()
+
+
+# agrégats cumulés des mesures pour l'export Prometheus : chaque export ne lit que les lignes ajoutées depuis
+# le précédent ; les compteurs ne repartent de zéro qu'au redémarrage du réplica exportateur (vu par Prometheus
+# comme une remise à zéro), les quantiles portent sur les PROMETHEUS_WINDOW dernières mesures de chaque étape
+class PrometheusTotals:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = False
+        self._inode = None
+        self._offset = 0
+        self.stages = {}
+        self.tokens = {}
+        self.queries = 0
+        self.hits = 0
+
+    def _add(self, row):
+        stage = self.stages.setdefault(row["stage"], {"count": 0, "sum": 0.0,
+                                                      "recent": deque(maxlen=PROMETHEUS_WINDOW)})
+        stage["count"] += 1
+        stage["sum"] += row["seconds"]
+        stage["recent"].append(row["seconds"])
+        for field, _ in TOKEN_FIELDS:
+            if field in row:
+                self.tokens[field] = self.tokens.get(field, 0) + int(row[field] or 0)
+        if row["stage"] == "query":
+            self.queries += 1
+            self.hits += bool(row.get("cache_hit"))
+
+    # lit path à partir de offset jusqu'à la dernière ligne complète ; retourne la nouvelle position
+    def _read(self, path, offset):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                self._add(json.loads(line))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+        return offset + end
+
+    def update(self, metrics_path):
+        rotated_path = f"{metrics_path}.1"
+        stat = os.stat(metrics_path) if os.path.exists(metrics_path) else None
+        if not self._started:
+            # premier export : l'historique conservé, puis le fichier courant
+            if os.path.exists(rotated_path):
+                self._read(rotated_path, 0)
+            self._started = True
+        elif stat is None or stat.st_ino != self._inode or stat.st_size < self._offset:
+            # rotation depuis l'export précédent : fin de l'ancien fichier, renommé en .1
+            if os.path.exists(rotated_path) and os.stat(rotated_path).st_ino == self._inode:
+                self._read(rotated_path, self._offset)
+            self._offset = 0
+        self._inode = stat.st_ino if stat is not None else None
+        if stat is not None:
+            self._offset = self._read(metrics_path, self._offset)
+
+    # format texte Prometheus (collecteur "textfile" de node_exporter)
+    def to_prometheus(self):
+        lines = ["# HELP pandasai_app_stage_seconds Duration of each processing stage.",
+                 "# TYPE pandasai_app_stage_seconds summary"]
+        for name, stage in sorted(self.stages.items()):
+            recent = pd.Series(stage["recent"], dtype=float)
+            for q in QUANTILES:
+                lines.append(f'pandasai_app_stage_seconds{{stage="{name}",quantile="{q}"}} '
+                             f'{round(recent.quantile(q), 4)}')
+            lines.append(f'pandasai_app_stage_seconds_sum{{stage="{name}"}} {round(stage["sum"], 4)}')
+            lines.append(f'pandasai_app_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        for field, help_text in TOKEN_FIELDS:
+            if field in self.tokens:
+                lines += [f"# HELP pandasai_app_{field}_total {help_text}",
+                          f"# TYPE pandasai_app_{field}_total counter", f"pandasai_app_{field}_total {self.tokens[field]}"]
+        if self.queries:
+            lines += ["# TYPE pandasai_app_cache_hits_total counter", f"pandasai_app_cache_hits_total {self.hits}",
+                      "# TYPE pandasai_app_cache_misses_total counter",
+                      f"pandasai_app_cache_misses_total {self.queries - self.hits}"]
+        return "\n".join(lines) + "\n"
+
+
+_totals = PrometheusTotals()
+
+
+# sans totals (ligne de commande), toutes les mesures conservées sont relues
+def write_prometheus(cfg, totals=None):
+    if totals is None:
+        totals = PrometheusTotals()
+    prometheus_dir = os.path.dirname(cfg['metrics_prometheus_path'])
+    if prometheus_dir and not os.path.exists(prometheus_dir):
+        os.makedirs(prometheus_dir, exist_ok=True)
+    with totals._lock:
+        totals.update(cfg['metrics_path'])
+        text = totals.to_prometheus()
+    tmp_path = f"{cfg['metrics_prometheus_path']}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, cfg['metrics_prometheus_path'])
+    return cfg['metrics_prometheus_path']
+
+
+# Exemple d'utilisation : python -m utils.metrics
+if __name__ == "__main__":
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+    print(summarize(read_metrics(config)).to_string(index=False))
+    print(f"Prometheus : {write_prometheus(config)}")
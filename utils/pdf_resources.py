@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fonts import SubsetMap
+from PIL import Image
+
+REPORT_FONTS = [
+    ("", "./assets/fonts/DejaVuSans.ttf"),
+    ("B", "./assets/fonts/dejavu-sans.bold.ttf"),
+    ("I", "./assets/fonts/dejavu-sans.oblique.ttf"),
+]
+MM_PER_INCH = 25.4
+
+_lock = threading.Lock()
+_font_templates = {}
+_image_sizes = {}
+
+
+def _mtime_key(path):
+    return os.path.abspath(path), os.path.getmtime(path)
+
+
+# polices analysées une seule fois par processus (table des largeurs, cmap, glyphes),
+# clé (chemin, mtime) : un fichier de police modifié est relu
+def _get_font_template(family, style, font_path):
+    key = (family, style) + _mtime_key(font_path)
+    with _lock:
+        template = _font_templates.get(key)
+        if template is None:
+            loader = FPDF()
+            loader.add_font(family, style, font_path)
+            template = _font_templates[key] = loader.fonts[f"{family.lower()}{style}"]
+        return template
+
+
+# chaque document garde son propre sous-ensemble de glyphes et son descripteur,
+# seules les métriques en lecture seule sont partagées
+def _clone_font(pdf, template):
+    font = copy.copy(template)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(template.ttffile, recalcTimestamp=False, fontNumber=0, lazy=True)
+    font.desc = copy.copy(template.desc)
+    font.missing_glyphs = []
+    identities = "\x00 \r\n"
+    if pdf.str_alias_nb_pages:
+        identities += "0123456789" + pdf.str_alias_nb_pages
+    font.subset = SubsetMap(font, [ord(char) for char in identities])
+    return font
+
+
+def add_report_fonts(pdf, family="DejaVu"):
+    for style, font_path in REPORT_FONTS:
+        template = _get_font_template(family, style, font_path)
+        pdf.fonts[f"{family.lower()}{style}"] = _clone_font(pdf, template)
+
+
+# dimensions lues dans l'en-tête de l'image, sans la décoder, et mises en cache
+def get_image_size(image_path):
+    key = _mtime_key(image_path)
+    size = _image_sizes.get(key)
+    if size is None:
+        with Image.open(image_path) as img:
+            size = _image_sizes[key] = img.size
+    return size
+
+
+# image réduite à sa taille d'impression et recompressée, mise en cache sur disque
+def get_print_image(cfg, image_path, width_mm):
+    target_width = int(width_mm / MM_PER_INCH * cfg['pdf_image_dpi'])
+    width, height = get_image_size(image_path)
+    if width <= target_width:
+        return image_path
+
+    abs_path, mtime = _mtime_key(image_path)
+    cache_key = hashlib.sha256(f"{abs_path}|{mtime}|{target_width}".encode("utf-8")).hexdigest()[:24]
+    cache_dir = cfg['pdf_image_cache_path']
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    is_jpeg = os.path.splitext(image_path)[1].lower() in (".jpg", ".jpeg")
+    cached_path = os.path.join(cache_dir, f"{cache_key}{'.jpeg' if is_jpeg else '.png'}")
+    try:
+        # l'accès met à jour la date de modification, utilisée pour l'éviction
+        os.utime(cached_path)
+        return cached_path
+    except FileNotFoundError:
+        pass
+
+    target_height = max(int(height * target_width / width), 1)
+    with Image.open(image_path) as img:
+        resized = img.resize((target_width, target_height), Image.LANCZOS)
+    tmp_path = f"{cached_path}.{uuid.uuid4().hex[:8]}.tmp"
+    if is_jpeg:
+        resized.convert("RGB").save(tmp_path, format="JPEG", quality=85, optimize=True)
+    else:
+        resized.save(tmp_path, format="PNG", optimize=True)
+    os.replace(tmp_path, cached_path)
+    _image_sizes[_mtime_key(cached_path)] = (target_width, target_height)
+    evict_print_images(cfg, keep=cached_path)
+    return cached_path
+
+
+# supprime les images non utilisées depuis pdf_image_cache_ttl_hours, puis les moins récemment utilisées
+# jusqu'à respecter pdf_image_cache_max_mb ; keep : image que le rapport en cours va insérer
+def evict_print_images(cfg, keep=None):
+    cache_dir = cfg['pdf_image_cache_path']
+    min_mtime = time.time() - cfg['pdf_image_cache_ttl_hours'] * 3600
+    max_size = cfg['pdf_image_cache_max_mb'] * 1024 * 1024
+    entries = []
+    for file_name in os.listdir(cache_dir):
+        image_path = os.path.join(cache_dir, file_name)
+        if file_name.endswith(".tmp") or image_path == keep:
+            continue
+        try:
+            stat = os.stat(image_path)
+            if stat.st_mtime < min_mtime:
+                os.remove(image_path)
+                continue
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, image_path))
+
+    total_size = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+    for _, size, image_path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(image_path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
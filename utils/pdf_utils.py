@@ -1,14 +1,24 @@
 import datetime
+import math
 import os
 import json
-from PIL import Image
+import uuid
 from fpdf import FPDF, FPDFException
 from fpdf.enums import XPos, YPos
 from textwrap import wrap
 import pandas as pd
 
+from utils.metrics import span
+from utils.pdf_resources import add_report_fonts, get_image_size, get_print_image
+from utils.result_store import StoredResult, read_result_head
+from utils.shared_cache import reserve_path
+
 
 class CustomPDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.glyph_widths_cache = {}
+
     def footer(self):
         # à 15mm du bas
         self.set_y(-15)
@@ -30,68 +40,128 @@ class CustomPDF(FPDF):
         self.set_font("DejaVu", size=8)
         self.cell(0, 5, f'Page {self.page_no()}', 0, new_x=XPos.RIGHT, new_y=YPos.TOP, align="C")
 
-    def create_table(self, dataframe):
-        # Définir la largeur des colonnes
-        col_width = self.w / (len(dataframe.columns) + 1)
-        row_height = 7
-        line_height = 5
+    def _text_widths(self, values):
+        # table des largeurs de glyphes, par police et taille, remplie à la demande
+        font_key = (self.font_family, self.font_style, self.font_size_pt)
+        glyph_widths = self.glyph_widths_cache.setdefault(font_key, {})
+        widths = {}
+        for text in values:
+            width = 0
+            for char in text:
+                char_width = glyph_widths.get(char)
+                if char_width is None:
+                    char_width = glyph_widths[char] = self.get_string_width(char)
+                width += char_width
+            widths[text] = width
+        return widths
 
-        # Ajouter l'entête du tableau
+    def _column_widths(self, cells):
+        # largeur de chaque chaîne distincte, calculée une seule fois par colonne
+        return {column: cells[column].map(self._text_widths(cells[column].unique())) for column in cells.columns}
+
+    def _draw_table_header(self, columns, col_widths, row_height):
         self.set_font("DejaVu", "B", size=7)
-        for column in dataframe.columns:
-            self.cell(col_width, row_height, txt=str(column), border=1, align='C')
+        for column, col_width in zip(columns, col_widths):
+            self.cell(col_width, row_height, text=str(column), border=1, align='C')
         self.ln(row_height)
+        self.set_font("DejaVu", size=7)
 
-        # Ajouter les lignes du tableau avec la gestion des hauteurs
+    # nb_total : nombre de lignes de la réponse complète quand seul son début est fourni
+    def create_table(self, dataframe, max_rows=200, max_cell_lines=4, nb_total=None):
+        row_height = 7
+        line_height = 4
+        nb_total = len(dataframe) if nb_total is None else nb_total
+        # les très grands tableaux sont tronqués : seul l'aperçu est mis en page
+        cells = dataframe.head(max_rows).astype(str)
+        columns = [str(column) for column in dataframe.columns]
+        # colonnes repérées par position : les noms dupliqués ne posent pas de problème
+        cells.columns = range(len(columns))
+        if not columns:
+            return
+
+        self.set_font("DejaVu", "B", size=7)
+        header_widths = self._text_widths(columns)
         self.set_font("DejaVu", size=7)
-        for _, row in dataframe.iterrows():
-            # calcul de la hauteur max
-            max_line_height = row_height
-            cell_values = []
-            for value in row:
-                text = str(value)
-                nb_lines = int(self.get_string_width(text) / col_width + 1)
-                max_line_height = max(max_line_height, line_height * nb_lines)
-                cell_values.append(text)
-
-            # rempli chaque cellule de la ligne avec Max
-            x_start = self.get_x()
-            y_start = self.get_y()
-            for value in row:
-                # Utiliser multi_cell pour gérer les cellules qui contiennent un long texte
+        text_widths = self._column_widths(cells)
+
+        # largeur naturelle : en-tête ou contenu le plus long (plafonné), ramenée à la largeur de page
+        padding = 2 * self.c_margin
+        natural = []
+        for column, name in zip(cells.columns, columns):
+            content_width = min(text_widths[column].max(), self.epw * 0.4) if len(cells) else 0
+            natural.append(max(header_widths[name], content_width) + padding)
+        col_widths = natural
+        if sum(natural) > self.epw:
+            # chaque colonne reçoit au plus une part égale, le reste va aux colonnes trop étroites
+            fair_share = self.epw / len(columns)
+            col_widths = [min(width, fair_share) for width in natural]
+            deficits = [width - col_width for width, col_width in zip(natural, col_widths)]
+            leftover = self.epw - sum(col_widths)
+            col_widths = [col_width + leftover * deficit / sum(deficits)
+                          for col_width, deficit in zip(col_widths, deficits)]
+
+        # nombre de lignes de chaque cellule, estimé sans appel à multi_cell
+        lines = {}
+        for column, col_width in zip(cells.columns, col_widths):
+            usable = max(col_width - padding, 1)
+            # marge de 15% pour le retour à la ligne sur les mots
+            nb_lines = (text_widths[column] / (usable * 0.85)).apply(math.ceil).clip(lower=1)
+            lines[column] = nb_lines.where(text_widths[column] > usable, 1).clip(upper=max_cell_lines)
+        row_lines = pd.DataFrame(lines).max(axis=1) if len(cells) else pd.Series(dtype=int)
+
+        self._draw_table_header(columns, col_widths, row_height)
+        for row_index, values in enumerate(cells.itertuples(index=False, name=None)):
+            height = max(row_height, line_height * int(row_lines.iloc[row_index]))
+            # saut de page géré ici : l'en-tête est répété sur chaque page
+            if self.get_y() + height > self.page_break_trigger:
+                self.add_page()
+                self._draw_table_header(columns, col_widths, row_height)
+
+            x_start, y_start = self.get_x(), self.get_y()
+            for column, value, col_width in zip(cells.columns, values, col_widths):
+                if text_widths[column].iloc[row_index] <= col_width - padding:
+                    self.cell(col_width, height, text=value, border=1, align='L')
+                    continue
+                max_chars = int(len(value) * (col_width - padding) * max_cell_lines * 0.85
+                                / text_widths[column].iloc[row_index])
+                if max_chars < len(value):
+                    value = value[:max(max_chars - 3, 1)] + "..."
+                x_cell = self.get_x()
+                self.rect(x_cell, y_start, col_width, height)
                 try:
-                    # Split the text into manageable chunks if too long for the cell width
-                    wrapped_text = "\n".join(wrap(str(value), width=int(col_width / self.get_string_width('A'))))
-                    self.multi_cell(col_width, line_height, txt=wrapped_text, border=1, align='L')
-                except FPDFException as e:
-                    self.set_font('DejaVu', size=10)  # Reduce font size as fallback
-                    self.multi_cell(col_width, line_height, txt=str(value), border=1, align='L')
+                    self.multi_cell(col_width, line_height, text=value, border=0, align='L')
+                except FPDFException:
+                    # colonne trop étroite pour un caractère : police réduite puis texte tronqué sur une ligne
+                    self.set_xy(x_cell, y_start)
+                    self.set_font("DejaVu", size=5)
+                    while len(value) > 1 and self.get_string_width(value) > col_width - padding:
+                        value = value[:-1]
+                    self.cell(col_width, line_height, text=value, border=0, align='L')
+                    self.set_font("DejaVu", size=7)
+                self.set_xy(x_cell + col_width, y_start)
+            self.set_xy(x_start, y_start + height)
 
-                x_start += col_width
-                # Revenir à la position de la cellule suivante sur la ligne
-                self.set_xy(x_start, y_start)
-                self.ln(max_line_height)
+        if nb_total > len(cells):
+            self.set_font("DejaVu", "I", size=7)
+            self.cell(0, row_height, text=f"Showing {len(cells)} of {nb_total} rows", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="L")
+            self.set_font("DejaVu", size=7)
 
 
-# génère un pdf
-def create_k_report_pdf(cfg, csv_file_name, q_a, df):
-    # print(q_a)
-    csv_basename = os.path.basename(csv_file_name)
+# ouvre le rapport : polices, logo et aperçu du dataset
+def start_report(cfg, csv_file_name, nb_ln, nb_col, col_list):
     pdf = CustomPDF(
         orientation=cfg['pdf_page_orientation'],
         unit=cfg['pdf_unit'],
         format=cfg['pdf_page_format']
     )
     pdf.set_auto_page_break(auto=True, margin=15)
-    # Ajouter une police Unicode
-    pdf.add_font("DejaVu", "", "./assets/fonts/DejaVuSans.ttf")
-    pdf.add_font("DejaVu", "B", "./assets/fonts/dejavu-sans.bold.ttf")
-    pdf.add_font("DejaVu", "I", "./assets/fonts/dejavu-sans.oblique.ttf")
+    # Ajouter une police Unicode (analysée une seule fois par processus)
+    add_report_fonts(pdf)
 
     pdf.set_font("DejaVu", size=12)
     pdf.add_page()
     logo_path = cfg['logo_path']
-    pdf.image(logo_path, x=(210 - 30) / 2, y=10, w=30)  # centré pour largeur logo 30
+    pdf.image(get_print_image(cfg, logo_path, 30), x=(210 - 30) / 2, y=10, w=30)  # centré pour largeur logo 30
 
     # Ajouter la date du jour
     pdf.set_y(31)  # Position sous le logo
@@ -117,13 +187,11 @@ def create_k_report_pdf(cfg, csv_file_name, q_a, df):
     pdf.set_font("DejaVu", size=12)
     pdf.cell(0, 10, text="Session QUERY/RESPONSE", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
     pdf.ln(10)  # Espacement
-    nb_ln, nb_col = df.shape
     pdf.cell(0, 10, text=f"Number of lines: {nb_ln}, Number of columns: {nb_col}")
     pdf.ln(10)
     pdf.cell(0, 10, text="Field titles", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="L")
     current_line = ""
     max_line_length = 76
-    col_list = list(df.columns)
     for col in col_list:
         # Ajouter le titre de la colonne à la ligne actuelle
         if len(current_line) + len(col) + 2 <= max_line_length:  # "+2" pour la virgule et l'espace
@@ -138,78 +206,99 @@ def create_k_report_pdf(cfg, csv_file_name, q_a, df):
         pdf.cell(0, 10, text=current_line.strip(", "), new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="L")
 
     pdf.ln(5)
-    for entry in q_a:
-        pdf.set_font("DejaVu", "B", size=12)
-        # Insérer une ligne bleue après chaque entrée
-        pdf.set_line_width(0.7)
-        pdf.set_draw_color(0, 0, 255)
-        pdf.line((210 - 30) / 2, pdf.get_y() + 5, (210 + 30) / 2, pdf.get_y() + 5)
-        pdf.ln(5)
-        pdf.set_draw_color(0, 0, 0)
+    return pdf
+
+
+# ajoute une question/réponse au rapport, dès que la réponse est connue
+def add_report_entry(pdf, cfg, entry):
+    pdf.set_font("DejaVu", "B", size=12)
+    # Insérer une ligne bleue après chaque entrée
+    pdf.set_line_width(0.7)
+    pdf.set_draw_color(0, 0, 255)
+    pdf.line((210 - 30) / 2, pdf.get_y() + 5, (210 + 30) / 2, pdf.get_y() + 5)
+    pdf.ln(5)
+    pdf.set_draw_color(0, 0, 0)
+
+    cell_width = pdf.w - pdf.l_margin - pdf.r_margin - 2
+
+    pdf.set_font("DejaVu", 'B', size=12)
+    pdf.set_x(pdf.l_margin + 2)
+    pdf.cell(0, 10, align="L", text="Question :")
+    pdf.ln(6)
+    pdf.set_x(pdf.l_margin + 2)
+    pdf.set_font("DejaVu", size=10)
+    try:
+        wrapped_question = "\n".join(wrap(entry['question'], width=80))
+        pdf.multi_cell(cell_width, 10, text=wrapped_question, align="L")
+    except FPDFException as e:
+        pdf.set_font('DejaVu', size=10)  # Fallback to smaller font for long questions
+        pdf.multi_cell(0, 10, text=f"Question: {entry['question']}", align="L")
+
+    pdf.set_font("DejaVu", size=12)
+
+    if isinstance(entry['answer'], str) and entry['answer'].endswith(".png"):
+        image_path = entry['answer']
+        pdf.set_x(pdf.l_margin + 2)
+        pdf.multi_cell(cell_width, 10, text="Answer: See the chart below.")
+        image_width, image_height = get_image_size(image_path)
+        image_height = 70 * image_height / image_width
+        available_height = 297 - pdf.get_y() - 15
+        # print("available: ", available_height, "logo-height : ", image_height, "y : ", pdf.get_y())
+        # Si l'espace disponible est insuffisant, passer à une nouvelle page
+        if available_height < image_height + 5:
+            # pdf.ln(available_height + 20)
+            pdf.add_page()
 
-        cell_width = pdf.w - pdf.l_margin - pdf.r_margin - 2
+        pdf.image(get_print_image(cfg, image_path, 70), x=10, y=pdf.get_y(), w=70)  # Ajuster la largeur pour s'adapter à la page
+        # Calculer la hauteur de l'image et décaler en conséquence
+        pdf.ln(image_height + 5)
 
+    elif isinstance(entry['answer'], (pd.DataFrame, StoredResult)):
         pdf.set_font("DejaVu", 'B', size=12)
         pdf.set_x(pdf.l_margin + 2)
-        pdf.cell(0, 10, align="L", text="Question :")
-        pdf.ln(6)
+        pdf.cell(0, 10, align="L", text="Answer :")
+        pdf.ln(10)
+        if isinstance(entry['answer'], StoredResult):
+            # seules les lignes imprimées sont relues dans le magasin de résultats
+            table = read_result_head(cfg, entry['answer'], cfg['pdf_table_max_rows'])
+            if table is None:
+                pdf.set_font("DejaVu", size=10)
+                pdf.set_x(pdf.l_margin + 2)
+                pdf.cell(0, 10, align="L", text=f"{entry['answer']} : no longer available")
+                pdf.ln(10)
+            else:
+                pdf.create_table(table, max_rows=cfg['pdf_table_max_rows'], nb_total=entry['answer'].rows)
+        else:
+            pdf.create_table(entry['answer'], max_rows=cfg['pdf_table_max_rows'])
+        pdf.set_font("DejaVu", size=12)
+        pdf.ln(5)
+
+    else:
+        pdf.set_font("DejaVu", 'B', size=12)
         pdf.set_x(pdf.l_margin + 2)
+        pdf.cell(0, 10, align="L", text="Answer :")
+        pdf.ln(6)
         pdf.set_font("DejaVu", size=10)
+        pdf.set_x(pdf.l_margin + 2)
+        answer = str(entry["answer"])
+        # print("answer", answer)
+        wrapped_answer = "\n".join(wrap(answer, width=76))
+        # print("wrapped_answer", wrapped_answer)
+        available_width = pdf.w - pdf.l_margin - pdf.r_margin
+        # print(f"Largeur disponible : {available_width}")
+        # print("largeur calculée: ", pdf.get_string_width(wrapped_answer))
+        pdf.set_x(pdf.l_margin + 2)
         try:
-            wrapped_question = "\n".join(wrap(entry['question'], width=80))
-            pdf.multi_cell(cell_width, 10, text=wrapped_question, align="L")
+            pdf.multi_cell(cell_width, 10, text=wrapped_answer, align="L" )
         except FPDFException as e:
-            pdf.set_font('DejaVu', size=10)  # Fallback to smaller font for long questions
-            pdf.multi_cell(0, 10, text=f"Question: {entry['question']}", align="L")
-
-        pdf.set_font("DejaVu", size=12)
-
-        if isinstance(entry['answer'], str) and entry['answer'].endswith(".png"):
-            image_path = entry['answer']
-            pdf.set_x(pdf.l_margin + 2)
-            pdf.multi_cell(cell_width, 10, text="Answer: See the chart below.")
-            image_height = 70 * (Image.open(image_path).height / Image.open(image_path).width)
-            available_height = 297 - pdf.get_y() - 15
-            # print("available: ", available_height, "logo-height : ", image_height, "y : ", pdf.get_y())
-            # Si l'espace disponible est insuffisant, passer à une nouvelle page
-            if available_height < image_height + 5:
-                # pdf.ln(available_height + 20)
-                pdf.add_page()
-
-            pdf.image(entry["answer"], x=10, y=pdf.get_y(), w=70)  # Ajuster la largeur pour s'adapter à la page
-            # Calculer la hauteur de l'image et décaler en conséquence
-            pdf.ln(image_height + 5)
-
-        elif isinstance(entry['answer'], pd.DataFrame):
-            pdf.set_font("DejaVu", 'B', size=12)
-            pdf.set_x(pdf.l_margin + 2)
-            pdf.cell(0, 10, align="L", text="Answer :")
-            pdf.ln(6)
-            df_string = entry['answer'].to_string(index=False)
-            pdf.multi_cell(cell_width, 10, text=df_string, align="L")
+            pdf.set_font('DejaVu', size=10)  # Fallback to smaller font for long responses
+            pdf.multi_cell(0, 10, txt=f"Response: {wrapped_answer}")
+        pdf.ln(5)
 
-        else:
-            pdf.set_font("DejaVu", 'B', size=12)
-            pdf.set_x(pdf.l_margin + 2)
-            pdf.cell(0, 10, align="L", text="Answer :")
-            pdf.ln(6)
-            pdf.set_font("DejaVu", size=10)
-            pdf.set_x(pdf.l_margin + 2)
-            answer = entry["answer"]
-            # print("answer", answer)
-            wrapped_answer = "\n".join(wrap(answer, width=76))
-            # print("wrapped_answer", wrapped_answer)
-            available_width = pdf.w - pdf.l_margin - pdf.r_margin
-            # print(f"Largeur disponible : {available_width}")
-            # print("largeur calculée: ", pdf.get_string_width(wrapped_answer))
-            pdf.set_x(pdf.l_margin + 2)
-            try:
-                pdf.multi_cell(cell_width, 10, text=wrapped_answer, align="L" )
-            except FPDFException as e:
-                pdf.set_font('DejaVu', size=10)  # Fallback to smaller font for long responses
-                pdf.multi_cell(0, 10, txt=f"Response: {wrapped_answer}")
-            pdf.ln(5)
 
+# écrit le rapport sur disque
+def save_report(pdf, cfg, csv_file_name):
+    csv_basename = os.path.basename(csv_file_name)
     # Créer le répertoire Results s'il n'existe pas
     results = cfg['pdf_export_path']
     if not os.path.exists(results):
@@ -221,11 +310,27 @@ def create_k_report_pdf(cfg, csv_file_name, q_a, df):
     # debug
     # print(pdf_file)
 
-    pdf_path = os.path.join(results, pdf_file_name)
-    pdf.output(pdf_path)
+    # nom réservé : deux rapports du même dataset dans la même seconde (autre session, autre réplica)
+    # ne s'écrasent pas
+    pdf_path = reserve_path(os.path.join(results, pdf_file_name))
+    tmp_path = f"{pdf_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with span(cfg, "pdf_export", pages=pdf.page_no()):
+        pdf.output(tmp_path)
+    # le fichier réservé est vide jusqu'au renommage : jamais de pdf partiel
+    os.replace(tmp_path, pdf_path)
     return pdf_path
 
 
+# génère un pdf
+def create_k_report_pdf(cfg, csv_file_name, q_a, df):
+    with span(cfg, "pdf_report", entries=len(q_a)):
+        nb_ln, nb_col = df.shape
+        pdf = start_report(cfg, csv_file_name, nb_ln, nb_col, list(df.columns))
+        for entry in q_a:
+            add_report_entry(pdf, cfg, entry)
+        return save_report(pdf, cfg, csv_file_name)
+
+
 if __name__ == "__main__":
     # pour les test lancer pdfutils dans le REP RACINE
     os.chdir('../')
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from contextlib import closing
+
+from pandasai.pipelines.chat.code_execution import CodeExecution
+from pandasai.pipelines.chat.result_parsing import ResultParsing
+from pandasai.pipelines.pipeline_context import PipelineContext
+
+from utils.response_cache import ERROR_PREFIX, normalize_prompt
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    key TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    code TEXT NOT NULL,
+    runs INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+PLAN_FIELDS = ("key", "signature", "prompt", "code", "runs", "successes", "failures", "consecutive_failures",
+               "last_error", "created", "last_used")
+
+# le nom du graphique (identifiant de la requête) est remplacé à chaque exécution
+CHART_PLACEHOLDER = "__plan_chart_id__"
+
+# un verrou par agent, libéré avec lui
+_agent_locks = weakref.WeakKeyDictionary()
+_agent_locks_guard = threading.Lock()
+
+
+def _connect(cfg):
+    store_dir = os.path.dirname(cfg['plan_cache_path'])
+    if store_dir and not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(cfg['plan_cache_path'], timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# SmartDataframe (un dataset) ou Agent (espace de travail)
+def _get_agent(sdf):
+    return getattr(sdf, "_agent", sdf)
+
+
+# verrou d'un agent : sa question et la lecture de son état (code exécuté, étapes du pipeline)
+# se suivent sans qu'une autre question posée au même agent ne s'intercale
+def get_agent_lock(sdf):
+    agent = _get_agent(sdf)
+    with _agent_locks_guard:
+        return _agent_locks.setdefault(agent, threading.Lock())
+
+
+def _dtype_kind(dtype):
+    if dtype.name == "bool":
+        return "bool"
+    if dtype.kind in "iuf":
+        return "number"
+    if dtype.kind == "M":
+        return "datetime"
+    return "text"
+
+
+# schéma des datasets : noms des colonnes et famille de type, dans l'ordre de dfs
+# (int8 ou int32, catégorie ou texte selon la réduction mémoire ne changent pas le code pandas) ;
+# en mode SQL, le nom des vues fait partie du code généré
+def get_schema_signature(sdf):
+    schema = []
+    for connector in _get_agent(sdf).context.dfs:
+        head = connector.get_head()
+        columns = [[str(column), _dtype_kind(dtype)] for column, dtype in head.dtypes.items()]
+        if connector.type == "duckdb":
+            schema.append(["duckdb", connector.name, columns])
+        else:
+            schema.append(["pandas", columns])
+    return hashlib.sha256(json.dumps(schema).encode("utf-8")).hexdigest()
+
+
+def _plan_key(signature, prompt):
+    return hashlib.sha256(f"{signature}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+# {key, signature, prompt, code, runs, successes, failures, ...} ; None si absent ou écarté
+# après plan_cache_max_failures échecs consécutifs
+def get_plan(cfg, signature, prompt):
+    with closing(_connect(cfg)) as conn:
+        row = conn.execute(f"SELECT {', '.join(PLAN_FIELDS)} FROM plans WHERE key = ?",
+                           (_plan_key(signature, prompt),)).fetchone()
+    if row is None:
+        return None
+    plan = dict(zip(PLAN_FIELDS, row))
+    if plan['consecutive_failures'] >= cfg['plan_cache_max_failures']:
+        return None
+    return plan
+
+
+def _record_run(cfg, key, error=None):
+    with closing(_connect(cfg)) as conn, conn:
+        if error is None:
+            conn.execute("UPDATE plans SET runs = runs + 1, successes = successes + 1, consecutive_failures = 0, "
+                         "last_used = ? WHERE key = ?", (time.time(), key))
+        else:
+            conn.execute("UPDATE plans SET runs = runs + 1, failures = failures + 1, "
+                         "consecutive_failures = consecutive_failures + 1, last_error = ?, last_used = ? "
+                         "WHERE key = ?", (error, time.time(), key))
+
+
+# exécute le code d'un plan sur les datasets de sdf, sans LLM : pas de correction d'erreur par le LLM,
+# ni de cache pandasai, ni de mémoire de conversation
+def _run_code(sdf, code):
+    agent = _get_agent(sdf)
+    config = agent.context.config.copy(update={"use_error_correction_framework": False,
+                                               "enable_cache": False})
+    context = PipelineContext(agent.context.dfs, config, skills_manager=agent.context.skills_manager,
+                              initial_values={"last_prompt_id": uuid.uuid4(), "output_type": None})
+    code = code.replace(CHART_PLACEHOLDER, uuid.uuid4().hex)
+    result = CodeExecution().execute(code, context=context, logger=agent.logger).output
+    return ResultParsing().execute(result, context=context, logger=agent.logger).output
+
+
+# réponse calculée par le code déjà validé pour ce schéma et cette question, None s'il n'y en a pas
+# ou s'il échoue (la question repart alors vers le LLM)
+def execute_plan(cfg, sdf, prompt):
+    plan = get_plan(cfg, get_schema_signature(sdf), prompt)
+    if plan is None:
+        return None
+    try:
+        response = _run_code(sdf, plan['code'])
+    except Exception as e:
+        _record_run(cfg, plan['key'], f"{type(e).__name__}: {e}")
+        return None
+    if response is None or (isinstance(response, str) and response.startswith(ERROR_PREFIX)):
+        _record_run(cfg, plan['key'], "No result")
+        return None
+    _record_run(cfg, plan['key'])
+    return response
+
+
+# code que pandasai vient d'exécuter avec succès, nom du graphique remplacé ; à lire sous get_agent_lock
+def get_executed_code(sdf):
+    agent = _get_agent(sdf)
+    code = agent.last_code_executed
+    if code and agent.last_prompt_id is not None:
+        code = code.replace(str(agent.last_prompt_id), CHART_PLACEHOLDER)
+    return code
+
+
+# conserve le code relevé par get_executed_code pour cette question
+def store_plan(cfg, sdf, prompt, code):
+    if not code:
+        return
+    signature = get_schema_signature(sdf)
+    key = _plan_key(signature, prompt)
+    now = time.time()
+    with closing(_connect(cfg)) as conn, conn:
+        # un nouveau code remplace celui qui a échoué, les statistiques de l'entrée sont conservées
+        conn.execute("INSERT INTO plans (key, signature, prompt, code, created, last_used) VALUES (?, ?, ?, ?, ?, ?) "
+                     "ON CONFLICT (key) DO UPDATE SET code = excluded.code, consecutive_failures = 0, "
+                     "last_used = excluded.last_used",
+                     (key, signature, normalize_prompt(prompt), code, now, now))
+
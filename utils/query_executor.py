@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit
+
+# erreurs passagères (réseau, verrou de fichier, base SQLite occupée) : les autres, dont les réponses en erreur
+# du LLM et la saturation de la passerelle qui a déjà épuisé ses propres tentatives, ne sont pas rejouées
+TRANSIENT_ERRORS = (OSError, sqlite3.OperationalError)
+
+
+class QueryJob:
+    def __init__(self, prompt):
+        self.job_id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.submitted = time.time()
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+
+# pool de threads borné partagé par toutes les sessions, avec une file par session
+class QueryExecutor:
+    def __init__(self, max_workers, timeout, max_retries, retry_backoff, max_pending):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self._lock = threading.Lock()
+        self._queues = {}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_pending = max_pending
+
+    # retourne l'identifiant du job, ou None si la file de la session est pleine
+    def submit(self, session_id, prompt, fn, *args):
+        job = QueryJob(prompt)
+        with self._lock:
+            queue = self._queues.setdefault(session_id, [])
+            if len(queue) >= self.max_pending:
+                return None
+            job.future = self._pool.submit(self._run, job, fn, *args)
+            queue.append(job)
+        return job.job_id
+
+    def _expired(self, job):
+        return job.cancel_event.is_set() or time.time() - job.submitted > self.timeout
+
+    def _run(self, job, fn, *args):
+        for attempt in range(self.max_retries + 1):
+            if self._expired(job):
+                return None
+            try:
+                result = fn(*args)
+                job.finished = time.time()
+                return result
+            except TRANSIENT_ERRORS:
+                if attempt == self.max_retries or self._expired(job):
+                    raise
+            # backoff exponentiel, interrompu immédiatement en cas d'annulation ou de dépassement du délai
+            remaining = self.timeout - (time.time() - job.submitted)
+            job.cancel_event.wait(max(min(self.retry_backoff * 2 ** attempt, remaining), 0))
+
+    def pending(self, session_id):
+        with self._lock:
+            return len(self._queues.get(session_id, []))
+
+    # retire de la file les jobs terminés : liste de (job, statut, résultat ou erreur)
+    def poll(self, session_id):
+        finished = []
+        with self._lock:
+            queue = self._queues.get(session_id, [])
+            for job in list(queue):
+                if job.cancel_event.is_set():
+                    finished.append((job, "cancelled", None))
+                elif job.future.done():
+                    error = job.future.exception()
+                    if error is not None:
+                        finished.append((job, "error", error))
+                    elif job.finished is None:
+                        # abandonné par _run une fois le délai dépassé
+                        finished.append((job, "timeout", None))
+                    else:
+                        finished.append((job, "done", job.future.result()))
+                elif time.time() - job.submitted > self.timeout:
+                    # un thread ne peut pas être interrompu : son résultat sera ignoré
+                    job.cancel_event.set()
+                    job.future.cancel()
+                    finished.append((job, "timeout", None))
+                else:
+                    continue
+                queue.remove(job)
+        return finished
+
+    def cancel(self, session_id):
+        with self._lock:
+            for job in self._queues.get(session_id, []):
+                job.cancel_event.set()
+                job.future.cancel()
+
+
+@streamlit.cache_resource
+def get_query_executor(conf):
+    return QueryExecutor(
+        max_workers=conf['query_workers'],
+        timeout=conf['query_timeout_s'],
+        max_retries=conf['query_max_retries'],
+        retry_backoff=conf['query_retry_backoff_s'],
+        max_pending=conf['query_max_pending']
+    )
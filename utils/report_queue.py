@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+
+import streamlit
+
+from utils.session_store import archive_session, get_session_hash, mark_session_archived
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    job_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    pdf_path TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS report_jobs_hash ON report_jobs (content_hash, status);
+"""
+
+JOB_FIELDS = ("job_id", "session_id", "content_hash", "status", "done", "total", "pdf_path", "error", "created",
+              "updated")
+
+
+# les jobs sont suivis dans la base des sessions : lisibles par tous les processus (serveur et workers)
+def _connect(cfg):
+    store_dir = os.path.dirname(cfg['session_store_path'])
+    if store_dir and not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(cfg['session_store_path'], timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _update_job(cfg, job_id, **fields):
+    fields['updated'] = time.time()
+    with closing(_connect(cfg)) as conn, conn:
+        conn.execute(f"UPDATE report_jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE job_id = ?",
+                     (*fields.values(), job_id))
+
+
+# exécuté dans un processus du pool : mise en page et écriture du pdf, avec l'avancement enregistré
+def run_report_job(cfg, job_id, session_id):
+    _update_job(cfg, job_id, status="running")
+    last_update = [0.0]
+
+    def progress(done, total):
+        # au plus une écriture par seconde, et la dernière entrée
+        if done == total or time.time() - last_update[0] >= 1:
+            last_update[0] = time.time()
+            _update_job(cfg, job_id, done=done, total=total)
+
+    try:
+        pdf_path = archive_session(cfg, session_id, progress)
+    except Exception as e:
+        _update_job(cfg, job_id, status="error", error=str(e))
+        raise
+    _update_job(cfg, job_id, status="done", pdf_path=pdf_path)
+    return pdf_path
+
+
+# file des rapports pdf : la mise en page (CPU) tourne dans un pool de processus, hors du thread du script
+class ReportQueue:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        # spawn : le serveur streamlit est multi-thread, un fork pourrait hériter de verrous pris
+        self._pool = ProcessPoolExecutor(max_workers=cfg['report_workers'],
+                                         mp_context=multiprocessing.get_context("spawn"))
+        self._lock = threading.Lock()
+        # jobs lancés par ce processus : un job "queued" ou "running" d'un serveur arrêté n'est pas réutilisé
+        self._futures = {}
+
+    # retourne l'identifiant du job ; une session identique déjà archivée ou en cours n'est pas regénérée
+    def submit(self, session_id):
+        content_hash = get_session_hash(self.cfg, session_id)
+        with self._lock:
+            with closing(_connect(self.cfg)) as conn:
+                rows = conn.execute("SELECT job_id, status, pdf_path FROM report_jobs WHERE content_hash = ? "
+                                    "AND status != 'error' ORDER BY created DESC", (content_hash,)).fetchall()
+            for job_id, status, pdf_path in rows:
+                if status == "done" and os.path.exists(pdf_path):
+                    mark_session_archived(self.cfg, session_id, pdf_path)
+                    return job_id
+                if status != "done" and job_id in self._futures and not self._futures[job_id].done():
+                    return job_id
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            with closing(_connect(self.cfg)) as conn, conn:
+                conn.execute("INSERT INTO report_jobs (job_id, session_id, content_hash, status, created, updated) "
+                             "VALUES (?, ?, ?, 'queued', ?, ?)", (job_id, session_id, content_hash, now, now))
+            future = self._pool.submit(run_report_job, self.cfg, job_id, session_id)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _on_done(self, job_id, future):
+        # processus du pool interrompu (mémoire, signal) : l'erreur n'a pas pu être enregistrée par le worker
+        error = future.exception()
+        if error is not None and get_job(self.cfg, job_id)['status'] != "error":
+            _update_job(self.cfg, job_id, status="error", error=repr(error))
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+
+# {job_id, session_id, status (queued, running, done, error), done, total, pdf_path, error, ...}
+def get_job(cfg, job_id):
+    with closing(_connect(cfg)) as conn:
+        row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM report_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return dict(zip(JOB_FIELDS, row)) if row is not None else None
+
+
+@streamlit.cache_resource
+def get_report_queue(conf):
+    return ReportQueue(conf)
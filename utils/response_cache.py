@@ -0,0 +1,245 @@
+import hashlib
+import io
+import json
+import numbers
+import os
+import re
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.chart_artifacts import store_chart_bytes
+from utils.shared_cache import fits_shared_cache, get_shared_cache
+
+# préfixe des messages d'erreur renvoyés par pandasai à la place d'une réponse
+ERROR_PREFIX = "Unfortunately, I was not able to"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    context TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_context ON responses (context);
+"""
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# contexte d'une réponse : dataset, fichier de description et paramètres du LLM
+def get_context_key(cfg, dataset_key, desc_file):
+    desc_hash = _sha256_file(desc_file) if desc_file else None
+    context = [dataset_key, desc_hash, cfg['aws_model'], cfg['llm_temperature']]
+    return hashlib.sha256(json.dumps(context).encode("utf-8")).hexdigest()
+
+
+# minuscules, espaces réduits, ponctuation finale ignorée
+def normalize_prompt(prompt):
+    prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+    return prompt.rstrip(" ?!.")
+
+
+def _trigrams(text):
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _similarity(a, b):
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+def _entry_key(context_key, prompt):
+    return hashlib.sha256(f"{context_key}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def _connect(cfg):
+    cache_dir = cfg['response_cache_path']
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(cache_dir, "responses.db"), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _charts_dir(cfg):
+    charts_dir = os.path.join(cfg['response_cache_path'], "charts")
+    if not os.path.exists(charts_dir):
+        os.makedirs(charts_dir, exist_ok=True)
+    return charts_dir
+
+
+# sérialise une réponse : texte, nombre, DataFrame (Arrow IPC) ou graphique (copie du png)
+def _encode(cfg, key, response):
+    if isinstance(response, pd.Series):
+        response = response.to_frame()
+    if isinstance(response, pd.DataFrame):
+        sink = io.BytesIO()
+        try:
+            feather.write_feather(response, sink)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            return None, None
+        return "dataframe", sink.getvalue()
+    if isinstance(response, str) and response.endswith(".png"):
+        if not os.path.exists(response):
+            return None, None
+        chart_path = os.path.join(_charts_dir(cfg), f"{key}.png")
+        tmp_path = f"{chart_path}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.copyfile(response, tmp_path)
+        # renommage atomique : un autre processus ne lit jamais un graphique partiel
+        os.replace(tmp_path, chart_path)
+        return "chart", chart_path.encode("utf-8")
+    if isinstance(response, bool) or not isinstance(response, (str, numbers.Number)):
+        return None, None
+    if isinstance(response, numbers.Number):
+        return "number", json.dumps(response.item() if hasattr(response, "item") else response).encode("utf-8")
+    return "text", response.encode("utf-8")
+
+
+# un graphique est recopié dans chart_export_path : le chemin retourné (historique, rapport pdf)
+# reste valide après l'éviction de l'entrée du cache
+def _decode(cfg, kind, payload):
+    if kind == "dataframe":
+        return feather.read_feather(io.BytesIO(payload))
+    if kind == "number":
+        return json.loads(payload)
+    value = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+    if kind == "chart":
+        try:
+            with open(value, 'rb') as f:
+                return store_chart_bytes(cfg, f.read())
+        except FileNotFoundError:
+            return None
+    return value
+
+
+def _delete_entries(conn, rows):
+    for key, kind, payload in rows:
+        if kind == "chart":
+            chart_path = payload.decode("utf-8")
+            if os.path.exists(chart_path):
+                os.remove(chart_path)
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+# mode multi-réplicas : la réponse est aussi publiée dans le cache partagé, graphique compris (octets du png)
+def _put_shared_response(cfg, key, kind, payload):
+    shared = get_shared_cache(cfg)
+    if shared is None:
+        return
+    if kind == "chart":
+        chart_path = payload.decode("utf-8")
+        if not os.path.exists(chart_path):
+            return
+        with open(chart_path, 'rb') as f:
+            payload = f.read()
+    if fits_shared_cache(cfg, len(payload)):
+        shared.set(f"response:{key}", kind.encode("utf-8") + b"\n" + payload,
+                   ex=int(cfg['response_cache_ttl_hours'] * 3600))
+
+
+# réponse publiée par un autre réplica : recopiée dans le cache local, None si absente
+def _get_shared_response(cfg, conn, key, context_key, prompt):
+    shared = get_shared_cache(cfg)
+    if shared is None:
+        return None
+    value = shared.get(f"response:{key}")
+    if value is None:
+        return None
+    kind, _, payload = value.partition(b"\n")
+    kind = kind.decode("utf-8")
+    if kind == "chart":
+        chart_path = os.path.join(_charts_dir(cfg), f"{key}.png")
+        tmp_path = f"{chart_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, chart_path)
+        payload = chart_path.encode("utf-8")
+    now = time.time()
+    conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (key, context_key, prompt, kind, payload, now, now))
+    return _decode(cfg, kind, payload)
+
+
+# recherche exacte puis, si activée, par similarité des trigrammes de la question,
+# puis dans le cache partagé entre réplicas
+def get_cached_response(cfg, context_key, prompt):
+    prompt = normalize_prompt(prompt)
+    min_created = time.time() - cfg['response_cache_ttl_hours'] * 3600
+    with closing(_connect(cfg)) as conn, conn:
+        row = conn.execute(
+            "SELECT key, kind, payload FROM responses WHERE key = ? AND created >= ?",
+            (_entry_key(context_key, prompt), min_created)
+        ).fetchone()
+
+        threshold = cfg['response_cache_similarity']
+        if row is None and threshold:
+            best_score = 0
+            candidates = conn.execute(
+                "SELECT key, prompt FROM responses WHERE context = ? AND created >= ?",
+                (context_key, min_created)
+            ).fetchall()
+            for key, cached_prompt in candidates:
+                score = _similarity(prompt, cached_prompt)
+                if score >= threshold and score > best_score:
+                    best_score = score
+                    row = conn.execute(
+                        "SELECT key, kind, payload FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+
+        if row is None:
+            return _get_shared_response(cfg, conn, _entry_key(context_key, prompt), context_key, prompt)
+
+        response = _decode(cfg, row[1], row[2])
+        if response is None:
+            # graphique supprimé du disque : l'entrée n'est plus valide
+            _delete_entries(conn, [row])
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), row[0]))
+        return response
+
+
+# enregistre une réponse valide du LLM, puis applique TTL et éviction LRU
+def put_cached_response(cfg, context_key, prompt, response):
+    if response is None or (isinstance(response, str) and response.startswith(ERROR_PREFIX)):
+        return
+    prompt = normalize_prompt(prompt)
+    key = _entry_key(context_key, prompt)
+    kind, payload = _encode(cfg, key, response)
+    if kind is None:
+        return
+
+    now = time.time()
+    with closing(_connect(cfg)) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, context_key, prompt, kind, payload, now, now)
+        )
+        expired = conn.execute(
+            "SELECT key, kind, payload FROM responses WHERE created < ?",
+            (now - cfg['response_cache_ttl_hours'] * 3600,)
+        ).fetchall()
+        _delete_entries(conn, expired)
+        overflow = conn.execute(
+            "SELECT key, kind, payload FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+            (cfg['response_cache_max_entries'],)
+        ).fetchall()
+        _delete_entries(conn, overflow)
+    _put_shared_response(cfg, key, kind, payload)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+RESULT_EXTENSION = ".parquet"
+
+
+# réponse tabulaire conservée sur disque : seule cette référence est gardée en mémoire et en session
+class StoredResult:
+    def __init__(self, result_id, rows, stored_rows, columns):
+        self.result_id = result_id
+        self.rows = rows
+        self.stored_rows = stored_rows
+        self.columns = columns
+
+    @property
+    def truncated(self):
+        return self.stored_rows < self.rows
+
+    def to_json(self):
+        return json.dumps({"result_id": self.result_id, "rows": self.rows, "stored_rows": self.stored_rows,
+                           "columns": self.columns})
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(**json.loads(text))
+
+    def __str__(self):
+        summary = f"DataFrame : {self.rows} rows x {len(self.columns)} columns"
+        if self.truncated:
+            summary += f" (first {self.stored_rows} rows kept)"
+        return summary
+
+
+def get_result_file(cfg, result_id):
+    store_dir = cfg['result_store_path']
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    return os.path.join(store_dir, f"{result_id}{RESULT_EXTENSION}")
+
+
+# empreinte du contenu : une même réponse (question reposée, réponse du cache) n'est écrite qu'une fois
+def _result_id(df):
+    h = hashlib.sha256(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    except TypeError:
+        # valeurs non hachables (listes, dictionnaires) : pas de déduplication
+        return uuid.uuid4().hex
+    return h.hexdigest()
+
+
+def _write_table(table, result_file, row_group_rows):
+    tmp_file = f"{result_file}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        pq.write_table(table, tmp_file, row_group_size=row_group_rows, compression="zstd")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    return tmp_file
+
+
+# conserve une réponse DataFrame (ou Series) en Parquet compressé, découpé en groupes de lignes relus
+# page par page ; au-delà de result_max_rows lignes ou de result_max_mb, seules les premières lignes sont gardées
+# retourne la référence StoredResult, None si la réponse n'est pas convertible en Arrow
+def put_result(cfg, df):
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    total_rows = len(df)
+    df = df.head(cfg['result_max_rows'])
+    result_id = _result_id(df)
+    result_file = get_result_file(cfg, result_id)
+    columns = [str(column) for column in df.columns]
+    if os.path.exists(result_file):
+        stored_rows = pq.ParquetFile(result_file).metadata.num_rows
+        _touch(result_file)
+        return StoredResult(result_id, total_rows, stored_rows, columns)
+
+    max_bytes = cfg['result_max_mb'] * 1024 * 1024
+    try:
+        table = pa.Table.from_pandas(df)
+        while True:
+            tmp_file = _write_table(table, result_file, cfg['result_row_group_rows'])
+            size = os.path.getsize(tmp_file)
+            if size <= max_bytes or table.num_rows <= 1:
+                break
+            os.remove(tmp_file)
+            # trop volumineux : nombre de lignes réduit en proportion, avec une marge pour l'en-tête
+            table = table.slice(0, max(int(table.num_rows * max_bytes / size * 0.9), 1))
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+    # renommage atomique : une autre session ne voit jamais un fichier partiel
+    os.replace(tmp_file, result_file)
+    evict_results(cfg)
+    return StoredResult(result_id, total_rows, table.num_rows, columns)
+
+
+# l'accès met à jour la date de modification, utilisée pour l'éviction
+def _touch(result_file):
+    try:
+        os.utime(result_file)
+    except FileNotFoundError:
+        pass
+
+
+# supprime les résultats non relus depuis result_store_ttl_hours, puis les moins récemment relus jusqu'à
+# respecter result_store_max_mb ; une réponse évincée s'affiche "no longer available" (historique, rapport pdf)
+def evict_results(cfg):
+    store_dir = cfg['result_store_path']
+    min_mtime = time.time() - cfg['result_store_ttl_hours'] * 3600
+    max_size = cfg['result_store_max_mb'] * 1024 * 1024
+    entries = []
+    for file_name in os.listdir(store_dir):
+        if not file_name.endswith(RESULT_EXTENSION):
+            continue
+        result_file = os.path.join(store_dir, file_name)
+        try:
+            stat = os.stat(result_file)
+            if stat.st_mtime < min_mtime:
+                os.remove(result_file)
+                continue
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, result_file))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, result_file in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(result_file)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+# lignes [start, stop) : seuls les groupes de lignes concernés sont lus
+def _read_rows(cfg, result, start, stop):
+    result_file = get_result_file(cfg, result.result_id)
+    try:
+        parquet_file = pq.ParquetFile(result_file)
+    except FileNotFoundError:
+        # évincé du magasin
+        return None
+    _touch(result_file)
+    row_groups, offset, first_row = [], 0, None
+    for index in range(parquet_file.num_row_groups):
+        nb_rows = parquet_file.metadata.row_group(index).num_rows
+        if offset + nb_rows > start and offset < stop:
+            row_groups.append(index)
+            if first_row is None:
+                first_row = offset
+        offset += nb_rows
+    if not row_groups:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    df = parquet_file.read_row_groups(row_groups).slice(start - first_row, stop - start).to_pandas()
+    # index par défaut : numéros des lignes dans la réponse, pas dans la page
+    if isinstance(df.index, pd.RangeIndex):
+        df.index += start
+    return df
+
+
+# page d'un aperçu paginé (pages numérotées à partir de 0) ; None si le résultat n'est plus sur disque
+def read_result_page(cfg, result, page, page_rows):
+    return _read_rows(cfg, result, page * page_rows, (page + 1) * page_rows)
+
+
+# premières lignes seulement, pour le tableau imprimé dans le rapport pdf
+def read_result_head(cfg, result, nb_rows):
+    return _read_rows(cfg, result, 0, nb_rows)
+
+
+# lecture par blocs de lignes : la réponse n'est jamais chargée en entier en mémoire
+def iter_result_batches(cfg, result, batch_rows):
+    parquet_file = pq.ParquetFile(get_result_file(cfg, result.result_id))
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas()
+
+
+# export csv écrit bloc par bloc dans csv_export_path ; retourne le chemin du fichier
+def export_result_csv(cfg, result, name):
+    export_dir = cfg['csv_export_path']
+    if not os.path.exists(export_dir):
+        os.makedirs(export_dir, exist_ok=True)
+    csv_path = os.path.join(export_dir, f"{name}-{result.result_id[:12]}.csv")
+    if os.path.exists(csv_path):
+        return csv_path
+    tmp_file = f"{csv_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8', newline='') as f:
+        for position, batch in enumerate(iter_result_batches(cfg, result, cfg['result_row_group_rows'])):
+            # l'index n'est exporté que s'il porte une information (résultat d'un groupby)
+            batch.to_csv(f, header=position == 0, index=not isinstance(batch.index, pd.RangeIndex))
+    os.replace(tmp_file, csv_path)
+    return csv_path
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    dataset_key TEXT,
+    sources TEXT,
+    rows INTEGER NOT NULL,
+    columns INTEGER NOT NULL,
+    col_list TEXT NOT NULL,
+    started REAL NOT NULL,
+    updated REAL NOT NULL,
+    archived TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    chart_path TEXT,
+    seconds REAL,
+    cache_hit INTEGER,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+SESSION_FIELDS = ("session_id", "dataset", "dataset_key", "sources", "rows", "columns", "col_list", "started",
+                  "updated", "archived")
+
+
+def _connect(cfg):
+    store_dir = os.path.dirname(cfg['session_store_path'])
+    if store_dir and not os.path.exists(store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(cfg['session_store_path'], timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# historique durable d'une session : chaque réponse est écrite dès qu'elle arrive,
+# la session peut être reprise ou archivée après un arrêt du serveur
+# sources : chemins des datasets d'un espace de travail, None pour un fichier téléversé
+def start_session(cfg, session_id, csv_file_name, dataset_key, nb_ln, nb_col, col_list, sources=None):
+    now = time.time()
+    with closing(_connect(cfg)) as conn, conn:
+        # un nouveau dataset dans la même session repart d'un historique vide
+        conn.execute("DELETE FROM entries WHERE session_id = ?", (session_id,))
+        conn.execute("INSERT OR REPLACE INTO sessions "
+                     "(session_id, dataset, dataset_key, sources, rows, columns, col_list, started, updated, archived) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                     (session_id, csv_file_name, dataset_key, json.dumps(sources) if sources else None, int(nb_ln),
+                      int(nb_col), json.dumps([str(col) for col in col_list]), now, now))
+
+
+# pandas, pyarrow et fpdf sont importés à l'usage : la page d'accueil lit les sessions sans les charger
+def _encode_answer(cfg, answer):
+    import pandas as pd
+    from utils.result_store import StoredResult, put_result
+
+    if isinstance(answer, StoredResult):
+        return "result", answer.to_json()
+    if isinstance(answer, (pd.DataFrame, pd.Series)):
+        # la réponse est conservée en Parquet dans le magasin de résultats, l'entrée n'en garde que la référence
+        result = put_result(cfg, answer)
+        if result is not None:
+            return "result", result.to_json()
+        answer = answer.head(cfg['pdf_table_max_rows'])
+        return "dataframe", (answer.to_frame() if isinstance(answer, pd.Series) else answer).to_json(orient="split")
+    if isinstance(answer, str) and answer.endswith(".png"):
+        return "chart", answer
+    return "text", str(answer)
+
+
+# "result" : référence StoredResult, relue page par page ; "dataframe" : aperçu JSON (réponses non convertibles
+# en Arrow et sessions antérieures au magasin de résultats)
+def _decode_answer(kind, answer):
+    if kind == "result":
+        from utils.result_store import StoredResult
+
+        return StoredResult.from_json(answer)
+    if kind == "dataframe":
+        import pandas as pd
+
+        return pd.DataFrame(**json.loads(answer))
+    return answer
+
+
+# ajoute une question/réponse, avec sa durée et l'origine (cache ou LLM) de la réponse
+def append_entry(cfg, session_id, entry, seconds=None, cache_hit=None):
+    kind, answer = _encode_answer(cfg, entry['answer'])
+    now = time.time()
+    with closing(_connect(cfg)) as conn, conn:
+        seq = conn.execute("SELECT coalesce(max(seq), -1) + 1 FROM entries WHERE session_id = ?",
+                           (session_id,)).fetchone()[0]
+        conn.execute("INSERT INTO entries (session_id, seq, question, kind, answer, chart_path, seconds, cache_hit, "
+                     "created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (session_id, seq, entry['question'], kind, answer, answer if kind == "chart" else None, seconds,
+                      None if cache_hit is None else int(cache_hit), now))
+        # une entrée après un "Stop & Archive" rouvre la session
+        conn.execute("UPDATE sessions SET updated = ?, archived = NULL WHERE session_id = ?", (now, session_id))
+    return seq
+
+
+# le rapport a été archivé : la session reste ouverte si elle continue
+def mark_session_archived(cfg, session_id, pdf_path):
+    with closing(_connect(cfg)) as conn, conn:
+        conn.execute("UPDATE sessions SET archived = ?, updated = ? WHERE session_id = ?",
+                     (pdf_path, time.time(), session_id))
+
+
+# en-tête d'une session avec son nombre d'entrées, None si elle n'existe pas
+def get_session(cfg, session_id):
+    with closing(_connect(cfg)) as conn:
+        row = conn.execute(f"SELECT {', '.join(SESSION_FIELDS)} FROM sessions WHERE session_id = ?",
+                           (session_id,)).fetchone()
+        if row is None:
+            return None
+        nb_entries = conn.execute("SELECT count(*) FROM entries WHERE session_id = ?", (session_id,)).fetchone()[0]
+    session = dict(zip(SESSION_FIELDS, row))
+    session['sources'] = json.loads(session['sources']) if session['sources'] else None
+    session['col_list'] = json.loads(session['col_list'])
+    session['entries'] = nb_entries
+    return session
+
+
+# entrées lues par blocs, dans l'ordre : l'historique n'est jamais chargé en entier en mémoire
+def iter_entries(cfg, session_id, start=0, batch_size=100):
+    with closing(_connect(cfg)) as conn:
+        cursor = conn.execute("SELECT seq, question, kind, answer, chart_path, seconds, cache_hit, created "
+                              "FROM entries WHERE session_id = ? AND seq >= ? ORDER BY seq", (session_id, start))
+        while rows := cursor.fetchmany(batch_size):
+            for seq, question, kind, answer, chart_path, seconds, cache_hit, created in rows:
+                yield {"seq": seq, "question": question, "answer": _decode_answer(kind, answer),
+                       "chart_path": chart_path, "seconds": seconds,
+                       "cache_hit": None if cache_hit is None else bool(cache_hit), "created": created}
+
+
+# sessions interrompues (arrêt du serveur, onglet fermé) dont le rapport peut être récupéré : [en-têtes]
+def list_interrupted_sessions(cfg, current_session_id=None):
+    # une session modifiée récemment est sans doute encore active
+    stale_before = time.time() - cfg['session_stale_minutes'] * 60
+    with closing(_connect(cfg)) as conn:
+        rows = conn.execute("SELECT session_id FROM sessions s WHERE archived IS NULL AND updated < ? "
+                            "AND session_id != ? AND EXISTS (SELECT 1 FROM entries e WHERE e.session_id = s.session_id) "
+                            "ORDER BY updated", (stale_before, current_session_id or "")).fetchall()
+    return [get_session(cfg, session_id) for (session_id,) in rows]
+
+
+# empreinte du contenu d'une session (dataset et questions/réponses) : deux sessions identiques
+# produisent le même rapport
+def get_session_hash(cfg, session_id):
+    session = get_session(cfg, session_id)
+    h = hashlib.sha256(json.dumps([session['dataset'], session['dataset_key'], session['rows'], session['columns'],
+                                   session['col_list']]).encode("utf-8"))
+    with closing(_connect(cfg)) as conn:
+        for row in conn.execute("SELECT question, kind, answer FROM entries WHERE session_id = ? ORDER BY seq",
+                                (session_id,)):
+            h.update(json.dumps(row).encode("utf-8"))
+    return h.hexdigest()
+
+
+# génère le pdf d'une session en relisant son historique au fil de l'eau
+# progress(entrées traitées, total) est appelé après chaque entrée
+def archive_session(cfg, session_id, progress=None):
+    from utils.pdf_utils import add_report_entry, save_report, start_report
+
+    session = get_session(cfg, session_id)
+    pdf = start_report(cfg, session['dataset'], session['rows'], session['columns'], session['col_list'])
+    for done, entry in enumerate(iter_entries(cfg, session_id), 1):
+        add_report_entry(pdf, cfg, entry)
+        if progress is not None:
+            progress(done, session['entries'])
+    pdf_path = save_report(pdf, cfg, session['dataset'])
+    mark_session_archived(cfg, session_id, pdf_path)
+    return pdf_path
@@ -0,0 +1,224 @@
+import hashlib
+import os
+import struct
+import time
+import uuid
+from contextlib import contextmanager
+
+import streamlit
+from filelock import FileLock, Timeout
+
+# en-tête des valeurs sur disque : date d'expiration (0 = sans expiration)
+EXPIRY_HEADER = struct.Struct("<d")
+LOCK_POLL_S = 0.05
+
+
+# identifiant du réplica : APP_REPLICA_ID (fixé par serve.py), sinon le numéro de processus
+def get_replica_id():
+    return os.environ.get("APP_REPLICA_ID") or str(os.getpid())
+
+
+# verrou exclusif entre processus (et réplicas sur le même disque) sur <path>.lock, portable (filelock) ;
+# libéré par le système si le processus meurt ; TimeoutError si timeout est dépassé
+@contextmanager
+def file_lock(path, timeout=None):
+    lock = FileLock(f"{path}.lock", timeout=-1 if timeout is None else timeout, poll_interval=LOCK_POLL_S)
+    try:
+        lock.acquire()
+    except Timeout:
+        raise TimeoutError(f"Lock not acquired on {path}")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# verrou sur <path>.lock gardé jusqu'à la fin du processus : un seul réplica tient le rôle ; None si un autre
+# processus le détient déjà (repris par un autre réplica à la mort du détenteur)
+def hold_lock(path):
+    lock = FileLock(f"{path}.lock", thread_local=False)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        return None
+    return lock
+
+
+# réserve un nom de fichier libre (création exclusive) : path, sinon path-2, path-3...
+# deux réplicas qui exportent au même instant n'écrivent jamais dans le même fichier
+def reserve_path(path):
+    stem, extension = os.path.splitext(path)
+    index = 1
+    while True:
+        candidate = path if index == 1 else f"{stem}-{index}{extension}"
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return candidate
+        except FileExistsError:
+            index += 1
+
+
+# verrou du cache disque, avec l'interface acquire/release des verrous redis-py
+class DiskLock:
+    def __init__(self, lock_file, blocking_timeout=None):
+        self._lock = FileLock(lock_file, poll_interval=LOCK_POLL_S)
+        self.blocking_timeout = blocking_timeout
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        timeout = 0 if not blocking else (blocking_timeout if blocking_timeout is not None else self.blocking_timeout)
+        try:
+            self._lock.acquire(timeout=-1 if timeout is None else timeout)
+        except Timeout:
+            return False
+        return True
+
+    def release(self):
+        if self._lock.is_locked:
+            self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# cache partagé sur disque (répertoire commun aux réplicas) : même interface que redis-py
+# (get, set avec ex, delete, exists, lock), Redis peut le remplacer sans changer le code appelant
+# max_size : taille totale en octets au-delà de laquelle les valeurs les moins récemment lues sont supprimées
+class DiskCache:
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+
+    def _file(self, name):
+        digest = hashlib.sha256(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest[:2], digest)
+
+    def get(self, name):
+        try:
+            with open(self._file(name), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        expiry, = EXPIRY_HEADER.unpack_from(content)
+        if expiry and expiry < time.time():
+            self.delete(name)
+            return None
+        # la lecture met à jour la date de modification, utilisée pour l'éviction LRU
+        try:
+            os.utime(self._file(name))
+        except FileNotFoundError:
+            pass
+        return content[EXPIRY_HEADER.size:]
+
+    # ex : durée de vie en secondes
+    def set(self, name, value, ex=None):
+        value_file = self._file(name)
+        os.makedirs(os.path.dirname(value_file), exist_ok=True)
+        tmp_file = f"{value_file}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(EXPIRY_HEADER.pack(time.time() + ex if ex else 0))
+            f.write(value)
+        # renommage atomique : un lecteur voit l'ancienne ou la nouvelle valeur, jamais un fichier partiel
+        os.replace(tmp_file, value_file)
+        self.evict()
+        return True
+
+    # supprime les valeurs expirées, puis les moins récemment lues jusqu'à respecter max_size
+    def evict(self):
+        entries = []
+        now = time.time()
+        for root, _, file_names in os.walk(self.path):
+            for file_name in file_names:
+                # verrous et fichiers temporaires d'une écriture en cours : ignorés
+                if "." in file_name:
+                    continue
+                value_file = os.path.join(root, file_name)
+                try:
+                    with open(value_file, 'rb') as f:
+                        expiry, = EXPIRY_HEADER.unpack(f.read(EXPIRY_HEADER.size))
+                    stat = os.stat(value_file)
+                except (FileNotFoundError, struct.error):
+                    continue
+                if expiry and expiry < now:
+                    self._remove(value_file)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, value_file))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, value_file in sorted(entries):
+            if self.max_size is None or total_size <= self.max_size:
+                break
+            self._remove(value_file)
+            total_size -= size
+
+    @staticmethod
+    def _remove(value_file):
+        try:
+            os.remove(value_file)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, *names):
+        deleted = 0
+        for name in names:
+            try:
+                os.remove(self._file(name))
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def exists(self, *names):
+        return sum(self.get(name) is not None for name in names)
+
+    # timeout (expiration automatique chez Redis) est inutile ici : le verrou disparaît avec le processus
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return DiskLock(f"{self._file(name)}.lock", blocking_timeout)
+
+
+# cache partagé entre les réplicas (serving_mode "multi"), None en mode mono-processus
+# shared_cache_backend : "disk" (répertoire commun, borné à shared_cache_max_mb) ou "redis" (shared_cache_url,
+# paquet redis requis ; la taille est bornée côté serveur par maxmemory et une politique allkeys-lru)
+@streamlit.cache_resource
+def get_shared_cache(conf):
+    if conf['serving_mode'] != "multi":
+        return None
+    if conf['shared_cache_backend'] == "redis":
+        import redis
+
+        return redis.Redis.from_url(conf['shared_cache_url'])
+    return DiskCache(conf['shared_cache_path'], conf['shared_cache_max_mb'] * 1024 * 1024)
+
+
+# une seule exécution à la fois de la même tâche sur l'ensemble des réplicas ;
+# retourne True si une autre exécution vient de se terminer (son résultat est sans doute en cache)
+@contextmanager
+def single_flight(cfg, name, timeout):
+    shared = get_shared_cache(cfg)
+    if shared is None:
+        yield False
+        return
+    lock = shared.lock(f"lock:{name}", timeout=timeout, blocking_timeout=timeout)
+    waited = False
+    if not lock.acquire(blocking=False):
+        waited = True
+        if not lock.acquire(blocking=True, blocking_timeout=timeout):
+            # l'autre exécution dépasse le délai : on continue sans verrou
+            yield True
+            return
+    try:
+        yield waited
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            # verrou Redis déjà expiré : rien à libérer
+            pass
+
+
+# limite de taille des valeurs envoyées au cache partagé
+def fits_shared_cache(cfg, size):
+    return size <= cfg['shared_cache_max_item_mb'] * 1024 * 1024
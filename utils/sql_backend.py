@@ -0,0 +1,230 @@
+import os
+import re
+import threading
+import uuid
+
+import duckdb
+import pyarrow.feather as feather
+import streamlit
+from pandasai.connectors.sql import SQLConnector, SqliteConnectorConfig
+from pandasai.connectors.base import BaseConnector
+from pandasai.exceptions import MaliciousQueryError
+
+from utils.dataset_cache import get_cache_file
+from utils.shared_cache import get_replica_id
+
+NUMERIC_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER",
+                 "UBIGINT", "FLOAT", "DOUBLE"}
+TEMPORAL_TYPES = {"DATE", "TIMESTAMP", "TIMESTAMP WITH TIME ZONE", "TIME"}
+
+
+def _table_name(dataset_key):
+    return f"ds_{dataset_key[:16]}"
+
+
+# un fichier DuckDB n'accepte qu'un processus en écriture : en mode multi-réplicas, chaque réplica a sa base,
+# alimentée depuis la copie Arrow partagée
+def get_store_path(cfg):
+    if cfg['serving_mode'] != "multi":
+        return cfg['sql_store_path']
+    stem, extension = os.path.splitext(cfg['sql_store_path'])
+    return f"{stem}-{get_replica_id()}{extension}"
+
+
+# base DuckDB locale : une table par contenu de dataset, filtres et agrégations exécutés par le moteur
+# (multi-thread, débordement sur disque au-delà de sql_memory_limit)
+class DuckDBStore:
+    def __init__(self, cfg):
+        self.path = get_store_path(cfg)
+        store_dir = os.path.dirname(self.path)
+        if store_dir and not os.path.exists(store_dir):
+            os.makedirs(store_dir, exist_ok=True)
+        self._db = duckdb.connect(self.path, config={"memory_limit": cfg['sql_memory_limit']})
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def cursor(self):
+        return self._db.cursor()
+
+    def _has_table(self, cursor, table):
+        return cursor.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = ?",
+                              [table]).fetchone()[0] > 0
+
+    # importe le dataset une seule fois : CSV lu directement par DuckDB (sans pandas), sinon copie Arrow
+    # du cache, sinon DataFrame fourni par loader
+    def ensure_table(self, cfg, dataset_key, source_path=None, loader=None):
+        table = _table_name(dataset_key)
+        with self._lock:
+            key_lock = self._loading.setdefault(table, threading.Lock())
+        with key_lock:
+            cursor = self.cursor()
+            if self._has_table(cursor, table):
+                return table
+            tmp_table = f"{table}_loading"
+            cache_file = get_cache_file(cfg, dataset_key)
+            if source_path is not None and source_path.lower().endswith(".csv"):
+                cursor.execute(f"CREATE OR REPLACE TABLE {tmp_table} AS SELECT * FROM read_csv_auto(?)",
+                               [source_path])
+            else:
+                source = feather.read_table(cache_file, memory_map=True) if os.path.exists(cache_file) else loader()
+                cursor.register("import_source", source)
+                cursor.execute(f"CREATE OR REPLACE TABLE {tmp_table} AS SELECT * FROM import_source")
+                cursor.unregister("import_source")
+            # la table n'apparaît sous son nom définitif qu'une fois complète
+            cursor.execute(f"ALTER TABLE {tmp_table} RENAME TO {table}")
+        return table
+
+    # lecture en flux d'une table, par blocs de lignes convertis en pandas
+    def iter_batches(self, table, batch_rows):
+        for batch in self.cursor().execute(f"SELECT * FROM {table}").fetch_record_batch(batch_rows):
+            yield batch.to_pandas()
+
+
+# fichier téléversé copié à côté de la base : DuckDB le lit directement, sous son nom d'origine
+def save_upload(cfg, uploaded_file, dataset_key):
+    upload_dir = os.path.join(os.path.dirname(cfg['sql_store_path']), "uploads", dataset_key[:16])
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, os.path.basename(uploaded_file.name))
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(uploaded_file.getvalue())
+        os.replace(tmp_path, path)
+    return path
+
+
+@streamlit.cache_resource
+def get_duckdb_store(conf):
+    return DuckDBStore(conf)
+
+
+# connexion propre à une session ou un espace de travail : les vues portent le nom lisible des datasets
+class DuckDBSession:
+    def __init__(self, store):
+        self.store = store
+        self._cursor = store.cursor()
+        self._lock = threading.Lock()
+        self._views = set()
+
+    def add_view(self, dataset_name, table):
+        base = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(dataset_name))[0]).strip("_").lower() or "dataset"
+        if base[0].isdigit():
+            base = f"t_{base}"
+        view, index = base, 1
+        while view in self._views:
+            index += 1
+            view = f"{base}_{index}"
+        self._views.add(view)
+        self.query(f'CREATE OR REPLACE TEMP VIEW "{view}" AS SELECT * FROM {table}', fetch=False)
+        return view
+
+    def query(self, sql, params=None, fetch=True):
+        with self._lock:
+            result = self._cursor.execute(sql, params)
+            return result.df() if fetch else None
+
+
+# connecteur SQL pandasai adossé à une vue DuckDB : avec direct_sql, le code généré appelle
+# execute_sql_query et seul le résultat revient en pandas
+class DuckDBConnector(SQLConnector):
+    def __init__(self, session, view, **kwargs):
+        self._session = session
+        self._rows = None
+        self._columns = None
+        BaseConnector.__init__(self, SqliteConnectorConfig(dialect="duckdb", table=view,
+                                                           database=session.store.path), **kwargs)
+        self.name = view
+
+    def __del__(self):
+        pass
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} dialect=duckdb table="{self.config.table}">'
+
+    @property
+    def loaded(self):
+        return False
+
+    def head(self, n=5):
+        return self._session.query(f'SELECT * FROM "{self.config.table}" LIMIT {int(n)}')
+
+    def execute(self):
+        # le code généré référence dfs[i] au lieu de SQL : le dataset est matérialisé en pandas
+        return self._session.query(f'SELECT * FROM "{self.config.table}"')
+
+    @property
+    def pandas_df(self):
+        return self.execute()
+
+    @property
+    def rows_count(self):
+        if self._rows is None:
+            self._rows = int(self._session.query(f'SELECT count(*) AS n FROM "{self.config.table}"')["n"][0])
+        return self._rows
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = list(self._session.query(f'DESCRIBE "{self.config.table}"')["column_name"])
+        return self._columns
+
+    @property
+    def columns_count(self):
+        return len(self.columns)
+
+    @property
+    def column_hash(self):
+        return self._get_column_hash()
+
+    def _get_column_hash(self, include_additional_filters=False):
+        import hashlib
+        return hashlib.sha256("".join(self.columns).encode()).hexdigest()
+
+    def equals(self, other):
+        return isinstance(other, DuckDBConnector) and other._session is self._session
+
+    def execute_direct_sql_query(self, sql_query):
+        if not self._is_sql_query_safe(sql_query):
+            raise MaliciousQueryError("Malicious query is generated in code")
+        return self._session.query(sql_query)
+
+    @property
+    def type(self):
+        return "duckdb"
+
+
+def _json_value(value, column_type):
+    if value is None:
+        return None
+    if column_type in NUMERIC_TYPES or column_type.startswith("DECIMAL"):
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return str(value)
+
+
+# profil du dataset (même format que compute_profile) calculé par DuckDB avec SUMMARIZE, sans charger en pandas
+def compute_sql_profile(session, view, fingerprint, cfg):
+    summary = session.query(f'SUMMARIZE "{view}"')
+    rows = int(summary["count"][0]) if len(summary) else 0
+    columns = {}
+    for row in summary.to_dict("records"):
+        column_type = row["column_type"]
+        col_profile = {
+            "dtype": column_type.lower(),
+            "nulls": int(round(float(row["null_percentage"] or 0) * rows / 100)),
+            "distinct": int(row["approx_unique"]),
+            "distinct_estimated": True,
+        }
+        is_numeric = column_type in NUMERIC_TYPES or column_type.startswith("DECIMAL")
+        if row["min"] is not None and (is_numeric or column_type in TEMPORAL_TYPES):
+            col_profile["min"] = _json_value(row["min"], column_type)
+            col_profile["max"] = _json_value(row["max"], column_type)
+        if is_numeric and row["q25"] is not None:
+            col_profile["quantiles"] = [round(float(row[q]), 4) for q in ("q25", "q50", "q75")]
+        elif not is_numeric and column_type not in TEMPORAL_TYPES:
+            column = row["column_name"].replace('"', '""')
+            top = session.query(f'SELECT "{column}" AS value, count(*) AS n FROM "{view}" WHERE "{column}" IS NOT NULL '
+                                f'GROUP BY 1 ORDER BY 2 DESC LIMIT {int(cfg["profile_top_k"])}')
+            col_profile["top"] = [[str(value), int(count)] for value, count in zip(top["value"], top["n"])]
+        columns[row["column_name"]] = col_profile
+    return {"fingerprint": fingerprint, "rows": rows, "columns": columns}
@@ -0,0 +1,33 @@
+from pandasai.llm.base import LLM
+
+# code renvoyé selon le premier mot-clé trouvé dans la question ; colonnes des datasets synthétiques du benchmark
+CANNED_CODE = [
+    ("plot", """import matplotlib.pyplot as plt
+dfs[0].groupby("category", observed=True)["amount"].sum().plot(kind="bar")
+plt.savefig("temp_chart.png")
+result = {"type": "plot", "value": "temp_chart.png"}"""),
+    ("table", """result = {"type": "dataframe", "value": dfs[0].head(5000)}"""),
+    ("group", """result = {"type": "dataframe",
+          "value": dfs[0].groupby("category", observed=True)[["amount", "quantity"]].sum().reset_index()}"""),
+    ("count", """result = {"type": "number", "value": len(dfs[0])}"""),
+]
+DEFAULT_CODE = """result = {"type": "number", "value": dfs[0]["amount"].sum()}"""
+
+
+# LLM local et déterministe : pas d'appel réseau, pour les benchmarks et les tests de charge
+class StubLLM(LLM):
+    def __init__(self, canned_code=None, default_code=DEFAULT_CODE):
+        self.canned_code = canned_code or CANNED_CODE
+        self.default_code = default_code
+
+    def call(self, instruction, context=None) -> str:
+        self.last_prompt = instruction.to_string()
+        question = context.memory.get_last_message().lower() if context and context.memory else ""
+        for keyword, code in self.canned_code:
+            if keyword in question:
+                return f"```python\n{code}\n```"
+        return f"```python\n{self.default_code}\n```"
+
+    @property
+    def type(self) -> str:
+        return "stub"
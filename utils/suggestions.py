@@ -0,0 +1,55 @@
+import re
+
+# questions courantes déduites du profil et des descriptions des champs, sans appel au LLM :
+# préparées hors ligne par warm_up.py puis proposées en un clic dans app.py
+
+# au-delà, une colonne n'est plus une catégorie pour les questions "par ..."
+MAX_CATEGORIES = 12
+# mots des descriptions qui désignent un identifiant ou un texte libre
+IDENTIFIER_WORDS = re.compile(r"\b(identifier|identifiant|id|name|nom)\b", re.IGNORECASE)
+
+
+def _is_identifier(column, p, rows, description):
+    if description and IDENTIFIER_WORDS.search(description):
+        return True
+    # une valeur (presque) différente par ligne
+    return rows > MAX_CATEGORIES and p['distinct'] >= rows * 0.9
+
+
+# (colonnes numériques, colonnes catégorielles, colonnes 0/1) ; les colonnes décrites passent en premier
+def classify_columns(profile, field_descriptions=None):
+    field_descriptions = field_descriptions or {}
+    rows = profile['rows']
+    numeric, categorical, binary = [], [], []
+    columns = sorted(profile['columns'].items(), key=lambda item: item[0] not in field_descriptions)
+    for column, p in columns:
+        if p['distinct'] < 2 or _is_identifier(column, p, rows, field_descriptions.get(column)):
+            continue
+        is_numeric = 'quantiles' in p
+        if is_numeric and p['distinct'] == 2 and p.get('min') == 0 and p.get('max') == 1:
+            binary.append(column)
+        elif p['distinct'] <= MAX_CATEGORIES:
+            categorical.append(column)
+        elif is_numeric:
+            numeric.append(column)
+    return numeric, categorical, binary
+
+
+# questions en anglais (langue des prompts de l'application), les plus générales d'abord,
+# puis une question de chaque modèle à tour de rôle jusqu'à max_questions
+def generate_questions(profile, field_descriptions=None, max_questions=8):
+    numeric, categorical, binary = classify_columns(profile, field_descriptions)
+    templates = [
+        [f"What is the {b} rate for each {c}?" for b in binary for c in categorical[:2]],
+        [f"What is the average {n}?" for n in numeric[:2]],
+        [f"How many rows are there for each {c}?" for c in categorical[:2]],
+        [f"What is the average {n} for each {c}?" for n in numeric[:2] for c in categorical[:1]],
+        [f"Plot a bar chart of the number of rows for each {c}" for c in categorical[:1]],
+        [f"Plot a histogram of {n}" for n in numeric[:1]],
+    ]
+    questions = ["How many rows are in the dataset?"]
+    while len(questions) < max_questions and any(templates):
+        for group in templates:
+            if group and len(questions) < max_questions:
+                questions.append(group.pop(0))
+    return questions[:max_questions]
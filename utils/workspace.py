@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import streamlit
+from pandasai import Agent
+from pandasai.connectors import PandasConnector
+
+from utils.dataset_cache import get_cache_file
+from utils.dataset_loader import describe_dataset, get_sdf_config, load_dataset
+from utils.dataset_profile import profile_to_prompt
+from utils.dataset_registry import get_file_key
+from utils.dataset_sample import arrow_batches, frame_batches, get_prompt_head, get_sample
+from utils.ingestion import get_memory_usage
+from utils.response_cache import _sha256_file
+from utils.sql_backend import DuckDBConnector, DuckDBSession, compute_sql_profile, get_duckdb_store
+
+
+# les tableaux numpy du DataFrame partagé deviennent non modifiables :
+# une modification en place des valeurs par le code généré (df.loc[m, c] = v, fillna(inplace=True)) échoue
+# au lieu d'altérer les données des autres sessions ; les changements de colonnes restent permis sur la vue
+# propre à chaque exécution (session_view)
+def _make_read_only(df):
+    for block in df._mgr.blocks:
+        values = block.values
+        if isinstance(values, pd.Categorical):
+            values = values.codes
+        elif not isinstance(values, np.ndarray):
+            values = getattr(values, "_ndarray", None)
+        if values is not None:
+            values.flags.writeable = False
+
+
+# DataFrames partagés en lecture seule par toutes les sessions du processus, indexés par l'empreinte du contenu
+class SharedFrames:
+    def __init__(self, max_retained_bytes):
+        self.max_retained_bytes = max_retained_bytes
+        self._lock = threading.Lock()
+        self._loading = {}
+        # frames encore référencés par au moins une session
+        self._live = weakref.WeakValueDictionary()
+        # frames conservés après le départ de la dernière session, éviction LRU par taille
+        self._retained = OrderedDict()
+        self._sizes = {}
+
+    def _retain(self, dataset_key, df):
+        self._retained[dataset_key] = df
+        self._retained.move_to_end(dataset_key)
+        while len(self._retained) > 1 and sum(self._sizes[k] for k in self._retained) > self.max_retained_bytes:
+            self._retained.popitem(last=False)
+
+    # un même dataset n'est chargé qu'une fois, même demandé en parallèle par plusieurs sessions
+    def get(self, dataset_key, loader):
+        with self._lock:
+            df = self._live.get(dataset_key)
+            if df is not None:
+                self._retain(dataset_key, df)
+                return df
+            key_lock = self._loading.setdefault(dataset_key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                df = self._live.get(dataset_key)
+            if df is None:
+                df = loader()
+                _make_read_only(df)
+            with self._lock:
+                self._live[dataset_key] = df
+                self._sizes[dataset_key] = get_memory_usage(df)
+                self._retain(dataset_key, df)
+                self._loading.pop(dataset_key, None)
+        return df
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._live.keys())
+            return {"frames": len(keys), "bytes": sum(self._sizes.get(k, 0) for k in keys)}
+
+
+@streamlit.cache_resource
+def get_shared_frames(conf):
+    return SharedFrames(conf['workspace_shared_max_mb'] * 1024 * 1024)
+
+
+# copie superficielle propre à une exécution : les colonnes ajoutées ou supprimées par le code généré
+# ne survivent pas à la requête, les données restent partagées et leurs modifications en place échouent
+def session_view(df):
+    return df.copy(deep=False)
+
+
+# connecteur dont les données ne sont chargées qu'à la première exécution de code qui les référence :
+# le prompt n'utilise que les métadonnées (lignes, colonnes, échantillon, profil)
+class LazyPandasConnector(PandasConnector):
+    def __init__(self, loader, rows, columns, head, **kwargs):
+        self._loader = loader
+        self._rows = rows
+        self._columns = list(columns)
+        self._shared = None
+        # une vue par thread : un worker n'exécute qu'une requête à la fois
+        self._views = threading.local()
+        super().__init__({"original_df": head}, custom_head=head, **kwargs)
+
+    def _load_df(self, df):
+        pass
+
+    def _shared_df(self):
+        if self._shared is None:
+            # la référence au frame partagé le garde en mémoire tant que la session l'utilise
+            self._shared = self._loader()
+        return self._shared
+
+    # appelé avant chaque exécution de code : nouvelle vue, les changements de colonnes de la requête
+    # précédente (affectation, drop, rename inplace) ne sont visibles ni par elle ni par les autres sessions
+    def execute(self):
+        self._views.df = session_view(self._shared_df())
+        return self._views.df
+
+    @property
+    def pandas_df(self):
+        df = getattr(self._views, "df", None)
+        if df is None:
+            df = self.execute()
+        return df
+
+    @property
+    def loaded(self):
+        return self._shared is not None
+
+    def head(self, n=5):
+        return self.custom_head.head(n)
+
+    @property
+    def rows_count(self):
+        return self._rows
+
+    @property
+    def columns_count(self):
+        return len(self._columns)
+
+    @property
+    def column_hash(self):
+        return hashlib.sha256("".join(self._columns).encode()).hexdigest()
+
+    def equals(self, other):
+        return isinstance(other, LazyPandasConnector) and self._loader == other._loader
+
+
+# lignes et colonnes lues dans la copie Arrow du cache (memory-map) sans charger le dataset
+def _read_metadata(cfg, dataset_key):
+    cache_file = get_cache_file(cfg, dataset_key)
+    if not os.path.exists(cache_file):
+        return None
+    table = feather.read_table(cache_file, memory_map=True)
+    return table.num_rows, table.column_names
+
+
+# échantillon calculé en parcourant la copie Arrow par blocs, sinon le DataFrame chargé
+def _get_workspace_sample(cfg, dataset_key, loader):
+    def get_batches():
+        cache_file = get_cache_file(cfg, dataset_key)
+        if os.path.exists(cache_file):
+            return arrow_batches(cache_file, cfg['sample_batch_rows'])
+        return frame_batches(loader(), cfg['sample_batch_rows'])
+    return get_sample(cfg, dataset_key, get_batches)
+
+
+# espace de travail : un Agent pandasai sur plusieurs datasets, chargés à la demande et partagés ;
+# `rep` est le répertoire des fichiers de description et des profils
+# retourne (agent, [{name, dataset_key, rows, columns, desc_file, sample, connector}], clé de contexte du cache)
+def open_workspace(cfg, llm, dataset_paths, rep="./datasources", enable_cache=True):
+    if cfg['query_backend'] == "duckdb":
+        return _open_sql_workspace(cfg, llm, dataset_paths, rep, enable_cache)
+    shared = get_shared_frames(cfg)
+    datasets = []
+    for path in dataset_paths:
+        name = os.path.basename(path)
+        dataset_key = get_file_key(cfg, path)
+
+        def loader(path=path, name=name, dataset_key=dataset_key):
+            return shared.get(dataset_key, lambda: load_dataset(cfg, path, name, dataset_key)[0])
+
+        metadata = _read_metadata(cfg, dataset_key)
+        if metadata is None:
+            # premier chargement : le dataset est lu une fois, mis en cache et partagé
+            data = loader()
+            metadata = len(data), list(data.columns)
+        rows, columns = metadata
+        profile, field_descriptors, desc_file = describe_dataset(cfg, name, dataset_key, loader, rep)
+        sample = _get_workspace_sample(cfg, dataset_key, loader)
+        head = get_prompt_head(sample) if sample is not None else pd.DataFrame(columns=columns)
+        connector = LazyPandasConnector(loader, rows, columns, head, name=os.path.splitext(name)[0],
+                                        description=profile_to_prompt(profile),
+                                        field_descriptions=field_descriptors)
+        datasets.append({"name": name, "dataset_key": dataset_key, "rows": rows, "columns": list(columns),
+                         "desc_file": desc_file, "sample": sample, "connector": connector})
+
+    agent = Agent([d["connector"] for d in datasets], config=get_sdf_config(cfg, llm, enable_cache))
+    return agent, datasets, _get_workspace_key(datasets)
+
+
+# mode SQL : les datasets sont importés dans la base DuckDB et interrogés en SQL par le code généré,
+# seuls les résultats des requêtes sont chargés en pandas
+def _open_sql_workspace(cfg, llm, dataset_paths, rep, enable_cache):
+    store = get_duckdb_store(cfg)
+    session = DuckDBSession(store)
+    datasets = []
+    for path in dataset_paths:
+        name = os.path.basename(path)
+        dataset_key = get_file_key(cfg, path)
+        table = store.ensure_table(cfg, dataset_key, path, lambda: load_dataset(cfg, path, name, dataset_key)[0])
+        view = session.add_view(name, table)
+        connector = DuckDBConnector(session, view)
+        profile, field_descriptors, desc_file = describe_dataset(
+            cfg, name, dataset_key, connector.execute, rep,
+            get_profile=lambda: compute_sql_profile(session, view, dataset_key, cfg))
+        connector.description = profile_to_prompt(profile)
+        connector.field_descriptions = field_descriptors
+        sample = get_sample(cfg, dataset_key, lambda: store.iter_batches(table, cfg['sample_batch_rows']))
+        if sample is not None:
+            connector.custom_head = get_prompt_head(sample)
+        datasets.append({"name": name, "dataset_key": dataset_key, "rows": connector.rows_count,
+                         "columns": connector.columns, "desc_file": desc_file, "sample": sample,
+                         "connector": connector})
+
+    agent = Agent([d["connector"] for d in datasets], config=get_sdf_config(cfg, llm, enable_cache, direct_sql=True))
+    return agent, datasets, _get_workspace_key(datasets)
+
+
+# contexte du cache de réponses : l'ensemble des datasets et de leurs descriptions
+def _get_workspace_key(datasets):
+    context = sorted([d["dataset_key"], _sha256_file(d["desc_file"]) if d["desc_file"] else None] for d in datasets)
+    return hashlib.sha256(json.dumps(context).encode("utf-8")).hexdigest()
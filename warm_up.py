@@ -0,0 +1,101 @@
+"""
+Préparation hors ligne des questions courantes de chaque dataset des datasources
+
+Usage:
+python warm_up.py --datasets titanic.csv penguins.csv --questions 8 --workers 2 --rate 20
+
+Les questions sont déduites du profil et des descriptions des champs (utils/suggestions.py), posées à l'avance
+dans un pool de processus avec une limite de débit partagée, et leurs réponses (graphiques compris) rangées
+dans le cache de réponses. app.py les propose ensuite en un clic : la réponse est immédiate.
+À relancer après l'ajout d'un dataset, ou avant l'expiration du cache (response_cache_ttl_hours).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_report import RateLimitedChat, get_llm
+from utils.dataset_profile import load_profile
+from utils.dataset_registry import list_datasources, store_suggestions
+from utils.handle_query import answer_query
+from utils.response_cache import get_context_key, put_cached_response
+from utils.suggestions import generate_questions
+from utils.workspace import open_workspace
+
+# état propre à chaque processus du pool
+_worker = {}
+
+
+def _init_worker(cfg, llm_name, lock, next_slot, interval):
+    _worker.update(cfg=cfg, llm=get_llm(cfg, llm_name), lock=lock, next_slot=next_slot, interval=interval)
+
+
+# exécuté dans un processus du pool : questions d'un dataset posées une à une, réponses mises en cache
+# pour l'espace de travail du dataset seul et pour son import dans app.py (clés de contexte différentes)
+def warm_dataset(dataset_path, max_questions, rep):
+    cfg = _worker['cfg']
+    agent, datasets, workspace_key = open_workspace(cfg, _worker['llm'], [dataset_path], rep, enable_cache=False)
+    dataset = datasets[0]
+    profile = load_profile(rep, dataset['name'], dataset['dataset_key'])
+    questions = generate_questions(profile, dataset['connector'].field_descriptions, max_questions)
+    upload_key = get_context_key(cfg, dataset['dataset_key'], dataset['desc_file'])
+    chat = RateLimitedChat(agent, _worker['lock'], _worker['next_slot'], _worker['interval'])
+
+    records = []
+    for question in questions:
+        start = time.time()
+        record = {"question": question}
+        try:
+            response, cache_hit = answer_query(cfg, chat, question, workspace_key)
+            put_cached_response(cfg, upload_key, question, response)
+            record.update(status="ready", cache_hit=cache_hit, error=None)
+        except Exception as e:
+            record.update(status="error", cache_hit=False, error=str(e))
+        record["seconds"] = round(time.time() - start, 3)
+        records.append(record)
+    store_suggestions(cfg, dataset['dataset_key'], records)
+    return dataset['name'], records
+
+
+def run_warm_up(cfg, dataset_names, max_questions, workers, rate_per_minute, llm_name, rep="./datasources"):
+    lock = multiprocessing.Lock()
+    next_slot = multiprocessing.Value('d', 0.0)
+    interval = 60 / rate_per_minute if rate_per_minute else 0
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cfg, llm_name, lock, next_slot, interval)) as pool:
+        futures = {pool.submit(warm_dataset, os.path.join(rep, name), max_questions, rep): name
+                   for name in dataset_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                _, records = future.result()
+            except Exception as e:
+                print(f"[{name}] failed : {e}")
+                continue
+            results[name] = records
+            for record in records:
+                print(f"[{name}] {record['status']:5} {record['question']} ({record['seconds']} s)")
+    return results
+
+
+if __name__ == "__main__":
+    with open('general_config.json', 'r') as f_conf:
+        config = json.load(f_conf)
+
+    parser = argparse.ArgumentParser(description="Pre-answer common questions of each datasource for app.py suggestions")
+    parser.add_argument("--datasets", nargs="+", help="dataset file names in ./datasources (default : all)")
+    parser.add_argument("--questions", type=int, default=config['warmup_questions'], help="questions per dataset")
+    parser.add_argument("--workers", type=int, default=config['warmup_workers'], help="number of worker processes")
+    parser.add_argument("--rate", type=float, default=config['warmup_rate_per_minute'],
+                        help="max LLM calls per minute, all workers (0 = unlimited)")
+    parser.add_argument("--llm", choices=["bamboo", "bedrock", "stub"], default=config['llm_backend'])
+    args = parser.parse_args()
+
+    names = args.datasets or list_datasources()
+    results = run_warm_up(config, names, args.questions, args.workers, args.rate, args.llm)
+    ready = sum(record['status'] == "ready" for records in results.values() for record in records)
+    print(f"Suggestions ready : {ready} / {sum(len(records) for records in results.values())}")